@@ -0,0 +1,7 @@
+-- Migration 001: full-text search column for hybrid (lexical + vector) retrieval.
+-- Adding a stored generated column rewrites the table once and fills it for existing rows.
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_content_tsv ON chunks USING gin (content_tsv);
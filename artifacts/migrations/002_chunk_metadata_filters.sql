@@ -0,0 +1,24 @@
+-- Migration 002: indexes backing the metadata prefilters of vector search
+-- (document name/version, section, page range, JSON containment).
+
+-- Tables created by the backend's SQLAlchemy model before this change stored metadata as json;
+-- operators and GIN indexes below need jsonb.
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'chunks' AND column_name = 'metadata') = 'json' THEN
+        ALTER TABLE chunks ALTER COLUMN metadata TYPE jsonb USING metadata::jsonb;
+    END IF;
+END $$;
+
+-- Generic containment filters: metadata @> '{"section": "3.2"}'
+CREATE INDEX IF NOT EXISTS idx_chunks_metadata ON chunks USING gin (metadata jsonb_path_ops);
+
+-- Section filters match a section and its sub-sections ('3.2' or '3.2.%'); text_pattern_ops serves both.
+CREATE INDEX IF NOT EXISTS idx_chunks_metadata_section ON chunks ((metadata->>'section') text_pattern_ops);
+
+-- Page ranges compare the jsonb value directly, so a non-numeric page can't break the index build.
+CREATE INDEX IF NOT EXISTS idx_chunks_metadata_page ON chunks ((metadata->'page'));
+
+-- Document filters resolve to a set of document ids before touching chunks.
+CREATE INDEX IF NOT EXISTS idx_documents_name_version ON documents (name, version);
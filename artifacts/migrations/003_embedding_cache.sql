@@ -0,0 +1,12 @@
+-- Migration 003: persistent embedding cache for ingestion (backend/embedding_store.py).
+-- Keyed by model (name@backend) and the SHA-256 of the normalized chunk text, so
+-- re-ingesting a revised document only embeds paragraphs that actually changed.
+-- The vector column has no fixed dimension so entries of any model fit.
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model TEXT NOT NULL,
+    content_sha256 TEXT NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, content_sha256)
+);
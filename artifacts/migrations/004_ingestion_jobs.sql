@@ -0,0 +1,26 @@
+-- Migration 004: durable ingestion job queue (dan_app/scripts/ingest_jobs.py).
+-- /ingest only inserts a row here. Worker processes claim queued jobs with
+-- SELECT ... FOR UPDATE SKIP LOCKED, report per-stage progress and a heartbeat
+-- while they run, and requeue jobs whose worker stopped heartbeating.
+
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id SERIAL PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    version TEXT,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    document_id INTEGER REFERENCES documents (id) ON DELETE SET NULL,
+    pages_parsed INTEGER NOT NULL DEFAULT 0,
+    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+    rows_written INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Workers look for the oldest queued job, and for running jobs with a stale heartbeat.
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_active ON ingestion_jobs (status, id)
+    WHERE status IN ('queued', 'running');
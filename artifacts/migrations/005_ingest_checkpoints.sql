@@ -0,0 +1,13 @@
+-- Migration 005: per-file checkpoints of the bulk ingestion CLI (ingest_data.py).
+-- A file's row is written in the same transaction as its document and chunks,
+-- so after a crash exactly the files that were fully committed are skipped.
+-- content_sha256 is the hash of the file bytes: a file that changed since its
+-- checkpoint replaces the document it produced last time.
+
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    content_sha256 TEXT NOT NULL,
+    document_id INTEGER REFERENCES documents (id) ON DELETE CASCADE,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    finished_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
@@ -31,15 +31,28 @@ CREATE TABLE IF NOT EXISTS chunks (
     content TEXT NOT NULL,
     embedding vector(384) NOT NULL, -- Using the vector type with a dimension of 384 (for 'all-MiniLM-L6-v2' model)
     metadata JSONB, -- Using JSONB is more efficient for querying in Postgres. e.g., '{"page": 42, "section": "3.1"}'
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED, -- Lexical side of hybrid retrieval
     FOREIGN KEY (document_id) REFERENCES documents (id) ON DELETE CASCADE
 );
 
 -- Index for faster lookup of chunks belonging to a specific document.
 CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks (document_id);
 
--- Create an HNSW index for fast approximate nearest neighbor search.
--- This is crucial for the performance of the RAG retrieval step.
-CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw ON chunks USING hnsw (embedding vector_l2_ops);
+-- Indexes on columns added after the original schema (e.g. the GIN index on content_tsv) live in
+-- artifacts/migrations/, which is applied right after this file, so this script still runs against
+-- databases created by an older version of it.
+
+-- The quantized embedding column of VECTOR_STORAGE=halfvec|binary (embedding_half / embedding_bit,
+-- generated from embedding) is not created here either; see quantized_column_ddl() in backend/config.py.
+
+-- The HNSW index for fast approximate nearest neighbor search (idx_chunks_embedding_hnsw)
+-- is not created here. Its column and opclass have to match the representation and distance
+-- operator the queries use, so it is built from the VECTOR_STORAGE / VECTOR_DISTANCE /
+-- HNSW_M / HNSW_EF_CONSTRUCTION settings in
+-- backend/config.py (see hnsw_index_ddl()) by initialize_database() and by the backend's
+-- SQLAlchemy model. With the default cosine distance that is:
+--   CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw ON chunks
+--       USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
 
 -- -----------------------------------------------------
 -- Table: chat_sessions
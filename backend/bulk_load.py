@@ -0,0 +1,127 @@
+# backend/bulk_load.py
+"""
+Bulk load mode: defer HNSW maintenance until a large load is done.
+
+Every row inserted into chunks while the HNSW index exists is also inserted
+into the graph, one search-and-link at a time, which is much slower than
+building the index once over all rows. For large loads `deferred_ann_index`
+drops the index with DROP INDEX CONCURRENTLY, lets the caller load, and then
+rebuilds it with CREATE INDEX CONCURRENTLY using INDEX_BUILD_PARALLEL_WORKERS
+parallel maintenance workers and INDEX_BUILD_MAINTENANCE_WORK_MEM (the graph
+should fit in it, or the build slows down considerably).
+
+Queries keep working throughout: neither statement blocks reads or writes,
+and while the index is missing similarity search runs as an exact sequential
+scan. Several bulk loads may run at once (ingest_data.py processes, dan_app
+ingestion workers): each holds a shared advisory lock while it loads, and only
+the last one to finish, the one that can take the lock exclusively, rebuilds
+the index. Processes starting meanwhile see the lock in
+migrations.apply_vector_storage and don't recreate the index under the load.
+"""
+import time
+from contextlib import contextmanager
+
+try:
+    from config import (
+        HNSW_INDEX_NAME, INGEST_BULK_LOAD, INGEST_BULK_MIN_BYTES,
+        INDEX_BUILD_MAINTENANCE_WORK_MEM, INDEX_BUILD_PARALLEL_WORKERS, hnsw_index_ddl,
+    )
+except ImportError:
+    from backend.config import (
+        HNSW_INDEX_NAME, INGEST_BULK_LOAD, INGEST_BULK_MIN_BYTES,
+        INDEX_BUILD_MAINTENANCE_WORK_MEM, INDEX_BUILD_PARALLEL_WORKERS, hnsw_index_ddl,
+    )
+
+# pg_advisory_lock key shared by all bulk loads ("chunks" as an int)
+BULK_LOAD_LOCK = 0x63686E6B
+
+
+def use_bulk_load(input_bytes, requested=None):
+    """
+    Whether a load of `input_bytes` of source files should run in bulk mode:
+    `requested` (True/False) if given, else INGEST_BULK_LOAD, where "auto"
+    means at least INGEST_BULK_MIN_BYTES.
+    """
+    if requested is not None:
+        return requested
+    if INGEST_BULK_LOAD == "auto":
+        return input_bytes >= INGEST_BULK_MIN_BYTES
+    return INGEST_BULK_LOAD in ("1", "true", "yes")
+
+
+@contextmanager
+def deferred_ann_index(conn, enabled=True):
+    """
+    Drops the HNSW index for the duration of the block and rebuilds it
+    afterwards (also when the block fails, so the index always comes back).
+
+    Args:
+        conn: A psycopg2 connection used only for the DDL and the advisory
+            lock; anything uncommitted on it is rolled back, and it is
+            switched to autocommit while in use, since the CONCURRENTLY
+            statements can't run in a transaction. The caller closes it.
+        enabled: False makes this a no-op, so callers can always use it.
+    """
+    if not enabled:
+        yield
+        return
+    # A fresh connection already has a transaction open (register_vector runs a SELECT), and
+    # psycopg2 can't switch to autocommit inside one
+    conn.rollback()
+    conn.set_session(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock_shared(%s)", (BULK_LOAD_LOCK,))
+            started = time.perf_counter()
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {HNSW_INDEX_NAME}")
+            print(f"   🏗️  Bulk load: dropped {HNSW_INDEX_NAME} in {time.perf_counter() - started:.1f}s; "
+                  f"searches use exact scans until it is rebuilt")
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            print(f"   🏗️  Bulk load: loading took {time.perf_counter() - started:.1f}s")
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock_shared(%s)", (BULK_LOAD_LOCK,))
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (BULK_LOAD_LOCK,))
+                if cur.fetchone()[0]:
+                    try:
+                        rebuild_ann_index(cur)
+                    finally:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (BULK_LOAD_LOCK,))
+                else:
+                    print(f"   🏗️  Bulk load: another bulk load is still running and will rebuild {HNSW_INDEX_NAME}")
+    finally:
+        # Must not hide the exception that got us here (e.g. the connection was lost)
+        try:
+            conn.rollback()
+            conn.set_session(autocommit=False)
+        except Exception as e:
+            print(f"⚠️  Bulk load: could not reset the index connection: {e}")
+
+
+def rebuild_ann_index(cur):
+    """Builds the HNSW index with CREATE INDEX CONCURRENTLY on an autocommit cursor."""
+    # A concurrent build that failed (or was cancelled) leaves an invalid index behind, which
+    # IF NOT EXISTS would keep
+    cur.execute(
+        """
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+        """,
+        (HNSW_INDEX_NAME,)
+    )
+    row = cur.fetchone()
+    if row and not row[0]:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {HNSW_INDEX_NAME}")
+    cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (INDEX_BUILD_MAINTENANCE_WORK_MEM,))
+    cur.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)", (str(INDEX_BUILD_PARALLEL_WORKERS),))
+    started = time.perf_counter()
+    try:
+        cur.execute(hnsw_index_ddl(concurrently=True))
+    finally:
+        # The connection may go back to a pool
+        cur.execute("RESET maintenance_work_mem; RESET max_parallel_maintenance_workers")
+    print(f"   🏗️  Built {HNSW_INDEX_NAME} in {time.perf_counter() - started:.1f}s "
+          f"({INDEX_BUILD_PARALLEL_WORKERS} parallel workers, maintenance_work_mem={INDEX_BUILD_MAINTENANCE_WORK_MEM})")
@@ -0,0 +1,137 @@
+# backend/bulk_writer.py
+"""
+Bulk writer for the chunks table, shared by both ingestion paths.
+
+Rows are buffered and sent `batch_size` at a time with
+COPY chunks (...) FROM STDIN in PostgreSQL's binary format, which ships each
+embedding as raw float4s (pgvector's binary representation) instead of
+formatting and parsing text. Generated columns (content_tsv and the quantized
+embedding copy, if any) are filled in by Postgres as usual.
+
+If COPY is not available (a cursor without copy_expert, a proxy that doesn't
+pass COPY through, ...) the writer falls back to multi-row INSERTs with
+execute_values for the rest of the job. The first COPY runs inside a
+savepoint so a failure doesn't abort the caller's transaction.
+"""
+import io
+import json
+import struct
+import time
+
+import numpy as np
+from psycopg2.extras import Json, execute_values
+
+_COPY_SQL = "COPY chunks (document_id, content, embedding, metadata) FROM STDIN WITH (FORMAT binary)"
+_INSERT_SQL = "INSERT INTO chunks (document_id, content, embedding, metadata) VALUES %s"
+
+_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_TRAILER = struct.pack(">h", -1)
+
+
+class ChunkWriter:
+    def __init__(self, cursor, batch_size=1000, use_copy=True):
+        """
+        Args:
+            cursor: psycopg2 cursor with pgvector registered; the caller
+                commits.
+            batch_size: Rows per COPY / INSERT statement.
+            use_copy: False goes straight to execute_values.
+        """
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.method = "copy" if use_copy and hasattr(cursor, "copy_expert") else "execute_values"
+        self._copy_verified = False
+        self._rows = []
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, document_id, content, embedding, metadata=None):
+        self._rows.append((document_id, content, embedding, metadata))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(*row)
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        started = time.perf_counter()
+        if self.method == "copy":
+            self._copy(rows)
+        else:
+            self._insert(rows)
+        self.write_seconds += time.perf_counter() - started
+        self.rows_written += len(rows)
+
+    def _copy(self, rows):
+        data = _encode_binary(rows)
+        if self._copy_verified:
+            self.cursor.copy_expert(_COPY_SQL, data)
+            return
+        self.cursor.execute("SAVEPOINT chunk_writer_copy")
+        try:
+            self.cursor.copy_expert(_COPY_SQL, data)
+        except Exception as e:
+            self.cursor.execute("ROLLBACK TO SAVEPOINT chunk_writer_copy")
+            print(f"⚠️  COPY into chunks failed ({e}); falling back to execute_values")
+            self.method = "execute_values"
+            self._insert(rows)
+            return
+        self.cursor.execute("RELEASE SAVEPOINT chunk_writer_copy")
+        self._copy_verified = True
+
+    def _insert(self, rows):
+        execute_values(
+            self.cursor,
+            _INSERT_SQL,
+            [
+                (document_id, content, np.asarray(embedding, dtype=np.float32), Json(metadata) if metadata is not None else None)
+                for document_id, content, embedding, metadata in rows
+            ],
+            page_size=self.batch_size,
+        )
+
+    def summary(self):
+        """Throughput of the job so far: wall time since the writer was created and time spent writing"""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        writing = max(self.write_seconds, 1e-9)
+        return (
+            f"{self.rows_written} chunks in {elapsed:.1f}s ({self.rows_written / elapsed:.0f} rows/s overall, "
+            f"{self.rows_written / writing:.0f} rows/s writing via {self.method})"
+        )
+
+
+def _encode_binary(rows):
+    """Rows in COPY binary format: int4 document_id, text content, vector embedding, jsonb metadata"""
+    out = io.BytesIO()
+    out.write(_HEADER)
+    for document_id, content, embedding, metadata in rows:
+        out.write(struct.pack(">hii", 4, 4, document_id))
+        content = content.encode("utf-8")
+        out.write(struct.pack(">i", len(content)))
+        out.write(content)
+        # pgvector binary format: int16 dimensions, int16 unused, float4 values (all big-endian)
+        vector = np.asarray(embedding, dtype=">f4")
+        out.write(struct.pack(">ihh", 4 + 4 * len(vector), len(vector), 0))
+        out.write(vector.tobytes())
+        if metadata is None:
+            out.write(struct.pack(">i", -1))
+        else:
+            # jsonb binary format: version byte 1 followed by the JSON text
+            document = b"\x01" + json.dumps(metadata).encode("utf-8")
+            out.write(struct.pack(">i", len(document)))
+            out.write(document)
+    out.write(_TRAILER)
+    out.seek(0)
+    return out
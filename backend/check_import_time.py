@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the backend.
+
+Imports `main` in a fresh interpreter (the same thing a uvicorn worker or a
+--reload restart does before it can serve anything), compares the time with
+the budget and lists the slowest top-level imports. Exits with status 1 when
+the budget is exceeded, so it can run in CI.
+
+Usage (from the backend directory):
+    python check_import_time.py [budget_seconds]
+
+The budget defaults to IMPORT_TIME_BUDGET_SECONDS or 2 seconds.
+"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Print the elapsed time last so it can be told apart from the app's own output
+PROBE = "import time; t = time.perf_counter(); import main; print(f'IMPORT_SECONDS={time.perf_counter() - t:.4f}')"
+
+
+def measure():
+    """(seconds to import main, [(cumulative_us, module)] of top-level imports, slowest first)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{result.stderr[-2000:]}")
+
+    seconds = next(
+        float(line.split("=", 1)[1]) for line in result.stdout.splitlines() if line.startswith("IMPORT_SECONDS=")
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("   ") and name.strip():  # direct imports of the probe only
+            modules.append((int(cumulative), name.strip()))
+    modules.sort(reverse=True)
+    return seconds, modules
+
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "2"))
+    seconds, modules = measure()
+    print("Slowest imports:")
+    for cumulative, name in modules[:10]:
+        print(f"   {cumulative / 1e6:7.3f}s  {name}")
+    if seconds > budget:
+        print(f"❌ import main took {seconds:.2f}s, over the {budget:.2f}s budget")
+        sys.exit(1)
+    print(f"✅ import main took {seconds:.2f}s (budget {budget:.2f}s)")
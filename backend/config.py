@@ -0,0 +1,367 @@
+# backend/config.py
+"""
+Runtime settings for the retrieval stack.
+
+Everything is read from the environment (or the .env file loaded by
+utils.load_environment) with a sensible default for local development, the
+same way db.py picks up DATABASE_URL.
+"""
+import os
+import re
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Retrieval engine used by rag.retrieve_relevant_chunks and
+# dan_app.scripts.database.query_vector_db:
+#   "pgvector" - ORDER BY on the chunks table in Postgres (default)
+#   "mmap"     - exact top-k over an in-process, memory-mapped snapshot of the
+#                chunk embeddings; falls back to pgvector if the snapshot
+#                cannot be built or loaded
+RETRIEVAL_ENGINE = os.getenv("RETRIEVAL_ENGINE", "pgvector").lower()
+
+# Where the memory-mapped snapshot lives and how often (in seconds) a worker
+# re-checks the chunks table watermark to decide whether it is stale.
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(BACKEND_DIR, ".vector_index"))
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "30"))
+
+# Distance metric for chunk embeddings. This one setting drives the HNSW index
+# opclass (models.Chunk and dan_app's initialize_database), the ORDER BY
+# operator of every pgvector query and the scoring of the mmap engine.
+#   "cosine" (default) | "l2" | "inner_product"
+DISTANCE_METRICS = {
+    "cosine": {"operator": "<=>", "opclass": "vector_cosine_ops", "halfvec_opclass": "halfvec_cosine_ops"},
+    "l2": {"operator": "<->", "opclass": "vector_l2_ops", "halfvec_opclass": "halfvec_l2_ops"},
+    "inner_product": {"operator": "<#>", "opclass": "vector_ip_ops", "halfvec_opclass": "halfvec_ip_ops"},
+}
+VECTOR_DISTANCE = os.getenv("VECTOR_DISTANCE", "cosine").lower()
+if VECTOR_DISTANCE not in DISTANCE_METRICS:
+    raise ValueError(f"VECTOR_DISTANCE must be one of {sorted(DISTANCE_METRICS)}, got '{VECTOR_DISTANCE}'")
+DISTANCE_OPERATOR = DISTANCE_METRICS[VECTOR_DISTANCE]["operator"]
+DISTANCE_OPCLASS = DISTANCE_METRICS[VECTOR_DISTANCE]["opclass"]
+
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+
+# Which representation the ANN index is built on. The quantized ones are
+# stored next to embedding in a column Postgres generates from it, which only
+# exists while that storage is configured:
+#   "full"    - float32 vector; one index-ordered scan (default)
+#   "halfvec" - float16 copy, half the index memory (pgvector >= 0.7)
+#   "binary"  - 1 bit per dimension (hamming distance), 1/32 of the index memory (pgvector >= 0.7)
+# With halfvec/binary, retrieval takes RESCORE_FACTOR x k candidates from the
+# quantized index and reorders them by exact distance on the full vectors.
+VECTOR_STORAGES = {
+    "full": {"column": "embedding", "index": "idx_chunks_embedding_hnsw"},
+    "halfvec": {
+        "column": "embedding_half", "index": "idx_chunks_embedding_half_hnsw",
+        "type": f"halfvec({EMBEDDING_DIM})", "expression": f"embedding::halfvec({EMBEDDING_DIM})",
+    },
+    "binary": {
+        "column": "embedding_bit", "index": "idx_chunks_embedding_bit_hnsw",
+        "type": f"bit({EMBEDDING_DIM})", "expression": f"binary_quantize(embedding)::bit({EMBEDDING_DIM})",
+    },
+}
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full").lower()
+if VECTOR_STORAGE not in VECTOR_STORAGES:
+    raise ValueError(f"VECTOR_STORAGE must be one of {sorted(VECTOR_STORAGES)}, got '{VECTOR_STORAGE}'")
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+
+# HNSW build parameters (only take effect when the index is (re)built) and the
+# default per-query candidate list size. HNSW_EF_SEARCH unset means "use the
+# server's hnsw.ef_search"; requests can still override it individually.
+HNSW_INDEX_NAME = VECTOR_STORAGES[VECTOR_STORAGE]["index"]
+HNSW_COLUMN = VECTOR_STORAGES[VECTOR_STORAGE]["column"]
+if VECTOR_STORAGE == "halfvec":
+    HNSW_OPCLASS = DISTANCE_METRICS[VECTOR_DISTANCE]["halfvec_opclass"]
+elif VECTOR_STORAGE == "binary":
+    HNSW_OPCLASS = "bit_hamming_ops"
+else:
+    HNSW_OPCLASS = DISTANCE_OPCLASS
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH")) if os.getenv("HNSW_EF_SEARCH") else None
+
+# How long startup schema changes (migrations.py) wait for a table lock before
+# giving up. ALTER TABLE queues behind open transactions on the table, such as
+# a running ingestion, and every query queues behind the waiting ALTER.
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+
+
+def similarity_sql(distance_expr):
+    """SQL turning a distance produced by DISTANCE_OPERATOR into a 'higher is better' similarity."""
+    if VECTOR_DISTANCE == "cosine":
+        return f"1 - ({distance_expr})"
+    # <#> returns the negative inner product; for L2 the negated distance keeps the ordering
+    return f"-({distance_expr})"
+
+
+def coarse_limit(k):
+    """How many rows the ANN index has to produce for k results (ef_search must be at least this)."""
+    return k if VECTOR_STORAGE == "full" else k * RESCORE_FACTOR
+
+
+def ann_candidates_sql(query_vector_sql, where_sql="TRUE", limit_sql=":k"):
+    """
+    Subquery yielding (id, document_id, content, distance) for the nearest
+    chunks to `query_vector_sql`, nearest first, always with full-precision
+    distances. `query_vector_sql` is any SQL expression of type vector (a
+    scalar subquery on a CTE, a LATERAL column, ...).
+
+    With VECTOR_STORAGE=full this is a single index-ordered scan. Otherwise the
+    quantized index produces RESCORE_FACTOR times as many candidates, which are
+    then rescored against the full vectors.
+    """
+    distance = f"c.embedding {DISTANCE_OPERATOR} {query_vector_sql}"
+    if VECTOR_STORAGE == "full":
+        return f"""
+            SELECT c.id, c.document_id, c.content, {distance} as distance
+            FROM chunks c
+            WHERE {where_sql}
+            ORDER BY distance
+            LIMIT {limit_sql}"""
+    if VECTOR_STORAGE == "halfvec":
+        coarse = f"c.embedding_half {DISTANCE_OPERATOR} CAST({query_vector_sql} AS halfvec({EMBEDDING_DIM}))"
+    else:
+        coarse = f"c.embedding_bit <~> CAST(binary_quantize({query_vector_sql}) AS bit({EMBEDDING_DIM}))"
+    return f"""
+            SELECT c.id, c.document_id, c.content, {distance} as distance
+            FROM (
+                SELECT c.id
+                FROM chunks c
+                WHERE {where_sql}
+                ORDER BY {coarse}
+                LIMIT {limit_sql} * {RESCORE_FACTOR}
+            ) candidates
+            JOIN chunks c ON c.id = candidates.id
+            ORDER BY distance
+            LIMIT {limit_sql}"""
+
+
+def hnsw_index_ddl(concurrently=False):
+    """CREATE INDEX statement for the chunks ANN index, built from the settings above."""
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {HNSW_INDEX_NAME} ON chunks "
+        f"USING hnsw ({HNSW_COLUMN} {HNSW_OPCLASS}) "
+        f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+    )
+
+
+def quantized_column_ddl():
+    """ALTER TABLE statement adding the generated column VECTOR_STORAGE needs, or None for full storage."""
+    storage = VECTOR_STORAGES[VECTOR_STORAGE]
+    if "expression" not in storage:
+        return None
+    return (
+        f"ALTER TABLE chunks ADD COLUMN IF NOT EXISTS {storage['column']} {storage['type']} "
+        f"GENERATED ALWAYS AS ({storage['expression']}) STORED"
+    )
+
+
+def check_hnsw_indexdef(indexdef):
+    """
+    Validates the definition of the live HNSW index (pg_indexes.indexdef)
+    against VECTOR_DISTANCE and VECTOR_STORAGE.
+
+    Raises:
+        RuntimeError: if the index was built with a different opclass, in
+            which case Postgres can't use it for our ORDER BY and silently
+            falls back to a sequential scan.
+    """
+    if indexdef is None:
+        print(f"⚠️  Vector index '{HNSW_INDEX_NAME}' not found; similarity search will use a sequential scan.")
+        print(f"   Create it with: {hnsw_index_ddl()};")
+        return
+    if not re.search(rf"\b{HNSW_OPCLASS}\b", indexdef):
+        raise RuntimeError(
+            f"Vector index '{HNSW_INDEX_NAME}' does not match VECTOR_DISTANCE={VECTOR_DISTANCE}, "
+            f"VECTOR_STORAGE={VECTOR_STORAGE} (queries need {HNSW_OPCLASS}). "
+            f"Index definition: {indexdef}. "
+            f"Rebuild it with: DROP INDEX {HNSW_INDEX_NAME}; {hnsw_index_ddl()};"
+        )
+
+# LRU cache for query embeddings (see embedding_cache.py)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+
+# Semantic answer cache (see semantic_cache.py): near-duplicate questions get
+# the stored answer without retrieval or an LLM call.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+# The cache is keyed by the chunks table watermark (a count(*) over chunks);
+# requests reuse the last one read for this many seconds
+SEMANTIC_CACHE_REFRESH_SECONDS = float(os.getenv("SEMANTIC_CACHE_REFRESH_SECONDS", "5"))
+
+# Hybrid retrieval: how many candidates each of the vector and full-text
+# searches contributes, and the k constant of reciprocal rank fusion
+# (score = sum of 1 / (k + rank) over both lists).
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# pgvector >= 0.8 iterative index scans for filtered queries: the HNSW scan
+# keeps going until enough rows pass the WHERE clause instead of returning
+# fewer than k. "relaxed_order" | "strict_order" | "off" (for older pgvector).
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "relaxed_order")
+HNSW_MAX_SCAN_TUPLES = int(os.getenv("HNSW_MAX_SCAN_TUPLES")) if os.getenv("HNSW_MAX_SCAN_TUPLES") else None
+
+# /chat/batch: maximum questions per request and how many LLM generations
+# run at the same time (shared across all batch requests of a worker).
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Cross-encoder reranking (see reranker.py). When enabled, /chat retrieves
+# RERANK_CANDIDATES chunks, reranks at most RERANK_MAX_CANDIDATES of them
+# within RERANK_BUDGET_MS and sends the best RERANK_TOP_N to the LLM.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", "50"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+
+# Context packing (see context_packer.py). Retrieval fetches CONTEXT_CANDIDATES
+# chunks and the packer fills CONTEXT_TOKEN_BUDGET tokens of prompt context
+# with the best of them, skipping chunks below CONTEXT_MIN_SIMILARITY (in the
+# units of similarity_sql; by default only applied to cosine similarity).
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "10"))
+if os.getenv("CONTEXT_MIN_SIMILARITY"):
+    CONTEXT_MIN_SIMILARITY = float(os.getenv("CONTEXT_MIN_SIMILARITY"))
+else:
+    CONTEXT_MIN_SIMILARITY = 0.25 if VECTOR_DISTANCE == "cosine" else None
+
+# Sentence embedding model shared by the backend, ingest_data.py and dan_app
+# (see embeddings.py). EMBEDDING_BACKEND: "torch" | "onnx" | "onnx-int8".
+# EMBEDDING_THREADS caps the intra-op threads of PyTorch / ONNX Runtime per
+# process (unset = all cores). With EMBEDDING_VERIFY on, startup fails if the
+# selected backend's vectors drift below EMBEDDING_TOLERANCE cosine similarity
+# of the torch reference (this loads the reference model once).
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS")) if os.getenv("EMBEDDING_THREADS") else None
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_VERIFY = os.getenv("EMBEDDING_VERIFY", "false").lower() in ("1", "true", "yes")
+EMBEDDING_TOLERANCE = float(os.getenv("EMBEDDING_TOLERANCE", "0.98"))
+
+
+# Ingestion embeds in INGEST_WORKERS processes (see parallel_embedding.py),
+# INGEST_BATCH_SIZE chunks at a time. Default: a quarter of the cores; 1 keeps
+# it in-process.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Chunks the page reader may run ahead of the embedding stage (see ingest_pipeline.py)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+
+# Persistent embedding cache for ingestion (see embedding_store.py): chunks
+# whose normalized text was embedded before by the same model are not encoded
+# again.
+INGEST_EMBEDDING_CACHE = os.getenv("INGEST_EMBEDDING_CACHE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_MODEL_KEY = f"{EMBEDDING_MODEL}@{EMBEDDING_BACKEND}"
+
+# Chunk rows are written with COPY ... FROM STDIN (binary), INGEST_WRITE_BATCH_SIZE
+# rows per COPY (see bulk_writer.py). INGEST_USE_COPY=false uses multi-row
+# INSERTs (execute_values) instead, which is also the automatic fallback.
+INGEST_WRITE_BATCH_SIZE = int(os.getenv("INGEST_WRITE_BATCH_SIZE", "1000"))
+INGEST_USE_COPY = os.getenv("INGEST_USE_COPY", "true").lower() in ("1", "true", "yes")
+
+# dan_app ingestion job queue (see dan_app/scripts/ingest_jobs.py): /ingest
+# only enqueues; INGEST_JOB_WORKERS processes, started separately from the
+# API, claim jobs, polling every INGEST_JOB_POLL_SECONDS when idle. A running
+# job without a heartbeat for INGEST_JOB_STALE_SECONDS (its worker died) is
+# requeued, up to INGEST_JOB_MAX_ATTEMPTS attempts.
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+INGEST_JOB_POLL_SECONDS = float(os.getenv("INGEST_JOB_POLL_SECONDS", "2"))
+INGEST_JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", "600"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+
+# Files ingested at once by the bulk ingestion CLI (ingest_data.py); they share
+# the INGEST_WORKERS embedding processes.
+INGEST_FILE_JOBS = int(os.getenv("INGEST_FILE_JOBS", "2"))
+
+# Bulk load mode (see bulk_load.py): the HNSW index is dropped while a large
+# load runs and rebuilt once afterwards with CREATE INDEX CONCURRENTLY, instead
+# of being updated row by row. INGEST_BULK_LOAD=auto uses it for loads of at
+# least INGEST_BULK_MIN_BYTES of input files; true/false force it on/off.
+INGEST_BULK_LOAD = os.getenv("INGEST_BULK_LOAD", "auto").lower()
+INGEST_BULK_MIN_BYTES = int(os.getenv("INGEST_BULK_MIN_BYTES", str(50 * 1024 * 1024)))
+# Session settings of the index rebuild
+INDEX_BUILD_MAINTENANCE_WORK_MEM = os.getenv("INDEX_BUILD_MAINTENANCE_WORK_MEM", "1GB")
+INDEX_BUILD_PARALLEL_WORKERS = int(os.getenv("INDEX_BUILD_PARALLEL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Near-duplicate chunk elimination at ingest time (see dedup.py): chunks whose
+# word shingles have an estimated Jaccard similarity of at least
+# INGEST_DEDUP_THRESHOLD with an earlier chunk of the same document are
+# dropped and recorded as extra source locations of that chunk (1.0 = exact
+# duplicates only).
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "true").lower() in ("1", "true", "yes")
+INGEST_DEDUP_THRESHOLD = float(os.getenv("INGEST_DEDUP_THRESHOLD", "0.9"))
+
+
+def load_deduplicator():
+    """ChunkDeduplicator with the configured threshold, or None when INGEST_DEDUP is off"""
+    if not INGEST_DEDUP:
+        return None
+    try:
+        from dedup import ChunkDeduplicator
+    except ImportError:
+        from backend.dedup import ChunkDeduplicator
+    return ChunkDeduplicator(threshold=INGEST_DEDUP_THRESHOLD)
+
+# Micro-batching of query embeddings across concurrent /chat requests (see
+# embedding_batcher.py): at most EMBEDDING_BATCH_MAX texts per forward pass,
+# held back at most EMBEDDING_BATCH_WAIT_MS for more requests under load.
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "true").lower() in ("1", "true", "yes")
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+# Threads of the executor the async /chat hands CPU-bound work to (query
+# encoding when micro-batching is off, reranking), so it never runs on the
+# event loop. Waiting on the database or the LLM holds no thread.
+CPU_EXECUTOR_THREADS = int(os.getenv("CPU_EXECUTOR_THREADS", "4"))
+
+
+def load_embedder():
+    """The configured Embedder, verified against the torch reference if EMBEDDING_VERIFY is set"""
+    try:
+        from embeddings import Embedder
+    except ImportError:
+        from backend.embeddings import Embedder
+    embedder = Embedder(
+        EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS, onnx_int8_file=EMBEDDING_ONNX_INT8_FILE
+    )
+    if EMBEDDING_VERIFY:
+        worst = embedder.verify(tolerance=EMBEDDING_TOLERANCE)
+        print(f"   ✅ Embedding backend '{EMBEDDING_BACKEND}' verified: min cosine vs torch {worst:.4f}")
+    return embedder
+
+
+def load_chunk_writer(cursor):
+    """ChunkWriter on `cursor` with the configured batch size and write method"""
+    try:
+        from bulk_writer import ChunkWriter
+    except ImportError:
+        from backend.bulk_writer import ChunkWriter
+    return ChunkWriter(cursor, batch_size=INGEST_WRITE_BATCH_SIZE, use_copy=INGEST_USE_COPY)
+
+
+def load_parallel_embedder(embedder=None):
+    """
+    ParallelEmbedder for ingestion with the configured model, backend and
+    worker count. `embedder` is reused in-process when INGEST_WORKERS is 1.
+    """
+    try:
+        from parallel_embedding import ParallelEmbedder
+    except ImportError:
+        from backend.parallel_embedding import ParallelEmbedder
+    return ParallelEmbedder(
+        EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE,
+        threads=EMBEDDING_THREADS, onnx_int8_file=EMBEDDING_ONNX_INT8_FILE, embedder=embedder,
+    )
+
+# Startup warm-up (main.py): after the lifespan hook has set up the database,
+# a background thread loads the embedding model, runs a first encode, sets up
+# the LLM client, fills the DB connection pool and, with WARMUP_PREWARM_INDEX,
+# loads the HNSW index into shared buffers with pg_prewarm. /ready turns 200
+# when it is done. Without warm-up everything is loaded on first use.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_PREWARM_INDEX = os.getenv("WARMUP_PREWARM_INDEX", "true").lower() in ("1", "true", "yes")
@@ -0,0 +1,202 @@
+# backend/context_packer.py
+"""
+Token-budgeted assembly of the LLM context from retrieved chunks.
+
+Instead of pasting a fixed number of chunks into the prompt, the packer walks
+the retrieved chunks best first and:
+
+- drops chunks below a similarity cutoff (the best one is always kept, so a
+  weak but only match still reaches the LLM),
+- merges a chunk into an already packed one from the same document when the
+  two overlap (sliding-window chunking), or drops it when it is contained in
+  it almost entirely,
+- adds chunks until the token budget is used up, trimming the last one that
+  only partially fits.
+
+Tokens are counted with tiktoken for the target model when it is installed,
+otherwise estimated at four characters per token.
+"""
+import re
+import threading
+from collections import namedtuple
+
+# text: the formatted context for the prompt
+# chunks: the retrieved rows that made it into `text`, best first (what gets cited)
+# tokens_used / tokens_full: context size as packed / as it would be with every chunk in full
+PackedContext = namedtuple("PackedContext", ["text", "chunks", "tokens_used", "tokens_full", "tokens_saved"])
+
+_WORD = re.compile(r"\w+")
+
+
+class ContextPacker:
+    def __init__(self, model_name="gpt-4o", token_budget=1500, min_similarity=None, overlap_threshold=0.8, min_fragment_tokens=48):
+        """
+        Args:
+            model_name: Model the prompt is for; picks the tiktoken encoding.
+            token_budget: Maximum tokens of context, headers included.
+            min_similarity: Chunks scoring below this are dropped; None keeps all.
+            overlap_threshold: Share of a chunk's words already in a packed
+                chunk above which it is dropped as a near-duplicate.
+            min_fragment_tokens: A chunk that doesn't fit is only trimmed into
+                the remaining budget if at least this many tokens are left.
+        """
+        self.token_budget = token_budget
+        self.min_similarity = min_similarity
+        self.overlap_threshold = overlap_threshold
+        self.min_fragment_tokens = min_fragment_tokens
+        self._encoding = _load_encoding(model_name)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        self.chunks_dropped = 0
+        self.chunks_merged = 0
+        self.chunks_trimmed = 0
+
+    @property
+    def tokenizer(self):
+        return "tiktoken" if self._encoding is not None else "estimate"
+
+    def count_tokens(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def pack(self, chunks):
+        """
+        Packs retrieved rows (with `content`, `similarity` and `document_name`
+        attributes, best first) into the token budget.
+        """
+        chunks = list(chunks)
+        tokens_full = sum(self.count_tokens(_entry(i, chunk, chunk.content)) for i, chunk in enumerate(chunks, 1))
+
+        entries = []  # [document_name, text, word set, [chunks]]
+        dropped = merged = trimmed = 0
+        for rank, chunk in enumerate(chunks):
+            if rank and self.min_similarity is not None and (chunk.similarity or 0) < self.min_similarity:
+                dropped += 1
+                continue
+            content = chunk.content.strip()
+            words = set(_WORD.findall(content.lower()))
+            target = None
+            for entry in entries:
+                if entry[0] != chunk.document_name:
+                    continue
+                stitched = _stitch(entry[1], content)
+                if stitched is not None:
+                    target, content = entry, stitched
+                    break
+                if words and len(words & entry[2]) / len(words) >= self.overlap_threshold:
+                    target, content = entry, None
+                    break
+            if target is not None:
+                if content is None:
+                    dropped += 1
+                    continue
+                # Only merge if the combined text still fits; otherwise keep the packed version
+                candidate = entries[:]
+                candidate[entries.index(target)] = [target[0], content, target[2] | words, target[3] + [chunk]]
+                if self._size(candidate) <= self.token_budget:
+                    entries[:] = candidate
+                    merged += 1
+                else:
+                    dropped += 1
+                continue
+
+            entries.append([chunk.document_name, content, words, [chunk]])
+            if self._size(entries) <= self.token_budget:
+                continue
+            # Over budget: trim this chunk into what is left, or leave it out
+            entries.pop()
+            remaining = self.token_budget - self._size(entries + [[chunk.document_name, "", words, [chunk]]])
+            if remaining >= self.min_fragment_tokens:
+                entries.append([chunk.document_name, self._truncate(content, remaining), words, [chunk]])
+                trimmed += 1
+            else:
+                dropped += 1
+            dropped += len(chunks) - rank - 1  # everything ranked below it
+            break
+
+        text = self._render(entries)
+        tokens_used = self.count_tokens(text) if entries else 0
+        packed = PackedContext(
+            text=text,
+            chunks=[chunk for entry in entries for chunk in entry[3]],
+            tokens_used=tokens_used,
+            tokens_full=tokens_full,
+            tokens_saved=max(tokens_full - tokens_used, 0),
+        )
+        with self._lock:
+            self.requests += 1
+            self.tokens_used += packed.tokens_used
+            self.tokens_saved += packed.tokens_saved
+            self.chunks_dropped += dropped
+            self.chunks_merged += merged
+            self.chunks_trimmed += trimmed
+        return packed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokenizer": self.tokenizer,
+                "token_budget": self.token_budget,
+                "min_similarity": self.min_similarity,
+                "requests": self.requests,
+                "tokens_used": self.tokens_used,
+                "tokens_saved": self.tokens_saved,
+                "avg_tokens_saved": round(self.tokens_saved / self.requests, 1) if self.requests else 0.0,
+                "chunks_dropped": self.chunks_dropped,
+                "chunks_merged": self.chunks_merged,
+                "chunks_trimmed": self.chunks_trimmed,
+            }
+
+    def _render(self, entries):
+        return "\n".join(_entry(i, entry[3][0], entry[1]) for i, entry in enumerate(entries, 1))
+
+    def _size(self, entries):
+        return self.count_tokens(self._render(entries))
+
+    def _truncate(self, text, max_tokens):
+        """Cuts `text` to about `max_tokens` tokens, at a sentence or word boundary where possible"""
+        if self._encoding is not None:
+            cut = self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:max(max_tokens - 1, 0)])
+        else:
+            cut = text[:max(max_tokens - 1, 0) * 4]
+        boundary = max(cut.rfind(". "), cut.rfind("\n"))
+        if boundary < len(cut) // 2:
+            boundary = cut.rfind(" ")
+        if boundary > 0:
+            cut = cut[:boundary + 1]
+        return cut.rstrip() + " …"
+
+
+def _entry(i, chunk, content):
+    # Same layout generate_response has always used for each piece of context
+    return f"[Context {i}] (Relevance: {chunk.similarity or 0:.3f})\n{content}\n"
+
+
+def _stitch(first, second, min_overlap=40):
+    """
+    `first` + `second` without the repeated part when `second` continues
+    `first` (or vice versa) with an overlap of at least `min_overlap`
+    characters, as produced by overlapping chunk windows; otherwise None.
+    """
+    for head, tail in ((first, second), (second, first)):
+        probe = tail[:min_overlap]
+        if len(probe) < min_overlap:
+            continue
+        start = head.find(probe, max(len(head) - len(tail), 0))
+        if start > 0 and tail.startswith(head[start:]):
+            return head + tail[len(head) - start:]
+    return None
+
+
+def _load_encoding(model_name):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
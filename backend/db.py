@@ -1,8 +1,11 @@
 # backend/db.py
 import os
-from sqlalchemy import create_engine
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from pgvector.psycopg2 import register_vector
 
 # Get database URL from environment variable or use default for development
 DATABASE_URL = os.getenv(
@@ -11,5 +14,55 @@ DATABASE_URL = os.getenv(
 )
 
 engine = create_engine(DATABASE_URL)
+
+# Let psycopg2 adapt numpy arrays to vector parameters (and parse vector columns
+# back into numpy arrays) on every pooled connection, the same way dan_app does.
+@event.listens_for(engine, "connect")
+def _register_vector(dbapi_connection, connection_record):
+    register_vector(dbapi_connection)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+# The async request path (/chat) reaches the same database through asyncpg.
+# The engine is created on first use, so only code that needs it needs asyncpg.
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    make_url(DATABASE_URL).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+)
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+
+_async_lock = threading.Lock()
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        with _async_lock:
+            if _async_engine is None:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+                from pgvector.asyncpg import register_vector as register_vector_asyncpg
+
+                async_engine = create_async_engine(
+                    ASYNC_DATABASE_URL, pool_size=ASYNC_DB_POOL_SIZE, max_overflow=ASYNC_DB_MAX_OVERFLOW
+                )
+
+                # Same as _register_vector, for asyncpg connections (the codec setup is a coroutine)
+                @event.listens_for(async_engine.sync_engine, "connect")
+                def _register_vector_async(dbapi_connection, connection_record):
+                    dbapi_connection.run_async(register_vector_asyncpg)
+
+                # Objects stay usable after commit without another round trip
+                _async_sessionmaker = async_sessionmaker(async_engine, expire_on_commit=False)
+                _async_engine = async_engine
+    return _async_engine
+
+def AsyncSessionLocal():
+    get_async_engine()
+    return _async_sessionmaker()
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
\ No newline at end of file
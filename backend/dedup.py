@@ -0,0 +1,164 @@
+# backend/dedup.py
+"""
+Near-duplicate chunk elimination for ingestion.
+
+PDF paragraph splits repeat a lot of text: page headers and footers, table of
+contents entries, code samples reprinted in several chapters. Embedding and
+indexing every copy wastes time and lets the copies crowd distinct chunks out
+of the top-k. `ChunkDeduplicator` sits between the chunker and the embedding
+stage and only lets the first copy of each chunk through:
+
+- exact duplicates are found by the SHA-256 of the normalized text;
+- near duplicates by MinHash signatures over word 3-shingles, bucketed with
+  LSH so every chunk is only compared with a few candidates, and accepted when
+  the estimated Jaccard similarity reaches the threshold.
+
+Every chunk that was dropped is remembered as another source location of the
+chunk it duplicates; `write_sources` stores them in that chunk's metadata
+(`sources`: a list of {"page", "offset"}), so citations can still point at
+every place the text appears. Deduplication is per document.
+
+Only the digest, location and MinHash signature of each chunk let through are
+kept, never its text, so memory stays small next to the streaming pipeline.
+"""
+import hashlib
+
+import numpy as np
+from psycopg2.extras import Json, execute_values
+
+try:
+    from embedding_store import content_hash, normalize_text
+except ImportError:
+    from backend.embedding_store import content_hash, normalize_text
+
+_PRIME = (1 << 31) - 1
+
+
+class ChunkDeduplicator:
+    def __init__(self, threshold=0.9, num_perm=64, band_rows=4, shingle_words=3):
+        """
+        Args:
+            threshold: Estimated Jaccard similarity (of word shingles) from
+                which a chunk counts as a duplicate; 1.0 only drops exact
+                duplicates.
+            num_perm: MinHash signature length; more is more precise and slower.
+            band_rows: Signature rows per LSH band. Chunks are compared when
+                any band matches; 4 rows in 16 bands finds nearly all pairs
+                above 0.8 similarity.
+            shingle_words: Words per shingle.
+        """
+        self.threshold = threshold
+        self.band_rows = band_rows
+        self.shingle_words = shingle_words
+        rng = np.random.default_rng(0x5EED)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.int64)
+        self._exact = {}  # digest -> location of the canonical chunk
+        self._buckets = {}
+        self._signatures = []  # (signature, location) of every chunk let through
+        self.sources = {}  # location of a canonical chunk -> locations of the chunks dropped as its duplicates
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def filter(self, chunks):
+        """Yields the chunks that are not duplicates of an earlier chunk, in order"""
+        for chunk in chunks:
+            self.seen += 1
+            digest = content_hash(chunk.content)
+            location = _location(chunk)
+            canonical = self._exact.get(digest)
+            if canonical is not None:
+                self.exact_duplicates += 1
+                self.sources.setdefault(canonical, []).append(location)
+                continue
+            if self.threshold < 1.0:
+                signature = self._signature(chunk.content)
+                canonical = self._near_duplicate_of(signature)
+                if canonical is not None:
+                    self.near_duplicates += 1
+                    self._exact[digest] = canonical
+                    self.sources.setdefault(canonical, []).append(location)
+                    continue
+                self._add(signature, location)
+            self._exact[digest] = location
+            yield chunk
+
+    def _signature(self, text):
+        words = normalize_text(text).lower().split()
+        n = self.shingle_words
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.int64, count=len(shingles),
+        )
+        # Values are below 2**31, so they fit in half the bytes
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _bands(self, signature):
+        rows = self.band_rows
+        return [(i, signature[i:i + rows].tobytes()) for i in range(0, len(signature), rows)]
+
+    def _near_duplicate_of(self, signature):
+        candidates = {index for band in self._bands(signature) for index in self._buckets.get(band, ())}
+        best, best_similarity = None, self.threshold
+        for index in candidates:
+            other, canonical = self._signatures[index]
+            similarity = float(np.mean(signature == other))
+            if similarity >= best_similarity:
+                best, best_similarity = canonical, similarity
+        return best
+
+    def _add(self, signature, location):
+        index = len(self._signatures)
+        self._signatures.append((signature, location))
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, []).append(index)
+
+    def dedup_ratio(self):
+        return (self.exact_duplicates + self.near_duplicates) / self.seen if self.seen else 0.0
+
+    def summary(self):
+        dropped = self.exact_duplicates + self.near_duplicates
+        return (
+            f"dedup: {dropped} of {self.seen} chunks were duplicates ({self.dedup_ratio():.1%}; "
+            f"{self.exact_duplicates} exact, {self.near_duplicates} near, threshold {self.threshold})"
+        )
+
+
+def write_sources(cursor, document_id, dedup):
+    """
+    Stores every source location of the chunks that had duplicates in their
+    metadata (`sources`), matching the rows by their page and offset within
+    the document. Run after the chunks were written (and re-labelled, on a
+    re-ingestion), in the same transaction.
+
+    The document's previous `sources` are removed first: a chunk a
+    re-ingestion kept may have lost its duplicates in the new version.
+    """
+    cursor.execute(
+        "UPDATE chunks SET metadata = metadata - 'sources' WHERE document_id = %s AND metadata ? 'sources'",
+        (document_id,)
+    )
+    rows = [
+        (page, offset, Json([{"page": page, "offset": offset}] + [
+            {"page": source_page, "offset": source_offset} for source_page, source_offset in duplicates
+        ]))
+        for (page, offset), duplicates in dedup.sources.items()
+    ]
+    if not rows:
+        return
+    execute_values(
+        cursor,
+        f"""
+        UPDATE chunks SET metadata = coalesce(chunks.metadata, '{{}}'::jsonb) || jsonb_build_object('sources', v.sources::jsonb)
+        FROM (VALUES %s) AS v (page, char_offset, sources)
+        WHERE chunks.document_id = {int(document_id)}
+          AND chunks.metadata @> jsonb_build_object('page', CAST(v.page AS integer), 'offset', CAST(v.char_offset AS integer))
+        """,
+        rows,
+    )
+
+
+def _location(chunk):
+    return (chunk.page, chunk.offset)
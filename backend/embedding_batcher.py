@@ -0,0 +1,144 @@
+# backend/embedding_batcher.py
+"""
+Micro-batching of query embeddings across concurrent requests.
+
+/chat handlers each need the embedding of one short query. Encoding them one
+by one leaves most of the transformer's batch throughput unused, so callers
+hand their texts to a single dispatcher thread instead. It takes whatever is
+queued, up to `max_batch` texts, encodes it in one forward pass and resolves
+every caller's future with its own rows. Threaded callers block on the future
+(encode_many); the async /chat awaits it (submit), so a request waiting for
+its embedding holds no thread at all.
+
+While the model is busy, new requests pile up and form the next batch on
+their own. The dispatcher only holds a batch back (for at most `max_wait_ms`)
+when the previous batch already held several requests, i.e. under concurrent
+load; a lone request at low traffic is encoded immediately.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Upper bounds of the batch size histogram reported by stats()
+_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode, max_batch=32, max_wait_ms=5.0):
+        """
+        Args:
+            encode: Function mapping a list of strings to a 2-D array of
+                embeddings (e.g. Embedder.encode).
+            max_batch: Texts per forward pass. A single request larger than
+                this is still encoded in one call.
+            max_wait_ms: Longest time a batch is held back for more requests.
+        """
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_batch_requests = 1
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self.queue_wait_seconds = 0.0
+        self._histogram = [0] * (len(_BUCKETS) + 1)
+
+    def encode_many(self, texts):
+        """Embeddings for `texts` as a 2-D array, encoded together with other callers' texts."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.submit(texts).result()
+
+    def submit(self, texts):
+        """
+        Queues `texts` and returns a Future of their embeddings, without
+        blocking; async callers await it with asyncio.wrap_future.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future
+
+    def encode(self, text):
+        return self.encode_many([text])[0]
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            # Whatever is already queued joins for free
+            while size < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            # Under concurrent load, give stragglers a few milliseconds to join
+            if self.max_wait > 0 and self._last_batch_requests > 1:
+                deadline = time.perf_counter() + self.max_wait
+                while size < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    pending.append(item)
+                    size += len(item[0])
+            self._dispatch(pending, size)
+
+    def _dispatch(self, pending, size):
+        started = time.perf_counter()
+        try:
+            embeddings = np.asarray(self._encode([text for texts, _, _ in pending for text in texts]), dtype=np.float32)
+        except Exception as e:
+            for _, future, _ in pending:
+                future.set_exception(e)
+            embeddings = None
+        if embeddings is not None:
+            offset = 0
+            for texts, future, _ in pending:
+                future.set_result(embeddings[offset:offset + len(texts)])
+                offset += len(texts)
+
+        with self._lock:
+            self._last_batch_requests = len(pending)
+            self.batches += 1
+            self.requests += len(pending)
+            self.texts += size
+            self.max_batch_seen = max(self.max_batch_seen, size)
+            self.queue_wait_seconds += sum(started - enqueued for _, _, enqueued in pending)
+            self._histogram[next((i for i, bound in enumerate(_BUCKETS) if size <= bound), len(_BUCKETS))] += 1
+
+    def stats(self):
+        with self._lock:
+            labels = [str(b) if i == 0 or _BUCKETS[i - 1] + 1 == b else f"{_BUCKETS[i - 1] + 1}-{b}"
+                      for i, b in enumerate(_BUCKETS)] + [f">{_BUCKETS[-1]}"]
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_queue_wait_ms": round(self.queue_wait_seconds * 1000 / self.requests, 3) if self.requests else 0.0,
+                "batch_size_histogram": dict(zip(labels, self._histogram)),
+            }
@@ -0,0 +1,112 @@
+# backend/embedding_cache.py
+"""
+Bounded, thread-safe LRU cache in front of the query embedding model.
+
+Keys are the normalized query text (whitespace collapsed, lower-cased), so
+"What is a warp?" and "what  is a WARP?" share one entry. all-MiniLM-L6-v2
+lower-cases its input anyway, which makes the normalization lossless for the
+embedding itself. Entries expire after `ttl_seconds` and the least recently
+used entry is evicted once `maxsize` is reached.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    def __init__(self, encode, maxsize=1024, ttl_seconds=3600.0):
+        """
+        Args:
+            encode: Function mapping a list of strings to their embeddings
+                (e.g. model.encode).
+            maxsize: Maximum number of cached embeddings.
+            ttl_seconds: Lifetime of an entry; 0 or None disables expiry.
+        """
+        self._encode = encode
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def encode(self, text):
+        """Returns the embedding for `text`, computing it only on a cache miss."""
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts):
+        """
+        Embeddings for a list of texts, in order, as one 2-D array. All cache
+        misses are encoded together in a single batch.
+        """
+        keys = [normalize_query(text) for text in texts]
+        found = self._lookup(keys)
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            # Encode outside the lock so concurrent misses don't serialize on the model
+            found.update(self._store(missing, self._encode(missing)))
+        return np.vstack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def get(self, text):
+        """The cached embedding for `text`, or None; for callers that encode misses themselves (see put)"""
+        key = normalize_query(text)
+        return self._lookup([key]).get(key)
+
+    def put(self, text, embedding):
+        """Caches an embedding computed by the caller and returns it (read-only)"""
+        key = normalize_query(text)
+        return self._store([key], [embedding])[key]
+
+    def _lookup(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None and (entry[0] is None or entry[0] > now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[key] = entry[1]
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    self.misses += 1
+        return found
+
+    def _store(self, keys, embeddings):
+        stored = {}
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+            for key, embedding in zip(keys, embeddings):
+                embedding = np.array(embedding, dtype=np.float32)
+                embedding.setflags(write=False)  # shared between callers
+                stored[key] = embedding
+                self._entries[key] = (expires_at, embedding)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return stored
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,137 @@
+# backend/embedding_store.py
+"""
+Persistent embedding cache for ingestion.
+
+Re-ingesting a new version of a guide mostly re-embeds paragraphs that have
+not changed. The `embedding_cache` table (artifacts/migrations) keeps every
+chunk embedding ever computed, keyed by the model (plus embedding backend,
+since ONNX / int8 vectors differ slightly from the torch ones) and the SHA-256
+of the normalized chunk text. Ingestion looks every batch up there first and
+only sends the misses to the encoder, then stores what it computed.
+
+Works on any DB-API cursor with pgvector registered (psycopg2 in dan_app, the
+raw connection of a SQLAlchemy session in ingest_data.py). Lookups run in the
+caller's transaction. New entries are committed right away on a connection of
+their own instead: an ingestion holds its transaction for the whole file, and
+parallel ingestions embed the same paragraphs (every NVIDIA PDF ends with the
+same legal notice), so uncommitted entries would make them wait on each other
+or deadlock.
+"""
+import hashlib
+import unicodedata
+from collections import deque
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+
+def normalize_text(text):
+    """Unicode NFC with whitespace runs collapsed: reflowed PDF text hashes the same"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, model_key, connect):
+        """
+        Args:
+            model_key: Identifies the model the embeddings come from, e.g.
+                "all-MiniLM-L6-v2@torch"; entries of other models never match.
+            connect: Returns a new DB-API connection with pgvector registered
+                (or None if the database can't be reached), used only to write
+                entries. Opened on the first miss of a `map` call and closed
+                when it ends.
+        """
+        self.model_key = model_key
+        self.connect = connect
+        self.hits = 0
+        self.misses = 0
+
+    def map(self, cursor, texts, embedder, batch_size=64):
+        """
+        Embeddings for `texts`, yielded as one array per batch of `batch_size`
+        texts in input order. Only cache misses reach `embedder` (a
+        ParallelEmbedder), and they are stored once computed.
+        """
+        lookups = deque()
+
+        def miss_batches():
+            for batch in _batched(texts, batch_size):
+                hashes = [content_hash(text) for text in batch]
+                found = self._lookup(cursor, hashes)
+                missing = [i for i, digest in enumerate(hashes) if digest not in found]
+                self.hits += len(batch) - len(missing)
+                self.misses += len(missing)
+                lookups.append((hashes, found, missing))
+                yield [batch[i] for i in missing]
+
+        writer = None
+        try:
+            for computed in embedder.map_batches(miss_batches()):
+                hashes, found, missing = lookups.popleft()
+                computed = np.asarray(computed, dtype=np.float32)
+                if missing:
+                    writer = writer or self.connect()
+                    if writer is not None:
+                        self._store(writer, [hashes[i] for i in missing], computed)
+                for i, embedding in zip(missing, computed):
+                    found[hashes[i]] = embedding
+                yield np.vstack([found[digest] for digest in hashes])
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _lookup(self, cursor, hashes):
+        cursor.execute(
+            "SELECT content_sha256, embedding FROM embedding_cache WHERE model = %s AND content_sha256 = ANY(%s)",
+            (self.model_key, list(set(hashes))),
+        )
+        found = {}
+        for digest, embedding in cursor.fetchall():
+            # pgvector's psycopg2 adapter returns Vector objects in recent versions, numpy arrays in older ones
+            if hasattr(embedding, "to_numpy"):
+                embedding = embedding.to_numpy()
+            found[digest] = np.asarray(embedding, dtype=np.float32)
+        return found
+
+    def _store(self, conn, hashes, embeddings):
+        # Always in hash order, so two ingestions inserting the same entries lock them in the same order
+        entries = sorted(dict(zip(hashes, embeddings)).items())
+        try:
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    "INSERT INTO embedding_cache (model, content_sha256, embedding) VALUES %s ON CONFLICT DO NOTHING",
+                    [(self.model_key, digest, embedding) for digest, embedding in entries],
+                )
+            conn.commit()
+        except Exception as e:
+            # The cache only saves work; the ingestion goes on without these entries
+            conn.rollback()
+            print(f"⚠️  Could not store {len(entries)} embedding cache entries: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return f"embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)"
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
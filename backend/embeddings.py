@@ -0,0 +1,182 @@
+# backend/embeddings.py
+"""
+The sentence embedding model, shared by the backend (rag.py), ingest_data.py
+and dan_app.
+
+Three interchangeable backends, all producing the same 384-d vectors:
+
+- "torch"     - the reference SentenceTransformer on PyTorch (CUDA if present)
+- "onnx"      - the same model exported to ONNX, run by ONNX Runtime on the CPU
+- "onnx-int8" - ONNX with dynamically quantized int8 weights: the smallest and
+                fastest on CPU, at a small accuracy cost
+
+`verify` encodes a few reference sentences with the selected backend and with
+the torch model and checks that every pair stays within a cosine tolerance,
+so a backend change can't silently move the vectors away from the ones that
+are stored in the database.
+
+Like vector_index.py this module reads no settings itself; callers pass in
+the values from config.py.
+"""
+import os
+import time
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Covers prose, code and API identifiers, like the chunks in the database
+REFERENCE_TEXTS = [
+    "What is a CUDA kernel?",
+    "How do I copy memory from the host to the device?",
+    "__global__ void VecAdd(float* A, float* B, float* C, int N)",
+    "cudaMemcpyAsync overlaps data transfers with kernel execution when used with streams.",
+    "Threads in a block can cooperate through shared memory and synchronize with __syncthreads().",
+    "Warp divergence occurs when threads of the same warp take different branches.",
+]
+
+
+class Embedder:
+    def __init__(self, model_name="all-MiniLM-L6-v2", backend="torch", threads=None,
+                 onnx_int8_file="onnx/model_quint8_avx2.onnx", cache_dir=None):
+        """
+        Args:
+            model_name: Hugging Face model id.
+            backend: One of BACKENDS.
+            threads: Intra-op threads for PyTorch / ONNX Runtime; None keeps
+                the library default (all cores).
+            onnx_int8_file: Pre-quantized ONNX file inside the model repo. If
+                the repo has none, the model is quantized locally once.
+            cache_dir: Where a locally quantized model is kept.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Embedding backend must be one of {BACKENDS}, got '{backend}'")
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        self.onnx_int8_file = onnx_int8_file
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_models")
+        self.device = "cpu"
+
+        start = time.perf_counter()
+        self.model = self._load()
+        self.load_seconds = time.perf_counter() - start
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            import torch
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            return SentenceTransformer(self.model_name, device=self.device)
+
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": self._session_options()}
+        if self.backend == "onnx":
+            return SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+        try:
+            return SentenceTransformer(
+                self.model_name, device="cpu", backend="onnx",
+                model_kwargs={**model_kwargs, "file_name": self.onnx_int8_file},
+            )
+        except Exception as e:
+            print(f"   ⚠️  No pre-quantized '{self.onnx_int8_file}' for {self.model_name} ({e}); quantizing locally")
+        return SentenceTransformer(
+            self._quantize_locally(), device="cpu", backend="onnx",
+            model_kwargs={**model_kwargs, "file_name": "onnx/model_qint8_local.onnx"},
+        )
+
+    def _session_options(self):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        return options
+
+    def _quantize_locally(self):
+        """Exports the model to ONNX with dynamic int8 quantization, once per cache_dir"""
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        path = os.path.join(self.cache_dir, self.model_name.replace("/", "--"))
+        if not os.path.exists(os.path.join(path, "onnx", "model_qint8_local.onnx")):
+            model = SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+            model.save(path)
+            export_dynamic_quantized_onnx_model(model, "avx2", path, file_suffix="qint8_local")
+        return path
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        """Embeddings for a list of strings as a float32 array (a single string gives one vector)"""
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def verify(self, tolerance=0.99, texts=REFERENCE_TEXTS, reference=None):
+        """
+        Checks this backend against the torch reference model.
+
+        Args:
+            tolerance: Minimum cosine similarity between the two embeddings of
+                every reference text.
+            reference: A torch Embedder to compare with; one is loaded (and
+                dropped again) if omitted.
+
+        Returns:
+            The lowest cosine similarity seen.
+
+        Raises:
+            RuntimeError: if any text falls below `tolerance`.
+        """
+        if self.backend == "torch" and reference is None:
+            return 1.0
+        reference = reference or Embedder(self.model_name, backend="torch", threads=self.threads)
+        ours = self.encode(list(texts))
+        theirs = reference.encode(list(texts))
+        cosines = np.sum(ours * theirs, axis=1) / (
+            np.linalg.norm(ours, axis=1) * np.linalg.norm(theirs, axis=1)
+        )
+        worst = float(cosines.min())
+        if worst < tolerance:
+            raise RuntimeError(
+                f"Embedding backend '{self.backend}' drifted from the torch reference: "
+                f"min cosine {worst:.4f} < tolerance {tolerance}"
+            )
+        return worst
+
+    def describe(self):
+        threads = self.threads or "default"
+        return f"{self.model_name} ({self.backend} on {self.device}, {threads} threads)"
+
+
+def benchmark(embedder, texts=REFERENCE_TEXTS, rounds=20):
+    """Median single-query encode latency in milliseconds"""
+    timings = []
+    for _ in range(rounds):
+        for text in texts:
+            start = time.perf_counter()
+            embedder.encode([text])
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+if __name__ == "__main__":
+    # Compare every backend against the torch reference:  python backend/embeddings.py [threads]
+    import sys
+    import resource
+
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    reference = None
+    for backend in BACKENDS:
+        # ru_maxrss is in KB on Linux; backends load in order, so each line shows the growth it caused
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        embedder = Embedder(backend=backend, threads=threads)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        reference = reference or embedder
+        worst = embedder.verify(tolerance=0.0, reference=reference)
+        print(
+            f"{backend:>10}: p50 {benchmark(embedder):6.2f} ms/query, load {embedder.load_seconds:5.1f} s, "
+            f"peak RSS +{(rss_after - rss_before) / 1024:6.1f} MB, min cosine vs torch {worst:.4f}"
+        )
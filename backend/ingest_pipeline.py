@@ -0,0 +1,284 @@
+# backend/ingest_pipeline.py
+"""
+Streaming ingestion: page -> chunk -> embedding batch -> write batch.
+
+Nothing here holds a whole document. PDF pages are read one at a time, split
+into paragraph chunks as they arrive (a paragraph that runs over a page break
+is carried to the next page), and handed to the embedding stage through a
+bounded queue filled by a background thread. The embedding stage keeps a
+bounded number of batches in flight (parallel_embedding.py) and the caller
+writes each batch as it comes back. Peak memory therefore depends on the
+queue and batch sizes, not on the size of the document.
+
+Markdown and HTML files are read as a single page (HTML reduced to its
+visible text, block elements separated by blank lines).
+
+Every chunk records the page it starts on and its character offset in the
+document text, which the caller stores in chunks.metadata.
+
+When a new version of an already ingested document comes in, ChunkDiff
+matches its chunks against the stored ones by content hash, so only chunks
+whose text changed are embedded and written, and only chunks that are gone
+are deleted.
+"""
+import os
+import queue
+import threading
+from collections import defaultdict, deque, namedtuple
+from html.parser import HTMLParser
+
+try:
+    from embedding_store import content_hash
+except ImportError:
+    from backend.embedding_store import content_hash
+
+# page: 1-based page the chunk starts on; offset: character offset of the
+# chunk in the document text (all pages concatenated)
+TextChunk = namedtuple("TextChunk", ["content", "page", "offset"])
+
+_DONE = object()
+
+
+def iter_pdf_pages(path):
+    """Yields (page number, text) for every page of a PDF, one page in memory at a time"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(path) as doc:
+        for number, page in enumerate(doc, 1):
+            yield number, page.get_text()
+
+
+class IngestProgress:
+    """
+    Per-stage counters of one ingestion. Plain attributes, so another thread
+    (the job heartbeat) can read them while the ingestion runs.
+    """
+
+    def __init__(self):
+        self.pages_parsed = 0
+        self.chunks_embedded = 0
+        self.rows_written = 0
+
+    def count_pages(self, pages):
+        """Passes pages through, counting them (runs in the prefetch thread)"""
+        for page in pages:
+            yield page
+            self.pages_parsed += 1
+
+    def update(self, chunks_embedded=0, rows_written=None):
+        self.chunks_embedded += chunks_embedded
+        if rows_written is not None:
+            self.rows_written = rows_written
+
+    def snapshot(self):
+        return {
+            "pages_parsed": self.pages_parsed,
+            "chunks_embedded": self.chunks_embedded,
+            "rows_written": self.rows_written,
+        }
+
+
+def iter_text_pages(path):
+    """A Markdown or plain text file as a single page"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield 1, f.read()
+
+
+class _HTMLText(HTMLParser):
+    # Block elements end a paragraph, so the blank-line split still finds them
+    BLOCKS = {"p", "div", "section", "article", "li", "pre", "table", "tr",
+              "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "dd", "dt"}
+    SKIP = {"script", "style", "head", "nav"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def iter_html_pages(path):
+    """The visible text of an HTML file as a single page, with block elements as paragraphs"""
+    parser = _HTMLText()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        parser.feed(f.read())
+    parser.close()
+    yield 1, "".join(parser.parts)
+
+
+DOCUMENT_READERS = {
+    ".pdf": iter_pdf_pages,
+    ".md": iter_text_pages,
+    ".markdown": iter_text_pages,
+    ".txt": iter_text_pages,
+    ".html": iter_html_pages,
+    ".htm": iter_html_pages,
+}
+
+
+def iter_document_pages(path):
+    """(page number, text) pairs of a PDF, Markdown or HTML file, picked by extension"""
+    reader = DOCUMENT_READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f"Unsupported document type: {path}")
+    return reader(path)
+
+
+def iter_paragraph_chunks(pages, min_chars=100, separator="\n\n"):
+    """
+    Splits (page number, text) pairs into paragraph chunks, the same way the
+    whole-document split on blank lines did: paragraphs of `min_chars`
+    characters or less are dropped, and text is never lost at page breaks.
+    """
+    carry, carry_page, carry_offset = "", None, 0
+    offset = 0  # document offset of the page being read
+    for number, text in pages:
+        buffer = carry + text
+        buffer_offset = carry_offset if carry else offset
+        start = 0
+        while True:
+            end = buffer.find(separator, start)
+            if end == -1:
+                break
+            chunk = _chunk(buffer, start, end, buffer_offset, len(carry), carry_page, number, min_chars)
+            if chunk:
+                yield chunk
+            start = end + len(separator)
+        # The last paragraph of the page may continue on the next one. It starts on the page of its
+        # first non-blank character: a page can end in whitespace that belongs to no paragraph.
+        carry_page = carry_page if buffer[start:len(carry)].strip() else number
+        carry, carry_offset = buffer[start:], buffer_offset + start
+        offset += len(text)
+    if carry:
+        chunk = _chunk(carry, 0, len(carry), carry_offset, len(carry), carry_page, carry_page, min_chars)
+        if chunk:
+            yield chunk
+
+
+def _chunk(buffer, start, end, buffer_offset, carry_length, carry_page, page, min_chars):
+    paragraph = buffer[start:end]
+    content = paragraph.strip()
+    if len(content) <= min_chars:
+        return None
+    start += len(paragraph) - len(paragraph.lstrip())
+    return TextChunk(content, carry_page if start < carry_length else page, buffer_offset + start)
+
+
+def prefetch(iterable, maxsize=256):
+    """
+    Runs `iterable` in a background thread, at most `maxsize` items ahead of
+    the consumer. Exceptions are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # Gives up once the consumer is gone, so a full queue never blocks the thread forever
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, name="ingest-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # The consumer stopped early (error or close): let the producer exit
+        stop.set()
+
+
+def embed_stream(chunks, embed):
+    """
+    Pairs chunks with their embeddings batch by batch.
+
+    Args:
+        chunks: Iterable of TextChunk (or anything with `content`).
+        embed: Function taking an iterable of strings and yielding one array
+            of embeddings per batch, in order (ParallelEmbedder.map, or a
+            wrapper around EmbeddingStore.map).
+
+    Yields:
+        (list of chunks, array of their embeddings)
+    """
+    pending = deque()
+
+    def texts():
+        for chunk in chunks:
+            pending.append(chunk)
+            yield chunk.content
+
+    for embeddings in embed(texts()):
+        yield [pending.popleft() for _ in range(len(embeddings))], embeddings
+
+
+class ChunkDiff:
+    def __init__(self, existing):
+        """
+        Args:
+            existing: (id, content, metadata) of the chunks currently stored
+                for the document.
+        """
+        # Several chunks can have the same text; each stored row is matched at most once
+        self._stored = defaultdict(deque)
+        for chunk_id, content, metadata in existing:
+            self._stored[content_hash(content)].append((chunk_id, metadata or {}))
+        self.kept = 0
+        self.added = 0
+        self.moved = []  # (id, new metadata) of kept chunks that start somewhere else now
+
+    def new_chunks(self, chunks):
+        """
+        Yields the chunks of the new version that have no stored counterpart.
+        Chunks that match a stored one are consumed here: their row (id,
+        embedding, citations) is kept as it is, and only re-labelled when the
+        chunk now starts somewhere else (page or offset).
+        """
+        for chunk in chunks:
+            stored = self._stored.get(content_hash(chunk.content))
+            if not stored:
+                self.added += 1
+                yield chunk
+                continue
+            chunk_id, metadata = stored.popleft()
+            self.kept += 1
+            if metadata.get("page") != chunk.page or metadata.get("offset") != chunk.offset:
+                self.moved.append((chunk_id, {**metadata, "page": chunk.page, "offset": chunk.offset}))
+
+    def stale_ids(self):
+        """Ids of stored chunks the new version no longer contains; call after new_chunks is exhausted"""
+        return [chunk_id for stored in self._stored.values() for chunk_id, _ in stored]
+
+    def summary(self):
+        return f"{self.kept} chunks kept ({len(self.moved)} moved), {self.added} added, {len(self.stale_ids())} removed"
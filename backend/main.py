@@ -1,24 +1,124 @@
+# Load environment variables before anything reads its settings
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import load_environment
+load_environment()
+
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from db import SessionLocal, Base, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import SessionLocal, AsyncSessionLocal, Base, engine, dispose_async_engine
+from config import (
+    BATCH_MAX_QUERIES, RERANK_ENABLED, RERANK_CANDIDATES, CONTEXT_CANDIDATES, HNSW_INDEX_NAME,
+    WARMUP_ENABLED, WARMUP_PREWARM_INDEX,
+)
 import models
 import rag
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal
 from datetime import datetime
+from migrations import apply_migrations, apply_vector_storage
 
-# Load environment variables at startup
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import load_environment
-load_environment()
+def initialize_database():
+    """Create tables if they don't exist, then bring tables from older schemas up to date"""
+    Base.metadata.create_all(bind=engine)
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            apply_migrations(cur)
+        raw_conn.commit()
+        apply_vector_storage(raw_conn)
+    finally:
+        raw_conn.close()
+
+    # Refuse to start if the HNSW index can't serve the configured distance operator
+    with engine.connect() as conn:
+        rag.verify_vector_index(conn)
+
+# Set once the startup warm-up has finished (or right away when it is disabled)
+_ready = threading.Event()
+warmup_status = {}
+# Warm-up steps that have to succeed for /ready to report ready
+REQUIRED_WARMUP_STEPS = ("embedding_model", "db_pool")
+
+def _warm_embedding_model():
+    # Loads the model and runs the first (slowest) forward pass
+    rag.get_embedder().encode(["What is a CUDA kernel?"])
+
+def _fill_db_pool():
+    # Opens every pooled connection once (pgvector types get registered on connect)
+    conns = [engine.connect() for _ in range(engine.pool.size())]
+    for conn in conns:
+        conn.execute(text("SELECT 1"))
+        conn.close()
 
-# Create tables if they don't exist
-Base.metadata.create_all(bind=engine)
+def _prewarm_vector_index():
+    # Pulls the HNSW index into shared buffers so the first searches don't read it from disk
+    if WARMUP_PREWARM_INDEX:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_prewarm"))
+        except Exception as e:
+            print(f"⚠️  Could not create the pg_prewarm extension ({e}); trying to use an existing one")
+        with engine.begin() as conn:
+            blocks = conn.execute(text("SELECT pg_prewarm(:name)"), {"name": HNSW_INDEX_NAME}).scalar()
+            print(f"   🔥 Prewarmed {HNSW_INDEX_NAME}: {blocks} blocks")
+    if rag.vector_index is not None:
+        db = SessionLocal()
+        try:
+            rag.vector_index.sync(lambda: rag.chunks_watermark(db), lambda: rag._iter_chunk_rows(db))
+        finally:
+            db.close()
 
-app = FastAPI()
+def warm_up():
+    """
+    Pays the first request's costs up front: model load and first encode, LLM
+    clients, context packer, DB connection pool and vector index. Runs in a background thread;
+    failed steps are reported on /ready, and the lazy path retries them on
+    first use.
+    """
+    started = time.perf_counter()
+    steps = [
+        ("embedding_model", _warm_embedding_model),
+        ("llm_client", rag.get_llm),
+        ("async_llm_client", rag.get_async_llm),
+        ("context_packer", rag.get_context_packer),
+        ("db_pool", _fill_db_pool),
+        ("vector_index", _prewarm_vector_index),
+    ]
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            step()
+            warmup_status[name] = {"ok": True, "seconds": round(time.perf_counter() - step_started, 3)}
+        except Exception as e:
+            warmup_status[name] = {"ok": False, "error": str(e)}
+            print(f"⚠️  Warm-up step '{name}' failed: {e}")
+    print(f"✅ Warm-up finished in {time.perf_counter() - started:.1f}s")
+    _ready.set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy work happens here rather than at import time, so `import main`
+    # (and every --reload restart) stays fast
+    initialize_database()
+    if WARMUP_ENABLED:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        _ready.set()
+    yield
+    await dispose_async_engine()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for local frontend
 app.add_middleware(
@@ -36,15 +136,53 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+class ChunkFilters(BaseModel):
+    """Metadata prefilters applied inside the vector search"""
+    document_name: Optional[str] = None
+    document_version: Optional[str] = None
+    section: Optional[str] = None  # also matches sub-sections, e.g. "3.2" matches "3.2.1"
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+    metadata: Optional[dict] = None  # arbitrary containment match on chunks.metadata
+
 class ChatRequest(BaseModel):
     query: str
     session_id: Optional[int] = None
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # HNSW recall/latency knob for this request
+    retrieval_mode: Literal["vector", "hybrid"] = "vector"  # hybrid adds full-text search for exact identifiers
+    filters: Optional[ChunkFilters] = None
+    rerank: Optional[bool] = None  # cross-encoder rerank stage; defaults to RERANK_ENABLED
 
 class ChatResponse(BaseModel):
     response: str
     citations: List[int]
     session_id: int
     interaction_id: int
+    cache_hit: bool = False  # answered from the semantic answer cache
+    context_tokens: Optional[int] = None  # prompt context size after packing (None on a cache hit)
+    tokens_saved: Optional[int] = None  # vs. sending every retrieved chunk in full
+
+class BatchChatRequest(BaseModel):
+    queries: List[str]
+    session_id: Optional[int] = None  # all interactions are recorded in this session (new one if omitted)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    filters: Optional[ChunkFilters] = None
+
+class BatchChatResult(BaseModel):
+    response: str
+    citations: List[int]
+    interaction_id: int
+    cache_hit: bool = False
+    context_tokens: Optional[int] = None
+    tokens_saved: Optional[int] = None
+
+class BatchChatResponse(BaseModel):
+    session_id: int
+    results: List[BatchChatResult]
 
 class FeedbackRequest(BaseModel):
     interaction_id: int
@@ -68,14 +206,198 @@ class CitationResponse(BaseModel):
     document_name: str
     source_url: Optional[str] = None
 
+class StatsResponse(BaseModel):
+    embedding_cache: dict
+    embedding_batcher: Optional[dict] = None
+    answer_cache: Optional[dict] = None
+    reranker: dict
+    context_packer: dict
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
 
+class ReadyResponse(BaseModel):
+    status: str
+    warmup: dict
+
+# What /chat and /chat/stream know before the LLM is called
+ChatTurn = namedtuple("ChatTurn", ["session_id", "embedding", "corpus_version", "cache_scope", "cached", "context"])
+
+async def _prepare_chat(req: ChatRequest, db: AsyncSession) -> ChatTurn:
+    """Session lookup, semantic cache lookup and, on a miss, retrieval, reranking and context packing"""
+    # Create or get session
+    if req.session_id:
+        session = await db.get(models.ChatSession, req.session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+    else:
+        session = models.ChatSession()
+        db.add(session)
+        await db.commit()
+
+    # Answer near-duplicate questions from the semantic cache; the corpus version
+    # makes sure a re-ingestion invalidates what was cached before it
+    embedding = await rag.embed_query_async(req.query)
+    filters = req.filters.dict(exclude_none=True) if req.filters else None
+    rerank = RERANK_ENABLED if req.rerank is None else req.rerank
+    cache_scope = (req.retrieval_mode, filters, rerank)  # answers only match requests that retrieve the same way
+    cached = corpus_version = None
+    if rag.answer_cache is not None:
+        corpus_version = await rag.corpus_version_async(db)
+        cached = rag.answer_cache.lookup(embedding, corpus_version, scope=cache_scope)
+    if cached:
+        return ChatTurn(session.id, embedding, corpus_version, cache_scope, cached, None)
+
+    # Retrieve relevant chunks
+    # With reranking on, over-fetch candidates and keep only the best few for the prompt
+    chunks = await rag.retrieve_relevant_chunks_async(
+        db, req.query, k=RERANK_CANDIDATES if rerank else CONTEXT_CANDIDATES, ef_search=req.ef_search,
+        embedding=embedding, mode=req.retrieval_mode, filters=filters
+    )
+    # Ends the read transaction, so no pooled connection is held while the LLM answers
+    await db.commit()
+    if rerank:
+        chunks = await rag.rerank_chunks_async(req.query, chunks)
+
+    # Fit them into the token budget; only what reaches the prompt is cited
+    context = rag.pack_context(chunks)
+    return ChatTurn(session.id, embedding, corpus_version, cache_scope, None, context)
+
+def _citation_ids(turn: ChatTurn) -> List[int]:
+    return turn.cached.citations if turn.cached else [chunk_data.id for chunk_data in turn.context.chunks]
+
+def _cache_answer(turn: ChatTurn, query: str, answer: rag.GeneratedAnswer):
+    if turn.cached or rag.answer_cache is None:
+        return
+    if rag.is_cacheable_response(answer, turn.context.chunks):
+        rag.answer_cache.store(
+            turn.embedding, turn.corpus_version, query, answer.text, _citation_ids(turn), scope=turn.cache_scope
+        )
+
+async def _save_interaction(db: AsyncSession, session_id: int, query: str, response_text: str, citation_ids: List[int]) -> int:
+    """Records the interaction and its citations in one transaction; returns the interaction ID"""
+    # The flush assigns the interaction's id without a separate commit
+    interaction = models.Interaction(
+        session_id=session_id,
+        query_text=query,
+        response_text=response_text
+    )
+    db.add(interaction)
+    await db.flush()
+
+    db.add_all([
+        models.InteractionCitation(interaction_id=interaction.id, chunk_id=chunk_id)
+        for chunk_id in citation_ids
+    ])
+    await db.commit()
+    return interaction.id
+
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(req: ChatRequest, db: Session = Depends(get_db)):
+async def chat_endpoint(req: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    # Fully async: the database is reached through asyncpg, the LLM through its
+    # asyncio client and CPU-bound work runs on rag.cpu_executor, so a worker's
+    # event loop serves many /chat requests at once without a thread each
+    try:
+        turn = await _prepare_chat(req, db)
+        if turn.cached:
+            response_text = turn.cached.response
+        else:
+            # Generate response
+            answer = await rag.generate_response_async(req.query, turn.context)
+            _cache_answer(turn, req.query, answer)
+            response_text = answer.text
+
+        citation_ids = _citation_ids(turn)
+        interaction_id = await _save_interaction(db, turn.session_id, req.query, response_text, citation_ids)
+
+        return ChatResponse(
+            response=response_text,
+            citations=citation_ids,
+            session_id=turn.session_id,
+            interaction_id=interaction_id,
+            cache_hit=turn.cached is not None,
+            context_tokens=None if turn.cached else turn.context.tokens_used,
+            tokens_saved=None if turn.cached else turn.context.tokens_saved
+        )
+        
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    /chat as server-sent events, so the answer shows up while the LLM writes it:
+    - `citations`: sent as soon as retrieval is done (citations, session_id,
+      cache_hit, context_tokens, tokens_saved)
+    - `token`: {"text": ...} for every piece of the answer
+    - `done`: {"interaction_id": ...} once the interaction has been saved
+    - `error`: {"detail": ...} if the answer broke off; nothing is saved then
+    Errors before the stream starts (unknown session, retrieval failure) are
+    returned as plain HTTP errors, like /chat.
+    """
+    try:
+        turn = await _prepare_chat(req, db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    citation_ids = _citation_ids(turn)
+
+    async def events():
+        yield _sse("citations", {
+            "citations": citation_ids,
+            "session_id": turn.session_id,
+            "cache_hit": turn.cached is not None,
+            "context_tokens": None if turn.cached else turn.context.tokens_used,
+            "tokens_saved": None if turn.cached else turn.context.tokens_saved,
+        })
+        pieces = []
+        try:
+            if turn.cached:
+                pieces.append(turn.cached.response)
+                yield _sse("token", {"text": turn.cached.response})
+            else:
+                from_llm = True
+                async for piece in rag.stream_response_async(req.query, turn.context):
+                    pieces.append(piece.text)
+                    from_llm = from_llm and piece.from_llm
+                    yield _sse("token", {"text": piece.text})
+                _cache_answer(turn, req.query, rag.GeneratedAnswer("".join(pieces), from_llm))
+            response_text = "".join(pieces)
+            # The request's session may already be closed by now; this one lives as long as the write
+            async with AsyncSessionLocal() as write_db:
+                interaction_id = await _save_interaction(write_db, turn.session_id, req.query, response_text, citation_ids)
+        except Exception as e:
+            print(f"⚠️  /chat/stream failed after the stream started: {e}")
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {"interaction_id": interaction_id})
+
+    # no-cache and X-Accel-Buffering keep proxies (e.g. nginx) from holding events back
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+def chat_batch_endpoint(req: BatchChatRequest, db: Session = Depends(get_db)):
+    """
+    Answer many questions in one call. All queries are embedded in one batch
+    and retrieved in one SQL statement; LLM calls run with bounded concurrency.
+    Results come back in the order of `queries`.
+    """
+    if not req.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(req.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+
     try:
-        # Create or get session
         if req.session_id:
             session = db.query(models.ChatSession).filter(models.ChatSession.id == req.session_id).first()
             if not session:
@@ -85,45 +407,72 @@ def chat_endpoint(req: ChatRequest, db: Session = Depends(get_db)):
             db.add(session)
             db.commit()
             db.refresh(session)
-        
-        # Retrieve relevant chunks
-        chunks = rag.retrieve_relevant_chunks(db, req.query, k=5)
-        
-        # Generate response
-        response_text = rag.generate_response(req.query, chunks)
-        
-        # Create interaction record
-        interaction = models.Interaction(
-            session_id=session.id,
-            query_text=req.query,
-            response_text=response_text
-        )
-        db.add(interaction)
-        db.commit()
-        db.refresh(interaction)
-        
-        # Create citation records
-        citations = []
-        for chunk_data in chunks:
-            chunk_id = chunk_data[0]  # row[0] is the id column
-            citations.append(chunk_id)
-            
-            # Create citation record
-            citation = models.InteractionCitation(
-                interaction_id=interaction.id,
-                chunk_id=chunk_id
+
+        embeddings = rag.embed_queries(req.queries)
+        filters = req.filters.dict(exclude_none=True) if req.filters else None
+        cache_scope = ("vector", filters, False)
+
+        # Semantic cache first; only the misses go on to retrieval and the LLM
+        responses = [None] * len(req.queries)
+        citation_lists = [None] * len(req.queries)
+        cache_hits = [False] * len(req.queries)
+        packed = [None] * len(req.queries)
+        if rag.answer_cache is not None:
+            corpus_version = rag.corpus_version(db)
+            for i, embedding in enumerate(embeddings):
+                cached = rag.answer_cache.lookup(embedding, corpus_version, scope=cache_scope)
+                if cached:
+                    responses[i], citation_lists[i], cache_hits[i] = cached.response, cached.citations, True
+
+        pending = [i for i in range(len(req.queries)) if not cache_hits[i]]
+        if pending:
+            chunk_lists = rag.retrieve_relevant_chunks_batch(
+                db, embeddings[pending], k=CONTEXT_CANDIDATES, ef_search=req.ef_search, filters=filters
             )
-            db.add(citation)
-        
+            contexts = [rag.pack_context(chunks) for chunks in chunk_lists]
+            generated = rag.generate_responses([req.queries[i] for i in pending], contexts)
+            for i, context, answer in zip(pending, contexts, generated):
+                chunks = context.chunks
+                packed[i] = context
+                responses[i] = answer.text
+                citation_lists[i] = [chunk_data.id for chunk_data in chunks]
+                if rag.answer_cache is not None and rag.is_cacheable_response(answer, chunks):
+                    rag.answer_cache.store(
+                        embeddings[i], corpus_version, req.queries[i], answer.text, citation_lists[i], scope=cache_scope
+                    )
+
+        # Persist everything with one flush for the interactions and one commit
+        interactions = [
+            models.Interaction(session_id=session.id, query_text=query, response_text=response_text)
+            for query, response_text in zip(req.queries, responses)
+        ]
+        db.add_all(interactions)
+        db.flush()
+        db.add_all([
+            models.InteractionCitation(interaction_id=interaction.id, chunk_id=chunk_id)
+            for interaction, citation_ids in zip(interactions, citation_lists)
+            for chunk_id in dict.fromkeys(citation_ids)
+        ])
         db.commit()
-        
-        return ChatResponse(
-            response=response_text,
-            citations=citations,
+
+        return BatchChatResponse(
             session_id=session.id,
-            interaction_id=interaction.id
+            results=[
+                BatchChatResult(
+                    response=response_text,
+                    citations=citation_ids,
+                    interaction_id=interaction.id,
+                    cache_hit=cache_hit,
+                    context_tokens=context.tokens_used if context else None,
+                    tokens_saved=context.tokens_saved if context else None
+                )
+                for response_text, citation_ids, interaction, cache_hit, context
+                in zip(responses, citation_lists, interactions, cache_hits, packed)
+            ]
         )
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -235,3 +584,24 @@ def health_check():
         status="healthy",
         timestamp=datetime.now()
     )
+
+@app.get("/ready", response_model=ReadyResponse)
+def readiness_check():
+    """Readiness probe: 503 until the startup warm-up is done. /health only says the process is up"""
+    if not _ready.is_set():
+        raise HTTPException(status_code=503, detail={"status": "warming_up", "warmup": warmup_status})
+    failed = [name for name in REQUIRED_WARMUP_STEPS if name in warmup_status and not warmup_status[name]["ok"]]
+    if failed:
+        raise HTTPException(status_code=503, detail={"status": "degraded", "warmup": warmup_status})
+    return ReadyResponse(status="ready", warmup=warmup_status)
+
+@app.get("/stats", response_model=StatsResponse)
+def get_stats():
+    """Runtime counters for the retrieval caches"""
+    return StatsResponse(
+        embedding_cache=rag.query_embeddings.stats(),
+        embedding_batcher=rag.embedding_batcher.stats() if rag.embedding_batcher is not None else None,
+        answer_cache=rag.answer_cache.stats() if rag.answer_cache is not None else None,
+        reranker=rag.reranker.stats(),
+        context_packer=rag.get_context_packer().stats()
+    )
@@ -0,0 +1,177 @@
+# backend/migrations.py
+"""
+Schema changes for databases created before a feature existed.
+
+Fresh databases get the full schema from artifacts/schema_postgres.sql (dan_app)
+or Base.metadata.create_all (backend). Tables that already exist are never
+altered by either, so every later column or index also lives in a numbered,
+idempotent SQL file under artifacts/migrations. Both apps apply them, in
+filename order, on startup after the base schema; each file starts with a
+one-line description of its change.
+
+Every applied file is recorded in the schema_migrations table and never runs
+again: even an ALTER TABLE ... IF NOT EXISTS that has nothing to do takes an
+ACCESS EXCLUSIVE lock, so re-running it on every start would queue behind a
+running ingestion and stall all queries behind it. Pending files run with
+MIGRATION_LOCK_TIMEOUT and fail instead of waiting.
+"""
+import glob
+import os
+import time
+
+try:
+    from config import HNSW_INDEX_NAME, MIGRATION_LOCK_TIMEOUT, VECTOR_STORAGE, VECTOR_STORAGES, quantized_column_ddl
+    from bulk_load import BULK_LOAD_LOCK, rebuild_ann_index
+except ImportError:
+    from backend.config import HNSW_INDEX_NAME, MIGRATION_LOCK_TIMEOUT, VECTOR_STORAGE, VECTOR_STORAGES, quantized_column_ddl
+    from backend.bulk_load import BULK_LOAD_LOCK, rebuild_ann_index
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts", "migrations")
+
+# pg_advisory_xact_lock key serializing processes that apply migrations at the same time ("migr" as an int)
+MIGRATIONS_LOCK = 0x6D696772
+# SQLSTATE of a statement that gave up waiting for a lock (lock_timeout)
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def migration_files():
+    return sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")))
+
+
+def pending_migrations(cursor):
+    """Migration files not yet recorded in schema_migrations, in the order they have to run."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("SELECT name FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    return [path for path in migration_files() if os.path.basename(path) not in applied]
+
+
+def apply_migrations(cursor):
+    """
+    Runs the migration files not applied yet on a DB-API cursor and records
+    them. The caller commits.
+
+    Raises:
+        psycopg2.errors.LockNotAvailable: if a pending file had to wait longer
+            than MIGRATION_LOCK_TIMEOUT for a lock.
+    """
+    if not pending_migrations(cursor):
+        return
+    # Another process may have applied them while we waited for the lock
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATIONS_LOCK,))
+    pending = pending_migrations(cursor)
+    cursor.execute("SELECT set_config('lock_timeout', %s, true)", (MIGRATION_LOCK_TIMEOUT,))
+    for path in pending:
+        name = os.path.basename(path)
+        with open(path, "r", encoding="utf-8") as f:
+            cursor.execute(f.read())
+        cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        print(f"🗄️  Applied migration {name}")
+
+
+def apply_vector_storage(conn):
+    """
+    Brings the chunks table in line with VECTOR_STORAGE on a psycopg2
+    connection: adds the quantized column it needs and builds its HNSW index,
+    then drops the HNSW indexes and columns of the other storages, which would
+    otherwise stay in memory and be maintained on every insert.
+
+    Only what the catalog shows missing or left over is changed, so a normal
+    start runs no DDL at all. Indexes are built and dropped CONCURRENTLY and
+    block neither queries nor ingestion; column changes lock the table (adding
+    a generated column rewrites it) and run with MIGRATION_LOCK_TIMEOUT. While
+    a bulk load holds BULK_LOAD_LOCK the indexes are left alone: the load
+    dropped the HNSW index on purpose and rebuilds it when it is done.
+
+    Anything uncommitted on `conn` is rolled back, so callers commit their own
+    work first. It is switched to autocommit while in use, since the
+    CONCURRENTLY statements can't run in a transaction.
+
+    Raises:
+        psycopg2.errors.LockNotAvailable: if the column VECTOR_STORAGE needs
+            could not be added within MIGRATION_LOCK_TIMEOUT.
+    """
+    conn.rollback()
+    conn.set_session(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            _apply_vector_storage(cur)
+    finally:
+        conn.set_session(autocommit=False)
+
+
+def _apply_vector_storage(cur):
+    column = VECTOR_STORAGES[VECTOR_STORAGE]["column"]
+    ddl = quantized_column_ddl()
+    if ddl and not _has_column(cur, column):
+        started = time.perf_counter()
+        _execute_with_lock_timeout(cur, ddl)
+        print(f"🗄️  Added column chunks.{column} (VECTOR_STORAGE={VECTOR_STORAGE}) in {time.perf_counter() - started:.1f}s")
+    # Bulk loads (bulk_load.py) hold the lock shared while the index is dropped on purpose, and
+    # the last one rebuilds it; a bulk load starting meanwhile waits for our index DDL
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (BULK_LOAD_LOCK,))
+    if not cur.fetchone()[0]:
+        print(f"⏭️  A bulk load is running; leaving {HNSW_INDEX_NAME} to it")
+        return
+    try:
+        # Also covers a changed VECTOR_STORAGE on an existing table (create_all only indexes new tables)
+        if not _index_is_valid(cur, HNSW_INDEX_NAME):
+            rebuild_ann_index(cur)
+        for storage, settings in VECTOR_STORAGES.items():
+            if storage != VECTOR_STORAGE and _index_is_valid(cur, settings["index"]) is not None:
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {settings['index']}")
+                print(f"🗑️  Dropped HNSW index {settings['index']} (VECTOR_STORAGE={storage}); "
+                      f"VECTOR_STORAGE is now {VECTOR_STORAGE}")
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (BULK_LOAD_LOCK,))
+    for storage, settings in VECTOR_STORAGES.items():
+        if storage == VECTOR_STORAGE or "expression" not in settings or not _has_column(cur, settings["column"]):
+            continue
+        try:
+            _execute_with_lock_timeout(cur, f"ALTER TABLE chunks DROP COLUMN {settings['column']}")
+        except Exception as e:
+            # Unused, so it can wait for a start when the table is free
+            if getattr(e, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                raise
+            print(f"⚠️  chunks.{settings['column']} (VECTOR_STORAGE={storage}) is no longer used but the table is busy; "
+                  f"it will be dropped on a later start")
+            continue
+        print(f"🗑️  Dropped column chunks.{settings['column']} (VECTOR_STORAGE={storage})")
+
+
+def _has_column(cur, column):
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = 'chunks' AND column_name = %s",
+        (column,)
+    )
+    return cur.fetchone() is not None
+
+
+def _index_is_valid(cur, name):
+    """True for a usable index, False for one a failed concurrent build left behind, None if there is none."""
+    cur.execute(
+        """
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+        """,
+        (name,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _execute_with_lock_timeout(cur, sql):
+    # Session-level on an autocommit cursor, so it has to be reset by hand
+    cur.execute("SELECT set_config('lock_timeout', %s, false)", (MIGRATION_LOCK_TIMEOUT,))
+    try:
+        cur.execute(sql)
+    finally:
+        cur.execute("RESET lock_timeout")
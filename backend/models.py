@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, UniqueConstraint, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
 from db import Base
+from config import (
+    HNSW_INDEX_NAME, HNSW_COLUMN, HNSW_OPCLASS, HNSW_M, HNSW_EF_CONSTRUCTION, EMBEDDING_DIM,
+    VECTOR_STORAGE, VECTOR_STORAGES,
+)
 
 class Document(Base):
     __tablename__ = "documents"
@@ -18,10 +23,29 @@ class Chunk(Base):
     id = Column(Integer, primary_key=True)
     document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(384), nullable=False)
-    meta = Column("metadata", JSON)  # Map 'meta' attribute to 'metadata' column
+    embedding = Column(Vector(EMBEDDING_DIM), nullable=False)
+    # Quantized copy for VECTOR_STORAGE=halfvec/binary, maintained by Postgres
+    if VECTOR_STORAGE == "halfvec":
+        embedding_half = Column(HALFVEC(EMBEDDING_DIM), Computed(VECTOR_STORAGES["halfvec"]["expression"], persisted=True))
+    elif VECTOR_STORAGE == "binary":
+        embedding_bit = Column(BIT(EMBEDDING_DIM), Computed(VECTOR_STORAGES["binary"]["expression"], persisted=True))
+    meta = Column("metadata", JSONB)  # Map 'meta' attribute to 'metadata' column
+    content_tsv = Column(TSVECTOR, Computed("to_tsvector('english', content)", persisted=True))  # for hybrid retrieval
     document = relationship("Document", back_populates="chunks")
 
+    # ANN index on the column picked by config.VECTOR_STORAGE; its opclass must
+    # match the operator the queries use (config.VECTOR_DISTANCE)
+    __table_args__ = (
+        Index(
+            HNSW_INDEX_NAME,
+            HNSW_COLUMN,
+            postgresql_using="hnsw",
+            postgresql_with={"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION},
+            postgresql_ops={HNSW_COLUMN: HNSW_OPCLASS},
+        ),
+        Index("idx_chunks_content_tsv", "content_tsv", postgresql_using="gin"),
+    )
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     id = Column(Integer, primary_key=True)
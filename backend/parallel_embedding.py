@@ -0,0 +1,166 @@
+# backend/parallel_embedding.py
+"""
+Multi-process embedding for ingestion.
+
+A single process can't use a many-core host for the embedding forward pass,
+so ingestion shards its chunks into batches and spreads them over a pool of
+worker processes. Each worker loads the embedding model once (in the pool
+initializer) with its share of the CPU threads, and then only receives lists
+of strings and sends back float32 arrays.
+
+`ParallelEmbedder.map` yields the embeddings batch by batch in input order
+while keeping a bounded number of batches in flight, so the caller can write
+one batch to the database while the workers are already encoding the next
+ones, and memory stays flat however many chunks come in.
+
+With one worker (or fewer) everything runs in-process, without a pool.
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+# The model of this worker process, set by _init_worker
+_worker_embedder = None
+
+
+def _load_embedder_class():
+    try:
+        from embeddings import Embedder
+    except ImportError:
+        from backend.embeddings import Embedder
+    return Embedder
+
+
+def _init_worker(model_name, backend, threads, onnx_int8_file):
+    global _worker_embedder
+    _worker_embedder = _load_embedder_class()(model_name, backend=backend, threads=threads, onnx_int8_file=onnx_int8_file)
+
+
+def _encode_batch(texts):
+    return _worker_embedder.encode(texts)
+
+
+def default_workers():
+    """A quarter of the cores, so every worker still gets a few intra-op threads"""
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+class ParallelEmbedder:
+    def __init__(self, model_name="all-MiniLM-L6-v2", backend="torch", workers=None, batch_size=64,
+                 threads=None, onnx_int8_file="onnx/model_quint8_avx2.onnx", embedder=None, max_pending=None):
+        """
+        Args:
+            model_name, backend, onnx_int8_file: Passed to embeddings.Embedder.
+            workers: Worker processes; defaults to default_workers().
+            batch_size: Texts per batch sent to a worker.
+            threads: Intra-op threads per worker; defaults to an even share
+                of the cores.
+            embedder: Already loaded Embedder to use in-process when there is
+                only one worker (saves loading a second copy).
+            max_pending: Batches in flight at once; defaults to twice the
+                number of workers.
+        """
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers or default_workers()
+        self.batch_size = batch_size
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.onnx_int8_file = onnx_int8_file
+        self.max_pending = max_pending or 2 * self.workers
+        self._embedder = embedder
+        self._pool = None
+        # One embedder may be shared by several ingestion threads (ingest_data.py --jobs)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn rather than fork: the parent may already hold torch / ONNX Runtime thread pools
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.model_name, self.backend, self.threads, self.onnx_int8_file),
+                    )
+                    print(f"   🧵 Started {self.workers} embedding workers ({self.threads} threads each, {self.backend})")
+        return self._pool
+
+    def _get_local_embedder(self):
+        if self._embedder is None:
+            with self._lock:
+                if self._embedder is None:
+                    self._embedder = _load_embedder_class()(
+                        self.model_name, backend=self.backend, onnx_int8_file=self.onnx_int8_file
+                    )
+        return self._embedder
+
+    def map(self, texts):
+        """
+        Embeds `texts` (any iterable of strings) and yields one float32 array
+        per batch of `batch_size` texts, in input order.
+        """
+        return self.map_batches(_batched(texts, self.batch_size))
+
+    def map_batches(self, batches):
+        """
+        Like map, for texts the caller already grouped into lists; yields one
+        array per list (an empty list gives an empty array).
+        """
+        if self.workers <= 1:
+            embedder = self._get_local_embedder()
+            for batch in batches:
+                yield embedder.encode(batch) if batch else _EMPTY
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        for batch in batches:
+            if batch:
+                pending.append(pool.submit(_encode_batch, batch))
+            else:
+                pending.append(_done(_EMPTY))
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def encode(self, texts):
+        """All embeddings for `texts` as one 2-D array"""
+        arrays = list(self.map(texts))
+        return np.vstack(arrays) if arrays else np.zeros((0, 0), dtype=np.float32)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+_EMPTY = np.zeros((0, 0), dtype=np.float32)
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -1,75 +1,594 @@
 from sqlalchemy import text
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import asyncio
+import json
 import sys
 import os
-import torch
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the parent directory to the path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import setup_llm_client, get_completion
+from utils import (
+    setup_llm_client, get_completion, setup_async_llm_client, get_completion_async, stream_completion_async,
+)
+import models
+from db import SessionLocal
+from config import (
+    RETRIEVAL_ENGINE, VECTOR_INDEX_DIR, VECTOR_INDEX_REFRESH_SECONDS,
+    VECTOR_DISTANCE, VECTOR_STORAGE, DISTANCE_OPERATOR, HNSW_INDEX_NAME, HNSW_EF_SEARCH,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_REFRESH_SECONDS,
+    HYBRID_CANDIDATES, HYBRID_RRF_K, HNSW_ITERATIVE_SCAN, HNSW_MAX_SCAN_TUPLES, BATCH_LLM_CONCURRENCY,
+    RERANK_MODEL, RERANK_MAX_CANDIDATES, RERANK_TOP_N, RERANK_BUDGET_MS, RERANK_BATCH_SIZE,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_SIMILARITY, EMBEDDING_BATCHING, EMBEDDING_BATCH_MAX, EMBEDDING_BATCH_WAIT_MS,
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_DIM, CPU_EXECUTOR_THREADS,
+    similarity_sql, check_hnsw_indexdef, ann_candidates_sql, coarse_limit, load_embedder,
+)
+from vector_index import MmapVectorIndex
+from embedding_cache import EmbeddingCache
+from embedding_batcher import EmbeddingBatcher
+from semantic_cache import SemanticCache
+from reranker import Reranker
+from context_packer import ContextPacker
 
-# Initialize the embedding model with CUDA support if available
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+LLM_MODEL = "gpt-4o"  # or "claude-3-5-sonnet-20241022"
 
-# Initialize LLM client (you can change the model here)
-llm_client, model_name, api_provider = setup_llm_client("gpt-4o")  # or "claude-3-5-sonnet-20241022"
+# The embedding model and the LLM client are created on first use (or by the
+# warm-up in main.py), so importing this module stays cheap.
+_embedder_lock = threading.Lock()
+_llm_lock = threading.Lock()
+_context_packer_lock = threading.Lock()
+_embedder = None
+_llm = None
+_async_llm = None
+_context_packer = None
 
-print(f"🚀 RAG System initialized:")
-print(f"   📊 Embedding model: all-MiniLM-L6-v2 on {device}")
-print(f"   🤖 LLM: {model_name} via {api_provider}" if llm_client else "   ⚠️  LLM client not initialized")
+def get_embedder():
+    """Shared embedding model; EMBEDDING_BACKEND picks PyTorch or ONNX Runtime (see embeddings.py)"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = load_embedder()
+                print(f"   📊 Embedding model loaded: {_embedder.describe()} in {_embedder.load_seconds:.1f}s")
+    return _embedder
 
-def retrieve_relevant_chunks(db, query_text, k=5):
-    # Generate embedding for the query
-    embedding = model.encode(query_text)
-    embedding_list = embedding.tolist()
-    
-    # Format embedding as PostgreSQL vector literal
-    embedding_str = '[' + ','.join(map(str, embedding_list)) + ']'
-    
-    sql = text("""
-        SELECT c.id, c.content, c.embedding, 1 - (c.embedding <=> :embedding) as similarity, d.name as document_name
-        FROM chunks c
+def get_llm():
+    """(client, model_name, api_provider); client is None if the provider could not be set up"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = setup_llm_client(LLM_MODEL)
+                client, name, provider = _llm
+                print(f"   🤖 LLM: {name} via {provider}" if client else "   ⚠️  LLM client not initialized")
+    return _llm
+
+def get_context_packer():
+    """Decides which retrieved chunks (and how much of them) go into the prompt; loads the tiktoken encoding"""
+    global _context_packer
+    if _context_packer is None:
+        with _context_packer_lock:
+            if _context_packer is None:
+                _context_packer = ContextPacker(LLM_MODEL, token_budget=CONTEXT_TOKEN_BUDGET, min_similarity=CONTEXT_MIN_SIMILARITY)
+    return _context_packer
+
+def get_async_llm():
+    """(client, model_name, api_provider) of the asyncio client used by the async /chat"""
+    global _async_llm
+    if _async_llm is None:
+        with _llm_lock:
+            if _async_llm is None:
+                _async_llm = setup_async_llm_client(LLM_MODEL)
+    return _async_llm
+
+def _encode(texts):
+    return get_embedder().encode(texts)
+
+# Cache misses from concurrent requests are encoded together in micro-batches
+embedding_batcher = (
+    EmbeddingBatcher(_encode, max_batch=EMBEDDING_BATCH_MAX, max_wait_ms=EMBEDDING_BATCH_WAIT_MS)
+    if EMBEDDING_BATCHING else None
+)
+
+# CPU-bound work of the async request path (encoding without the batcher, reranking)
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_THREADS, thread_name_prefix="cpu")
+
+# Repeated questions skip the encoder entirely
+query_embeddings = EmbeddingCache(
+    embedding_batcher.encode_many if embedding_batcher else _encode,
+    maxsize=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS
+)
+
+# Near-duplicate questions are answered from here without retrieval or an LLM call
+answer_cache = (
+    SemanticCache(dim=EMBEDDING_DIM, threshold=SEMANTIC_CACHE_THRESHOLD, maxsize=SEMANTIC_CACHE_SIZE)
+    if SEMANTIC_CACHE_ENABLED else None
+)
+
+print(f"🚀 RAG System configured:")
+print(f"   📊 Embedding model: {EMBEDDING_MODEL} ({EMBEDDING_BACKEND}), loaded on first use")
+print(f"   🔎 Retrieval engine: {RETRIEVAL_ENGINE} ({VECTOR_DISTANCE} distance, {VECTOR_STORAGE} storage)")
+
+# In-process index, only used when RETRIEVAL_ENGINE=mmap
+vector_index = (
+    MmapVectorIndex(VECTOR_INDEX_DIR, refresh_seconds=VECTOR_INDEX_REFRESH_SECONDS, metric=VECTOR_DISTANCE)
+    if RETRIEVAL_ENGINE == "mmap" else None
+)
+
+def verify_vector_index(conn):
+    """Fails loudly at startup if the HNSW index can't serve our distance operator"""
+    indexdef = conn.execute(
+        text("SELECT indexdef FROM pg_indexes WHERE indexname = :name"), {"name": HNSW_INDEX_NAME}
+    ).scalar()
+    check_hnsw_indexdef(indexdef)
+
+# Optional rerank stage; the cross-encoder itself is only loaded on first use
+reranker = Reranker(
+    RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS, max_candidates=RERANK_MAX_CANDIDATES
+)
+
+_WATERMARK_SQL = text("SELECT count(*), coalesce(max(id), 0) FROM chunks")
+
+def chunks_watermark(db):
+    """(row count, max id) of the chunks table; changes whenever chunks are added or removed"""
+    return tuple(db.execute(_WATERMARK_SQL).one())
+
+async def chunks_watermark_async(db):
+    """chunks_watermark on an AsyncSession"""
+    return tuple((await db.execute(_WATERMARK_SQL)).one())
+
+# Watermark last read for the answer cache and when (time.monotonic())
+_corpus_version = (None, None)
+
+def _recent_corpus_version():
+    version, read_at = _corpus_version
+    if read_at is not None and time.monotonic() - read_at < SEMANTIC_CACHE_REFRESH_SECONDS:
+        return version
+    return None
+
+def _remember_corpus_version(version):
+    global _corpus_version
+    _corpus_version = (version, time.monotonic())
+    return version
+
+def corpus_version(db):
+    """
+    chunks_watermark for keying the answer cache, read at most every
+    SEMANTIC_CACHE_REFRESH_SECONDS: the count(*) scans chunks, too much to run
+    on every request. Answers cached before a re-ingestion can be served for
+    up to that long after it.
+    """
+    return _recent_corpus_version() or _remember_corpus_version(chunks_watermark(db))
+
+async def corpus_version_async(db):
+    """corpus_version on an AsyncSession"""
+    return _recent_corpus_version() or _remember_corpus_version(await chunks_watermark_async(db))
+
+def embed_query(query_text):
+    """Embedding for a user query, served from the LRU cache when possible"""
+    return query_embeddings.encode(query_text)
+
+async def embed_query_async(query_text):
+    """
+    embed_query for the event loop: a cache miss is queued on the micro-batcher
+    and awaited (no thread is held while it waits), or encoded on cpu_executor
+    when batching is off.
+    """
+    embedding = query_embeddings.get(query_text)
+    if embedding is not None:
+        return embedding
+    if embedding_batcher is not None:
+        embeddings = await asyncio.wrap_future(embedding_batcher.submit([query_text]))
+    else:
+        embeddings = await asyncio.get_running_loop().run_in_executor(cpu_executor, _encode, [query_text])
+    return query_embeddings.put(query_text, embeddings[0])
+
+def embed_queries(query_texts):
+    """Embeddings for many queries; cache misses are encoded in one batch"""
+    return query_embeddings.encode_many(query_texts)
+
+def _iter_chunk_rows(db):
+    return db.query(
+        models.Chunk.id, models.Chunk.content, models.Chunk.embedding, models.Document.name
+    ).join(models.Document, models.Chunk.document_id == models.Document.id).order_by(models.Chunk.id).yield_per(1000)
+
+def retrieve_relevant_chunks(db, query_text, k=5, ef_search=None, embedding=None, mode="vector", filters=None):
+    """
+    Top-k chunks for a query as rows of (id, content, similarity, document_name).
+
+    mode="vector" ranks by embedding distance only; mode="hybrid" also runs a
+    full-text search and fuses both rankings (always served by Postgres).
+    `filters` (document_name, document_version, section, page_min, page_max,
+    metadata) are applied inside the ANN query, not to its results.
+    """
+    # Generate embedding for the query unless the caller already has it
+    if embedding is None:
+        embedding = embed_query(query_text)
+
+    if mode == "hybrid":
+        return _hybrid_search(db, query_text, embedding, k, ef_search, filters)
+
+    if vector_index is not None and not filters:
+        try:
+            vector_index.sync(lambda: chunks_watermark(db), lambda: _iter_chunk_rows(db))
+            return vector_index.search(embedding, k)
+        except Exception as e:
+            print(f"⚠️  In-process vector index unavailable, falling back to pgvector: {e}")
+            db.rollback()
+
+    return _pgvector_search(db, embedding, k, ef_search, filters)
+
+async def retrieve_relevant_chunks_async(db, query_text, k=5, ef_search=None, embedding=None, mode="vector", filters=None):
+    """
+    retrieve_relevant_chunks on an AsyncSession. The in-process vector index
+    is synced and searched on cpu_executor (with its own sync session), so
+    neither the ANN search nor a reload blocks the event loop.
+    """
+    if embedding is None:
+        embedding = await embed_query_async(query_text)
+
+    if mode == "hybrid":
+        return await _hybrid_search_async(db, query_text, embedding, k, ef_search, filters)
+
+    if vector_index is not None and not filters:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(cpu_executor, _search_vector_index, embedding, k)
+        except Exception as e:
+            print(f"⚠️  In-process vector index unavailable, falling back to pgvector: {e}")
+
+    return await _pgvector_search_async(db, embedding, k, ef_search, filters)
+
+def _search_vector_index(embedding, k):
+    with SessionLocal() as db:
+        vector_index.sync(lambda: chunks_watermark(db), lambda: _iter_chunk_rows(db))
+    return vector_index.search(embedding, k)
+
+def retrieve_relevant_chunks_batch(db, embeddings, k=5, ef_search=None, filters=None):
+    """
+    Top-k chunks for many query embeddings at once, as one list of rows per
+    query in input order. Postgres answers all of them in a single statement:
+    the vectors are unnested and each one drives its own index-ordered scan
+    through a LATERAL join.
+    """
+    if not len(embeddings):
+        return []
+
+    if vector_index is not None and not filters:
+        try:
+            vector_index.sync(lambda: chunks_watermark(db), lambda: _iter_chunk_rows(db))
+            return [vector_index.search(embedding, k) for embedding in embeddings]
+        except Exception as e:
+            print(f"⚠️  In-process vector index unavailable, falling back to pgvector: {e}")
+            db.rollback()
+
+    where_sql, filter_params = _filter_sql(filters)
+    sql = text(f"""
+        SELECT q.ord, r.id, r.content, {similarity_sql("r.distance")} as similarity, d.name as document_name
+        FROM unnest(CAST(:embeddings AS vector[])) WITH ORDINALITY AS q(v, ord)
+        CROSS JOIN LATERAL ({ann_candidates_sql("q.v", where_sql)}
+        ) r
+        JOIN documents d ON r.document_id = d.id
+        ORDER BY q.ord, r.distance
+    """)
+
+    _set_ef_search(db, _ann_ef_search(ef_search, k), filtered=bool(filter_params))
+    results = [[] for _ in range(len(embeddings))]
+    rows = db.execute(sql, {
+        "embeddings": [np.asarray(embedding, dtype=np.float32) for embedding in embeddings],
+        "k": k,
+        **filter_params,
+    })
+    for row in rows:
+        results[row.ord - 1].append(row)
+    return results
+
+def rerank_chunks(query_text, chunks, top_n=RERANK_TOP_N):
+    """Keeps the top_n chunks according to the cross-encoder, within its latency budget"""
+    return reranker.rerank(query_text, chunks, top_n=top_n)
+
+async def rerank_chunks_async(query_text, chunks, top_n=RERANK_TOP_N):
+    """rerank_chunks on cpu_executor"""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, rerank_chunks, query_text, chunks, top_n)
+
+def _filter_sql(filters):
+    """WHERE clause (against chunks c) and bind parameters for the metadata prefilters"""
+    filters = filters or {}
+    clauses, params = [], {}
+
+    document_clauses = []
+    if filters.get("document_name"):
+        document_clauses.append("name = :f_document_name")
+        params["f_document_name"] = filters["document_name"]
+    if filters.get("document_version"):
+        document_clauses.append("version = :f_document_version")
+        params["f_document_version"] = filters["document_version"]
+    if document_clauses:
+        clauses.append(f"c.document_id IN (SELECT id FROM documents WHERE {' AND '.join(document_clauses)})")
+
+    if filters.get("section"):
+        # A section matches itself and its sub-sections: '3.2' -> '3.2', '3.2.1', ...
+        section = filters["section"]
+        clauses.append("(c.metadata->>'section' = :f_section OR c.metadata->>'section' LIKE :f_section_prefix)")
+        params["f_section"] = section
+        params["f_section_prefix"] = section.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + ".%"
+
+    if filters.get("page_min") is not None or filters.get("page_max") is not None:
+        clauses.append("jsonb_typeof(c.metadata->'page') = 'number'")
+        if filters.get("page_min") is not None:
+            clauses.append("c.metadata->'page' >= to_jsonb(CAST(:f_page_min AS integer))")
+            params["f_page_min"] = filters["page_min"]
+        if filters.get("page_max") is not None:
+            clauses.append("c.metadata->'page' <= to_jsonb(CAST(:f_page_max AS integer))")
+            params["f_page_max"] = filters["page_max"]
+
+    if filters.get("metadata"):
+        clauses.append("c.metadata @> CAST(:f_metadata AS jsonb)")
+        params["f_metadata"] = json.dumps(filters["metadata"])
+
+    return (" AND ".join(clauses) or "TRUE"), params
+
+def _pgvector_search_query(embedding, k, ef_search=None, filters=None):
+    # The query vector is bound once as a numpy array (adapted by pgvector's
+    # register_vector in db.py) and the embedding column is not sent back.
+    # Documents are joined after the LIMIT so the inner query stays a plain
+    # index-ordered scan (plus the exact rescore for quantized storage).
+    where_sql, filter_params = _filter_sql(filters)
+    sql = text(f"""
+        WITH q AS (SELECT CAST(:embedding AS vector) AS v)
+        SELECT r.id, r.content, {similarity_sql("r.distance")} as similarity, d.name as document_name
+        FROM ({ann_candidates_sql("(SELECT v FROM q)", where_sql)}
+        ) r
+        JOIN documents d ON r.document_id = d.id
+        ORDER BY r.distance
+    """)
+    settings = _ef_search_statement(_ann_ef_search(ef_search, k), filtered=bool(filter_params))
+    return settings, sql, {"embedding": np.asarray(embedding, dtype=np.float32), "k": k, **filter_params}
+
+def _pgvector_search(db, embedding, k, ef_search=None, filters=None):
+    return _run_search(db, *_pgvector_search_query(embedding, k, ef_search, filters))
+
+async def _pgvector_search_async(db, embedding, k, ef_search=None, filters=None):
+    return await _run_search_async(db, *_pgvector_search_query(embedding, k, ef_search, filters))
+
+def _hybrid_search_query(query_text, embedding, k, ef_search=None, filters=None):
+    # Vector and full-text candidates are ranked separately and merged with
+    # reciprocal rank fusion, all in one statement. The full-text query ORs
+    # the query terms so a single exact identifier is enough to match. The
+    # query vector is bound once in the q CTE; the reported similarity is
+    # still the vector similarity, also for chunks only the lexical side found.
+    where_sql, filter_params = _filter_sql(filters)
+    sql = text(f"""
+        WITH q AS (
+            SELECT CAST(:embedding AS vector) AS v,
+                   replace(plainto_tsquery('english', :query_text)::text, '&', '|')::tsquery AS terms
+        ),
+        vector_hits AS (
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank
+            FROM ({ann_candidates_sql("(SELECT v FROM q)", where_sql, ":candidates")}
+            ) v
+        ),
+        lexical_hits AS (
+            SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+            FROM (
+                SELECT c.id, ts_rank_cd(c.content_tsv, q.terms) as score
+                FROM chunks c, q
+                WHERE c.content_tsv @@ q.terms AND {where_sql}
+                ORDER BY score DESC
+                LIMIT :candidates
+            ) l
+        ),
+        fused AS (
+            SELECT coalesce(v.id, l.id) as id,
+                   coalesce(1.0 / (:rrf_k + v.rank), 0) + coalesce(1.0 / (:rrf_k + l.rank), 0) as rrf_score
+            FROM vector_hits v
+            FULL OUTER JOIN lexical_hits l ON v.id = l.id
+            ORDER BY rrf_score DESC
+            LIMIT :k
+        )
+        SELECT c.id, c.content, {similarity_sql(f"c.embedding {DISTANCE_OPERATOR} (SELECT v FROM q)")} as similarity,
+               d.name as document_name, f.rrf_score
+        FROM fused f
+        JOIN chunks c ON c.id = f.id
         JOIN documents d ON c.document_id = d.id
-        ORDER BY c.embedding <=> :embedding
-        LIMIT :k
+        ORDER BY f.rrf_score DESC
     """)
-    
-    result = db.execute(sql, {"embedding": embedding_str, "k": k})
-    return result.fetchall()
 
-def generate_response(query, chunks):
-    """Generate a response based on the query and retrieved chunks using LLM"""
+    # HNSW returns at most ef_search rows, so make room for the whole candidate list
+    settings = _ef_search_statement(_ann_ef_search(ef_search, HYBRID_CANDIDATES), filtered=bool(filter_params))
+    return settings, sql, {
+        "embedding": np.asarray(embedding, dtype=np.float32),
+        "query_text": query_text,
+        "candidates": HYBRID_CANDIDATES,
+        "rrf_k": HYBRID_RRF_K,
+        "k": k,
+        **filter_params,
+    }
+
+def _hybrid_search(db, query_text, embedding, k, ef_search=None, filters=None):
+    return _run_search(db, *_hybrid_search_query(query_text, embedding, k, ef_search, filters))
+
+async def _hybrid_search_async(db, query_text, embedding, k, ef_search=None, filters=None):
+    return await _run_search_async(db, *_hybrid_search_query(query_text, embedding, k, ef_search, filters))
+
+def _run_search(db, settings, sql, params):
+    if settings is not None:
+        db.execute(*settings)
+    return db.execute(sql, params).fetchall()
+
+async def _run_search_async(db, settings, sql, params):
+    if settings is not None:
+        await db.execute(*settings)
+    return (await db.execute(sql, params)).fetchall()
+
+def _ann_ef_search(ef_search, k):
+    """
+    ef_search for a query that needs k rows: HNSW returns at most ef_search
+    rows, so it is raised to the size of the (possibly over-fetched) candidate
+    list when the requested or configured value is smaller.
+    """
+    ef_search = ef_search or HNSW_EF_SEARCH
+    needed = coarse_limit(k)
+    if ef_search is None and needed <= 40:  # pgvector's default hnsw.ef_search
+        return None
+    return max(ef_search or 0, needed)
+
+def _set_ef_search(db, ef_search, filtered=False):
+    """
+    HNSW settings for this transaction only. ef_search is the candidate list
+    size (higher = better recall, slower query). Filtered queries also turn on
+    iterative scans so the index keeps searching until k rows pass the filter.
+    """
+    settings = _ef_search_statement(ef_search, filtered)
+    if settings is not None:
+        db.execute(*settings)
+
+def _ef_search_statement(ef_search, filtered=False):
+    """(statement, params) applying the settings of _set_ef_search, or None if there are none"""
+    settings = {}
+    if ef_search:
+        settings["hnsw.ef_search"] = str(ef_search)
+    if filtered and HNSW_ITERATIVE_SCAN != "off":
+        settings["hnsw.iterative_scan"] = HNSW_ITERATIVE_SCAN
+        if HNSW_MAX_SCAN_TUPLES:
+            settings["hnsw.max_scan_tuples"] = str(HNSW_MAX_SCAN_TUPLES)
+    if settings:
+        # One round trip for all of them
+        calls = ", ".join(f"set_config(:name_{i}, :value_{i}, true)" for i in range(len(settings)))
+        params = {}
+        for i, (name, value) in enumerate(settings.items()):
+            params[f"name_{i}"], params[f"value_{i}"] = name, value
+        return text(f"SELECT {calls}"), params
+    return None
+
+def pack_context(chunks):
+    """Fits the retrieved chunks into the prompt token budget; see context_packer.py"""
+    return get_context_packer().pack(chunks)
+
+# An answer and whether the LLM produced it (False for the fallback, error and no-context messages)
+GeneratedAnswer = namedtuple("GeneratedAnswer", ["text", "from_llm"])
+
+def is_cacheable_response(answer, chunks):
+    """Only real LLM answers go into the answer cache, never the fallback or error messages"""
+    return bool(chunks) and answer.from_llm
+
+# Bounds the number of LLM calls in flight from /chat/batch in this worker
+_generation_pool = ThreadPoolExecutor(max_workers=BATCH_LLM_CONCURRENCY, thread_name_prefix="llm")
+
+NO_CONTEXT_RESPONSE = "I couldn't find relevant information in the CUDA documentation to answer your question. Please try rephrasing your question or ask about a different CUDA topic."
+EMPTY_RESPONSE = "I encountered an issue generating a response. Please try again."
+
+def generate_responses(queries, contexts):
+    """generate_response for many queries, at most BATCH_LLM_CONCURRENCY at a time, results in input order"""
+    return list(_generation_pool.map(generate_response, queries, contexts))
+
+def generate_response(query, context):
+    """
+    Generate a response based on the query and the packed context (see
+    pack_context) using LLM, as a GeneratedAnswer. LLM failures are answered
+    with a fallback built from the top chunk.
+    """
+    chunks = context.chunks
+    llm_client, model_name, api_provider = get_llm()
     if not chunks:
-        return "I couldn't find relevant information in the CUDA documentation to answer your question. Please try rephrasing your question or ask about a different CUDA topic."
+        return GeneratedAnswer(NO_CONTEXT_RESPONSE, False)
     
     if not llm_client:
         # Fallback to simple response if LLM client is not available
-        context = chunks[0][1]  # content from first chunk
-        document_name = chunks[0][4] if len(chunks[0]) > 4 else "CUDA Documentation"
-        fallback_response = f"⚠️ LLM not available. Based on the CUDA documentation: {context[:500]}..." if len(context) > 500 else f"⚠️ LLM not available. Based on the CUDA documentation: {context}"
-        return fallback_response + f"\n\n*Source: {document_name}*"
-    
-    # Format the retrieved chunks as context and collect document names
-    context_parts = []
-    document_names = set()
-    for i, chunk_data in enumerate(chunks, 1):
-        chunk_id = chunk_data[0]
-        content = chunk_data[1]
-        similarity = chunk_data[3] if len(chunk_data) > 3 else 0
-        document_name = chunk_data[4] if len(chunk_data) > 4 else "Unknown Document"
+        return GeneratedAnswer(_fallback_response(chunks, "LLM not available"), False)
+
+    try:
+        # Generate response using the LLM
+        response = get_completion(
+            prompt=_prompt(query, context),
+            client=llm_client,
+            model_name=model_name,
+            api_provider=api_provider,
+            temperature=0.3,  # Lower temperature for more consistent technical answers
+            raise_errors=True
+        )
         
-        document_names.add(document_name)
-        context_parts.append(f"[Context {i}] (Relevance: {similarity:.3f})\n{content}\n")
-    
-    context_text = "\n".join(context_parts)
-    
-    # Create the prompt for the LLM
-    prompt = f"""You are a CUDA expert. Answer the user's question concisely based on the provided documentation context.
+    except Exception as e:
+        print(f"Error generating LLM response: {e}")
+        # Fallback to simple response
+        return GeneratedAnswer(_fallback_response(chunks, "LLM error occurred"), False)
+    return _llm_answer(response, chunks)
+
+async def generate_response_async(query, context):
+    """generate_response with the asyncio LLM client; the event loop is free while the LLM answers"""
+    chunks = context.chunks
+    llm_client, model_name, api_provider = get_async_llm()
+    if not chunks:
+        return GeneratedAnswer(NO_CONTEXT_RESPONSE, False)
+
+    if not llm_client:
+        return GeneratedAnswer(_fallback_response(chunks, "LLM not available"), False)
+
+    try:
+        response = await get_completion_async(
+            prompt=_prompt(query, context),
+            client=llm_client,
+            model_name=model_name,
+            api_provider=api_provider,
+            temperature=0.3,
+            raise_errors=True
+        )
+
+    except Exception as e:
+        print(f"Error generating LLM response: {e}")
+        return GeneratedAnswer(_fallback_response(chunks, "LLM error occurred"), False)
+    return _llm_answer(response, chunks)
+
+def _llm_answer(response, chunks):
+    if not response:
+        return GeneratedAnswer(EMPTY_RESPONSE, False)
+    return GeneratedAnswer(response + source_line(chunks), True)
+
+async def stream_response_async(query, context):
+    """
+    generate_response_async as an async generator of GeneratedAnswer pieces,
+    passed on as the LLM produces them; the source line comes last. The
+    fallback answers cover failures before the first piece. A failure after
+    it is raised, since the caller already sent part of the answer.
+    """
+    chunks = context.chunks
+    llm_client, model_name, api_provider = get_async_llm()
+    if not chunks:
+        yield GeneratedAnswer(NO_CONTEXT_RESPONSE, False)
+        return
+
+    if not llm_client:
+        yield GeneratedAnswer(_fallback_response(chunks, "LLM not available"), False)
+        return
+
+    started = False
+    try:
+        async for piece in stream_completion_async(
+            prompt=_prompt(query, context),
+            client=llm_client,
+            model_name=model_name,
+            api_provider=api_provider,
+            temperature=0.3
+        ):
+            started = True
+            yield GeneratedAnswer(piece, True)
+    except Exception as e:
+        print(f"Error streaming LLM response: {e}")
+        if started:
+            raise
+        yield GeneratedAnswer(_fallback_response(chunks, "LLM error occurred"), False)
+        return
+    yield GeneratedAnswer(source_line(chunks), True) if started else GeneratedAnswer(EMPTY_RESPONSE, False)
+
+def _prompt(query, context):
+    # The packer already formatted the context
+    return f"""You are a CUDA expert. Answer the user's question concisely based on the provided documentation context.
 
 CONTEXT FROM CUDA DOCUMENTATION:
-{context_text}
+{context.text}
 
 USER QUESTION: {query}
 
@@ -82,39 +601,20 @@ INSTRUCTIONS:
 
 ANSWER:"""
 
-    try:
-        # Generate response using the LLM
-        response = get_completion(
-            prompt=prompt,
-            client=llm_client,
-            model_name=model_name,
-            api_provider=api_provider,
-            temperature=0.3  # Lower temperature for more consistent technical answers
-        )
-        
-        if response:
-            # Add source attribution line with actual document names
-            doc_list = sorted(list(document_names))
-            if len(doc_list) == 1:
-                source_line = f"\n\n*Source: {doc_list[0]}*"
-            else:
-                # Show up to 3 document names, then "and X more" if there are many
-                if len(doc_list) <= 3:
-                    doc_names_str = ", ".join(doc_list)
-                    source_line = f"\n\n*Sources: {doc_names_str}*"
-                else:
-                    first_docs = ", ".join(doc_list[:2])
-                    remaining = len(doc_list) - 2
-                    source_line = f"\n\n*Sources: {first_docs} and {remaining} more*"
-            
-            return response + source_line
-        else:
-            return "I encountered an issue generating a response. Please try again."
-        
-    except Exception as e:
-        print(f"Error generating LLM response: {e}")
-        # Fallback to simple response
-        context = chunks[0][1]
-        document_name = chunks[0][4] if len(chunks[0]) > 4 else "CUDA Documentation"
-        fallback_response = f"⚠️ LLM error occurred. Based on the CUDA documentation: {context[:500]}..." if len(context) > 500 else f"⚠️ LLM error occurred. Based on the CUDA documentation: {context}"
-        return fallback_response + f"\n\n*Source: {document_name}*"
\ No newline at end of file
+def source_line(chunks):
+    """Source attribution line with the actual document names, appended to LLM answers"""
+    doc_list = sorted(set(chunk_data.document_name or "Unknown Document" for chunk_data in chunks))
+    if len(doc_list) == 1:
+        return f"\n\n*Source: {doc_list[0]}*"
+    # Show up to 3 document names, then "and X more" if there are many
+    if len(doc_list) <= 3:
+        return f"\n\n*Sources: {', '.join(doc_list)}*"
+    first_docs = ", ".join(doc_list[:2])
+    remaining = len(doc_list) - 2
+    return f"\n\n*Sources: {first_docs} and {remaining} more*"
+
+def _fallback_response(chunks, reason):
+    context = chunks[0].content
+    document_name = chunks[0].document_name or "CUDA Documentation"
+    fallback_response = f"⚠️ {reason}. Based on the CUDA documentation: {context[:500]}..." if len(context) > 500 else f"⚠️ {reason}. Based on the CUDA documentation: {context}"
+    return fallback_response + f"\n\n*Source: {document_name}*"
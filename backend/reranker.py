@@ -0,0 +1,87 @@
+# backend/reranker.py
+"""
+Cross-encoder reranking between retrieval and generation.
+
+Retrieval over-fetches candidates, a small cross-encoder scores every
+(query, chunk) pair on the CPU in mini-batches, and only the best few go to
+the LLM. Scoring stops as soon as the next mini-batch would not fit in the
+latency budget (judged from a moving average of past batch times); chunks
+that were not scored keep their retrieval order behind the scored ones.
+"""
+import threading
+import time
+
+
+class Reranker:
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=8, budget_ms=150.0, max_candidates=50):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.max_candidates = max_candidates
+        self._model = None
+        self._lock = threading.Lock()
+        # Requests are reranked concurrently on executor threads; guards the counters and _batch_ms
+        self._stats_lock = threading.Lock()
+        self._batch_ms = None  # moving average of one mini-batch
+        self.requests = 0
+        self.budget_cutoffs = 0
+
+    @property
+    def model(self):
+        # Loaded on first use so the backend starts without it when reranking is off
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                    print(f"   🎯 Reranker loaded: {self.model_name}")
+        return self._model
+
+    def rerank(self, query, chunks, top_n=3):
+        """
+        Returns the `top_n` best chunks for `query`.
+
+        Args:
+            query: The user's question.
+            chunks: Retrieved rows with a `content` attribute, best first.
+            top_n: How many chunks to keep.
+        """
+        chunks = list(chunks)[:self.max_candidates]
+        if len(chunks) <= 1:
+            return chunks[:top_n]
+
+        model = self.model
+        start = time.perf_counter()
+        scores = []
+        cutoff = False
+        for offset in range(0, len(chunks), self.batch_size):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            expected_ms = self._batch_ms
+            if scores and expected_ms is not None and elapsed_ms + expected_ms > self.budget_ms:
+                cutoff = True
+                break
+            batch = chunks[offset:offset + self.batch_size]
+            batch_start = time.perf_counter()
+            scores.extend(model.predict([(query, chunk.content) for chunk in batch], batch_size=self.batch_size))
+            batch_ms = (time.perf_counter() - batch_start) * 1000
+            with self._stats_lock:
+                self._batch_ms = batch_ms if self._batch_ms is None else 0.8 * self._batch_ms + 0.2 * batch_ms
+        with self._stats_lock:
+            self.requests += 1
+            self.budget_cutoffs += cutoff
+
+        scored = sorted(range(len(scores)), key=lambda i: -float(scores[i]))
+        unscored = list(range(len(scores), len(chunks)))
+        return [chunks[i] for i in (scored + unscored)[:top_n]]
+
+    def stats(self):
+        with self._stats_lock:
+            requests, budget_cutoffs, batch_ms = self.requests, self.budget_cutoffs, self._batch_ms
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "requests": requests,
+            "budget_ms": self.budget_ms,
+            "budget_cutoffs": budget_cutoffs,
+            "avg_batch_ms": round(batch_ms, 2) if batch_ms is not None else None,
+        }
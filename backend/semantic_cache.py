@@ -0,0 +1,101 @@
+# backend/semantic_cache.py
+"""
+Semantic answer cache for /chat.
+
+Answers are stored together with the embedding of the question that produced
+them. A new question whose embedding is within `threshold` cosine similarity
+of a cached one gets the stored answer and citations back, so neither
+retrieval nor the LLM runs. Every entry belongs to a corpus version (the
+chunks table watermark); as soon as a lookup or store sees a different
+version, i.e. after a re-ingestion, the whole cache is dropped.
+
+The index is a preallocated float32 matrix of unit-length embeddings, so a
+lookup is a single matrix-vector product. When full, the least recently used
+entry is replaced.
+"""
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+CachedAnswer = namedtuple("CachedAnswer", ["query", "response", "citations", "similarity"])
+
+
+class SemanticCache:
+    def __init__(self, dim=384, threshold=0.97, maxsize=512):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((maxsize, dim), dtype=np.float32)
+        self._entries = [None] * maxsize  # slot -> (scope, query, response, citations)
+        self._last_used = np.full(maxsize, -np.inf)
+        self._corpus_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, embedding, corpus_version, scope=None):
+        """
+        Returns the closest cached answer above the similarity threshold, or None.
+
+        `scope` keys request options that change the answer (filters, retrieval
+        mode, ...); only entries stored under the same scope can match.
+        """
+        query = _unit(embedding)
+        with self._lock:
+            self._check_version(corpus_version)
+            scores = self._matrix @ query
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry is not None and entry[0] == scope:
+                    self._last_used[slot] = time.monotonic()
+                    self.hits += 1
+                    return CachedAnswer(entry[1], entry[2], list(entry[3]), float(scores[slot]))
+            self.misses += 1
+            return None
+
+    def store(self, embedding, corpus_version, query, response, citations, scope=None):
+        with self._lock:
+            self._check_version(corpus_version)
+            slot = int(np.argmin(self._last_used))
+            self._matrix[slot] = _unit(embedding)
+            self._entries[slot] = (scope, query, response, tuple(citations))
+            self._last_used[slot] = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": sum(entry is not None for entry in self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _check_version(self, corpus_version):
+        corpus_version = tuple(corpus_version)
+        if corpus_version != self._corpus_version:
+            if self._corpus_version is not None:
+                self._clear()
+            self._corpus_version = corpus_version
+
+    def _clear(self):
+        self._matrix[:] = 0.0
+        self._entries = [None] * self.maxsize
+        self._last_used[:] = -np.inf
+        self.invalidations += 1
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
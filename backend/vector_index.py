@@ -0,0 +1,218 @@
+# backend/vector_index.py
+"""
+In-process vector index over the `chunks` table.
+
+Chunk embeddings are stored as one contiguous float32 matrix in a snapshot
+file on disk and memory-mapped back in, so every worker process on a host
+shares the same pages through the OS page cache. Queries are answered with an
+exact top-k in NumPy, no database round trip involved.
+
+The snapshot records the watermark of the `chunks` table it was built from
+(row count and highest id). Callers hand `sync` a way to read the current
+watermark and a way to stream the rows; the index rebuilds its snapshot when
+the two disagree. The module has no database dependency of its own, so both
+the SQLAlchemy backend and the psycopg2 dan_app can drive it.
+
+Workers that find their snapshot out of date first look for a current one
+written by another worker; only one worker at a time (an exclusive lock on a
+file next to the manifest) rebuilds.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+# Same column layout as the rows returned by the pgvector query in rag.py, so
+# callers can use either engine interchangeably.
+ChunkHit = namedtuple("ChunkHit", ["id", "content", "similarity", "document_name"])
+
+
+class MmapVectorIndex:
+    """
+    Exact top-k over a memory-mapped snapshot of chunk embeddings.
+
+    `metric` follows config.VECTOR_DISTANCE and similarities are scored the
+    same way config.similarity_sql scores them in Postgres.
+    """
+
+    def __init__(self, directory, name="chunks", refresh_seconds=30.0, metric="cosine"):
+        if metric not in ("cosine", "l2", "inner_product"):
+            raise ValueError(f"Unsupported metric '{metric}'")
+        self.directory = directory
+        self.name = name
+        self.refresh_seconds = refresh_seconds
+        self.metric = metric
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._watermark = None
+        self._tag = None
+        self._ids = None
+        self._matrix = None
+        self._norms = None
+        self._contents = None
+        self._document_names = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, f"{self.name}-manifest.json")
+
+    def __len__(self):
+        return 0 if self._ids is None else len(self._ids)
+
+    def _is_stale(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.refresh_seconds
+
+    def sync(self, fetch_watermark, fetch_rows):
+        """
+        Bring the index in line with the chunks table.
+
+        Args:
+            fetch_watermark: Callable returning the current (row count, max id)
+                of the chunks table.
+            fetch_rows: Callable returning an iterable of
+                (id, content, embedding, document_name) for every chunk.
+
+        The watermark is only consulted every `refresh_seconds`, so most
+        queries never touch the database.
+        """
+        if not self._is_stale():
+            return
+        with self._lock:
+            if not self._is_stale():
+                return
+            watermark = [int(v) for v in fetch_watermark()]
+            if self._watermark != watermark:
+                # Another worker may already have written a current snapshot
+                self._load()
+            if self._watermark != watermark:
+                with self._build_lock():
+                    # It may also have finished one while we waited for the lock
+                    self._load()
+                    if self._watermark != watermark:
+                        self._build(watermark, fetch_rows())
+                        self._load()
+            self._checked_at = time.monotonic()
+
+    def search(self, query_embedding, k=5):
+        """Return the k chunks closest to `query_embedding`, best first."""
+        if not len(self):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self._matrix @ query
+        if self.metric == "cosine":
+            scores = scores / (self._norms * max(float(np.linalg.norm(query)), 1e-12))
+        elif self.metric == "l2":
+            # ||x - q|| from the cached row norms, without materialising x - q
+            scores = -np.sqrt(np.maximum(self._norms ** 2 - 2 * scores + float(query @ query), 0.0))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            ChunkHit(
+                int(self._ids[i]),
+                self._contents[i],
+                float(scores[i]),
+                self._document_names[i],
+            )
+            for i in top
+        ]
+
+    def _build(self, watermark, rows):
+        """Write a fresh snapshot and atomically point the manifest at it."""
+        ids, embeddings, contents, document_names = [], [], [], []
+        for chunk_id, content, embedding, document_name in rows:
+            ids.append(chunk_id)
+            # pgvector's psycopg2 adapter returns Vector objects in recent versions, numpy arrays in older ones
+            if hasattr(embedding, "to_numpy"):
+                embedding = embedding.to_numpy()
+            embeddings.append(np.asarray(embedding, dtype=np.float32))
+            contents.append(content)
+            document_names.append(document_name)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tag = uuid.uuid4().hex[:12]
+        matrix = np.vstack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        np.save(self._path("embeddings", tag, "npy"), np.ascontiguousarray(matrix, dtype=np.float32))
+        np.save(self._path("ids", tag, "npy"), np.asarray(ids, dtype=np.int64))
+        with open(self._path("chunks", tag, "json"), "w", encoding="utf-8") as f:
+            json.dump({"contents": contents, "document_names": document_names}, f)
+
+        previous = self._read_manifest()
+        tmp_manifest = f"{self.manifest_path}.{tag}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump({"tag": tag, "watermark": watermark, "count": len(ids)}, f)
+        os.replace(tmp_manifest, self.manifest_path)
+        print(f"📦 Vector index snapshot '{self.name}' rebuilt: {len(ids)} chunks")
+
+        # Other workers may still have the old files mapped; on POSIX the
+        # pages stay valid until they drop them.
+        if previous and previous.get("tag") != tag:
+            for kind, ext in (("embeddings", "npy"), ("ids", "npy"), ("chunks", "json")):
+                try:
+                    os.remove(self._path(kind, previous["tag"], ext))
+                except OSError:
+                    pass
+
+    def _load(self):
+        """Memory-map the snapshot named by the manifest, if there is one."""
+        manifest = self._read_manifest()
+        if not manifest or manifest["tag"] == self._tag:
+            return
+        tag = manifest["tag"]
+        matrix = np.load(self._path("embeddings", tag, "npy"), mmap_mode="r")
+        ids = np.load(self._path("ids", tag, "npy"))
+        with open(self._path("chunks", tag, "json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+
+        self._matrix = matrix
+        self._ids = ids
+        self._norms = np.maximum(np.linalg.norm(matrix, axis=1), 1e-12) if len(ids) else np.zeros(0, dtype=np.float32)
+        self._contents = chunks["contents"]
+        self._document_names = chunks["document_names"]
+        self._watermark = manifest["watermark"]
+        self._tag = tag
+
+    @contextmanager
+    def _build_lock(self):
+        """Exclusive lock across the processes sharing this snapshot, held while one of them rebuilds it"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{self.name}-build.lock"), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:  # LK_LOCK gives up after 10 seconds
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _path(self, kind, tag, ext):
+        return os.path.join(self.directory, f"{self.name}-{kind}-{tag}.{ext}")
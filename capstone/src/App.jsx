@@ -21,8 +21,15 @@ function App() {
     const loadingMsg = { sender: 'bot', text: '🤔 Searching CUDA documentation...', isLoading: true };
     setMessages((msgs) => [...msgs, loadingMsg]);
     
+    // Updates the answer being streamed into the loading message
+    const updateAnswer = (update) => {
+      setMessages((msgs) => msgs.map(msg => (msg.isLoading ? { ...msg, ...update(msg) } : msg)));
+      chatEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    };
+
     try {
-      const response = await fetch('http://localhost:8000/chat', {
+      // Server-sent events: citations once retrieval is done, then the answer token by token
+      const response = await fetch('http://localhost:8000/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -37,19 +44,44 @@ function App() {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      
-      // Remove loading message and add real response
-      setMessages((msgs) => {
-        const filteredMsgs = msgs.filter(msg => !msg.isLoading);
-        return [...filteredMsgs, { 
-          sender: 'bot', 
-          text: data.response,
-          citations: data.citations || [],
-          sessionId: data.session_id,
-          interactionId: data.interaction_id
-        }];
-      });
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamError = null;
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Events are separated by a blank line; the last part may still be incomplete
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          let event = 'message';
+          let data = '';
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          }
+          if (!data) continue;
+          const payload = JSON.parse(data);
+          if (event === 'citations') {
+            updateAnswer(() => ({ text: '', citations: payload.citations || [], sessionId: payload.session_id }));
+          } else if (event === 'token') {
+            updateAnswer((msg) => ({ text: msg.text + payload.text }));
+          } else if (event === 'done') {
+            updateAnswer(() => ({ interactionId: payload.interaction_id }));
+          } else if (event === 'error') {
+            streamError = payload.detail;
+          }
+        }
+      }
+
+      // The answer is complete: it stops being the loading message
+      setMessages((msgs) => msgs.map(msg => {
+        if (!msg.isLoading) return msg;
+        const text = streamError ? `${msg.text}\n\n❌ The answer was interrupted: ${streamError}` : msg.text;
+        return { ...msg, text, isLoading: false };
+      }));
       
     } catch (error) {
       console.error('Error calling backend:', error);
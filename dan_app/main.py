@@ -1,7 +1,8 @@
 import os
 import sys
-from typing import List
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from datetime import datetime
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import uvicorn
@@ -13,7 +14,8 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from dan_app.scripts.database import initialize_database, get_db_connection, ingest_pdf
+from dan_app.scripts.database import initialize_database, verify_vector_index, get_db_connection
+from dan_app.scripts.ingest_jobs import enqueue_job, get_job
 from dan_app.rag_workflow import runnable_graph
 
 def generate_database():
@@ -34,6 +36,7 @@ async def lifespan(app: FastAPI):
     """
     print("--- Application starting up... ---")
     initialize_database() # Automatically initializes DB on app start
+    verify_vector_index() # Refuses to start if the HNSW index doesn't match the query operator
     yield
     print("--- Application shutting down... ---")
 
@@ -47,6 +50,24 @@ app = FastAPI(
 class IngestRequest(BaseModel):
     """Request model for the /ingest endpoint."""
     file_path: str
+    version: Optional[str] = Field(None, description="Document version. A new version of an ingested document is re-ingested incrementally.")
+
+class IngestJobResponse(BaseModel):
+    """Status and per-stage progress of an ingestion job."""
+    id: int
+    file_path: str
+    version: Optional[str] = None
+    status: str  # queued, running, done or failed
+    document_id: Optional[int] = None
+    pages_parsed: int
+    chunks_embedded: int
+    rows_written: int
+    attempts: int
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 class ChatRequest(BaseModel):
     """Request model for the /chat endpoint."""
@@ -65,10 +86,13 @@ async def read_root():
     return {"message": "Welcome to the CUDA-Assist API. The database has been initialized."}
 
 @app.post("/ingest", status_code=202, summary="Trigger PDF Ingestion")
-async def trigger_ingestion(request: IngestRequest, background_tasks: BackgroundTasks):
+async def trigger_ingestion(request: IngestRequest):
     """
-    Accepts a file path and triggers the document ingestion process in the background,
-    if the document has not already been ingested.
+    Accepts a file path and queues an ingestion job for it, if the document has not
+    already been ingested. A document that was ingested under another version is
+    re-ingested incrementally: only changed chunks are embedded and written.
+    The job is run by the ingestion workers (python -m dan_app.scripts.ingest_jobs),
+    never by the API process; poll GET /ingest/{job_id} for its progress.
     """
     if not os.path.exists(request.file_path):
         raise HTTPException(status_code=404, detail=f"File not found at: {request.file_path}")
@@ -80,16 +104,39 @@ async def trigger_ingestion(request: IngestRequest, background_tasks: Background
 
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id FROM documents WHERE name = %s", (doc_name,))
-            if cur.fetchone():
+            cur.execute("SELECT id, version FROM documents WHERE name = %s ORDER BY id LIMIT 1", (doc_name,))
+            existing = cur.fetchone()
+            if existing and (request.version is None or request.version == existing[1]):
                 return JSONResponse(status_code=200, content={"message": "Document has already been ingested."})
+        job_id = enqueue_job(conn, request.file_path, request.version)
+        conn.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database check failed: {e}")
     finally:
         conn.close()
 
-    background_tasks.add_task(ingest_pdf, request.file_path)
-    return {"message": "Document ingestion process started in the background.", "file_path": request.file_path}
+    if existing:
+        message = f"Re-ingestion of version {request.version} (was {existing[1]}) queued."
+    else:
+        message = "Document ingestion queued."
+    return {"message": message, "job_id": job_id, "file_path": request.file_path}
+
+@app.get("/ingest/{job_id}", response_model=IngestJobResponse, summary="Ingestion Job Status")
+async def ingestion_status(job_id: int):
+    """
+    Returns the status of an ingestion job and its progress: pages parsed,
+    chunks embedded and rows written so far.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise HTTPException(status_code=503, detail="Database connection could not be established.")
+    try:
+        job = get_job(conn, job_id)
+    finally:
+        conn.close()
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found.")
+    return IngestJobResponse(**job)
 
 @app.post("/chat", response_model=ChatResponse, summary="Chat with the RAG system")
 async def chat_with_rag(request: ChatRequest):
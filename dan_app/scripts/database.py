@@ -1,18 +1,48 @@
 import os
 import psycopg2
-import fitz  # PyMuPDF
-from sentence_transformers import SentenceTransformer
-import numpy as np
+from psycopg2.extras import Json, execute_values
 from pgvector.psycopg2 import register_vector
 from dotenv import load_dotenv
 
+from backend.config import (
+    RETRIEVAL_ENGINE, VECTOR_INDEX_DIR, VECTOR_INDEX_REFRESH_SECONDS,
+    VECTOR_DISTANCE, HNSW_INDEX_NAME, HNSW_EF_SEARCH,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL_SECONDS,
+    INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, INGEST_EMBEDDING_CACHE, EMBEDDING_MODEL_KEY,
+    check_hnsw_indexdef, ann_candidates_sql, coarse_limit, load_embedder, load_parallel_embedder,
+    load_chunk_writer, load_deduplicator,
+)
+from backend.vector_index import MmapVectorIndex
+from backend.migrations import apply_migrations, apply_vector_storage
+from backend.embedding_cache import EmbeddingCache
+from backend.embedding_store import EmbeddingStore
+from backend.bulk_load import use_bulk_load, deferred_ann_index
+from backend.dedup import write_sources
+from backend.ingest_pipeline import iter_pdf_pages, iter_paragraph_chunks, prefetch, embed_stream, ChunkDiff, IngestProgress
+
 # Load a pre-trained model for generating embeddings.
 # This model is loaded once when the module is imported, which is efficient for background tasks.
 print("--- Loading embedding model (this may take a moment on first run)... ---")
 # Note: Postgres with the pgvector extension functions as a vector database.
 # The EMBEDDING_MODEL variable was a duplicate and has been removed.
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-print("--- Embedding model loaded successfully. ---")
+embedding_model = load_embedder()  # shared with the backend; EMBEDDING_BACKEND picks torch / onnx / onnx-int8
+print(f"--- Embedding model loaded successfully: {embedding_model.describe()} ---")
+
+# Query embeddings are cached so repeated questions (modulo case and whitespace) skip the encoder.
+query_embeddings = EmbeddingCache(
+    embedding_model.encode, maxsize=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS
+)
+
+# Ingestion shards chunk batches over INGEST_WORKERS processes (started on the first ingestion and
+# kept for the next ones); with a single worker it reuses embedding_model in-process.
+ingest_embedder = load_parallel_embedder(embedder=embedding_model)
+
+# In-process index used instead of Postgres when RETRIEVAL_ENGINE=mmap.
+# It gets its own snapshot name because this app talks to a different database than the backend.
+vector_index = (
+    MmapVectorIndex(VECTOR_INDEX_DIR, name="dan_app_chunks", refresh_seconds=VECTOR_INDEX_REFRESH_SECONDS, metric=VECTOR_DISTANCE)
+    if RETRIEVAL_ENGINE == "mmap" else None
+)
 
 def get_db_connection():
     """
@@ -38,13 +68,56 @@ def get_db_connection():
         print("👉 Please ensure your Postgres server is running and your .env file is configured correctly.")
         return None
 
-def ingest_pdf(file_path: str):
+def ingest_pdf(file_path: str, version: str | None = None, progress: IngestProgress | None = None) -> int:
+    """
+    Ingests a PDF (see _ingest_pdf). Large new documents (INGEST_BULK_LOAD) are loaded in
+    bulk mode: the HNSW index is dropped during the load and rebuilt concurrently afterwards.
+    Re-ingestions only touch changed chunks and always keep the index.
+    """
+    bulk = use_bulk_load(os.path.getsize(file_path)) and not _document_exists(os.path.basename(file_path))
+    if not bulk:
+        return _ingest_pdf(file_path, version, progress)
+    index_conn = get_db_connection()
+    if index_conn is None:
+        raise ConnectionError(f"Could not connect to the database for ingestion of {file_path}.")
+    try:
+        with deferred_ann_index(index_conn):
+            return _ingest_pdf(file_path, version, progress)
+    finally:
+        index_conn.close()
+
+def _document_exists(doc_name: str) -> bool:
+    conn = get_db_connection()
+    if conn is None:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM documents WHERE name = %s LIMIT 1;", (doc_name,))
+            return cur.fetchone() is not None
+    finally:
+        conn.close()
+
+def _ingest_pdf(file_path: str, version: str | None = None, progress: IngestProgress | None = None) -> int:
     """
     Processes a PDF file, chunks its text, generates embeddings,
     and stores everything in the database in a single transaction.
 
+    If a document with the same name was ingested before under a different
+    version, it is updated in place: the new chunks are diffed against the
+    stored ones by content hash, only new or changed chunks are embedded and
+    inserted, chunks that are gone are deleted, and unchanged chunks keep
+    their rows (and the citations pointing at them).
+
     Args:
         file_path (str): The absolute path to the PDF file to be ingested.
+        version (str | None): Version of the document, stored in documents.version.
+        progress (IngestProgress | None): Receives pages parsed, chunks embedded and rows written.
+
+    Returns:
+        int: The document ID.
+
+    Raises:
+        Exception: Whatever made the ingestion fail, after rolling the transaction back.
     """
     print(f"--- Starting ingestion process for: {file_path} ---")
     doc_name = os.path.basename(file_path)
@@ -53,71 +126,121 @@ def ingest_pdf(file_path: str):
         # 1. Get a fresh database connection for this background task
         conn = get_db_connection()
         if conn is None:
-            print(f"CRITICAL: Could not connect to the database for ingestion of {doc_name}.")
-            return
+            raise ConnectionError(f"Could not connect to the database for ingestion of {doc_name}.")
 
         with conn.cursor() as cur:
-            # 2. Insert the main document record and get its unique ID
-            print(f"Inserting document record for '{doc_name}'...")
-            # The check for existing documents is handled in main.py before calling this function.
-            # The ON CONFLICT clause is removed as the 'name' column in the schema lacks a UNIQUE constraint.
-            # For production, adding a UNIQUE constraint to the schema is the recommended approach.
+            # 2. Find the existing document record (locked, so two re-ingestions of the same document
+            # run one after the other), or insert the main document record and get its unique ID.
+            # The 'name' column in the schema lacks a UNIQUE constraint; main.py checks for existing
+            # documents before calling this function.
             cur.execute(
-                "INSERT INTO documents (name, source_url) VALUES (%s, %s) RETURNING id;",
-                (doc_name, file_path)
+                "SELECT id, version FROM documents WHERE name = %s ORDER BY id LIMIT 1 FOR UPDATE;",
+                (doc_name,)
             )
-            document_id = cur.fetchone()[0]
-            print(f"Document '{doc_name}' has been assigned ID: {document_id}")
-
-            # 3. Extract text from the PDF using PyMuPDF
-            print(f"Extracting text from '{doc_name}'...")
-            doc = fitz.open(file_path)
-            full_text = "".join(page.get_text() for page in doc)
-            doc.close()
-            print(f"Extracted {len(full_text)} characters from the document.")
-
-            # 4. Chunk the text. A simple strategy is to split by paragraphs.
-            # We filter out very short chunks that are likely just whitespace or headings.
-            chunks = [p.strip() for p in full_text.split('\n\n') if len(p.strip()) > 100]
-            print(f"Split text into {len(chunks)} meaningful chunks.")
-
-            # 5. Generate embeddings for all text chunks in a single batch
-            print("Generating embeddings for all chunks (this may take some time)...")
-            embeddings = embedding_model.encode(chunks, show_progress_bar=True)
-            print("Embeddings generated successfully.")
-
-            # 6. Insert all chunks and their embeddings into the database
-            print(f"Inserting {len(chunks)} chunks and their embeddings into the database...")
-            for i, chunk_text in enumerate(chunks):
-                embedding_vector = embeddings[i]
+            existing = cur.fetchone()
+            diff = None
+            if existing:
+                document_id, old_version = existing
+                if version is None or version == old_version:
+                    print(f"Document '{doc_name}' version {old_version} is already ingested, nothing to do.")
+                    return document_id
+                print(f"Re-ingesting document ID {document_id} '{doc_name}': version {old_version} -> {version}")
+                cur.execute("SELECT id, content, metadata FROM chunks WHERE document_id = %s;", (document_id,))
+                diff = ChunkDiff(cur.fetchall())
                 cur.execute(
-                    """ -- Corrected to match schema: table 'chunks', column 'content'
-                    INSERT INTO chunks (document_id, content, embedding)
-                    VALUES (%s, %s, %s);
-                    """,
-                    (document_id, chunk_text, embedding_vector) # psycopg2 now understands this numpy array
+                    "UPDATE documents SET version = %s, source_url = %s, ingested_at = CURRENT_TIMESTAMP WHERE id = %s;",
+                    (version, file_path, document_id)
                 )
-            print(f"Successfully inserted {len(chunks)} chunks for document ID {document_id}.")
+            else:
+                print(f"Inserting document record for '{doc_name}'...")
+                cur.execute(
+                    "INSERT INTO documents (name, version, source_url) VALUES (%s, %s, %s) RETURNING id;",
+                    (doc_name, version, file_path)
+                )
+                document_id = cur.fetchone()[0]
+                print(f"Document '{doc_name}' has been assigned ID: {document_id}")
+
+            # 3./4. Stream the PDF page by page and split it into paragraph chunks as pages arrive.
+            # A background thread runs ahead of the embedding stage by at most INGEST_QUEUE_SIZE chunks.
+            # Short chunks (likely whitespace or headings) are filtered out.
+            print(f"Streaming text from '{doc_name}'...")
+            progress = progress or IngestProgress()
+            pages = progress.count_pages(iter_pdf_pages(file_path))
+            chunks = prefetch(iter_paragraph_chunks(pages), maxsize=INGEST_QUEUE_SIZE)
+            # Repeated headers, footers and reprinted code samples are collapsed into their first
+            # occurrence before anything is embedded
+            dedup = load_deduplicator()
+            if dedup:
+                chunks = dedup.filter(chunks)
+            if diff:
+                # Only chunks whose text isn't stored for this document yet go on to be embedded
+                chunks = diff.new_chunks(chunks)
+
+            # 5./6. Generate embeddings batch by batch on the worker pool and write each batch as it
+            # comes back (in order), while the workers are already encoding the following batches.
+            # Chunks embedded before (same text, same model) come from the embedding cache instead.
+            # Rows are streamed into the chunks table with COPY, INGEST_WRITE_BATCH_SIZE at a time.
+            print("Embedding and inserting chunks (this may take some time)...")
+            store = EmbeddingStore(EMBEDDING_MODEL_KEY, get_db_connection) if INGEST_EMBEDDING_CACHE else None
+            if store:
+                embed = lambda texts: store.map(cur, texts, ingest_embedder, INGEST_BATCH_SIZE)
+            else:
+                embed = ingest_embedder.map
+            writer = load_chunk_writer(cur)
+            for batch, embeddings in embed_stream(chunks, embed):
+                for chunk, embedding_vector in zip(batch, embeddings):
+                    writer.add(document_id, chunk.content, embedding_vector, {"page": chunk.page, "offset": chunk.offset})
+                progress.update(chunks_embedded=len(batch), rows_written=writer.rows_written)
+                print(f"  ...{progress.chunks_embedded} chunks embedded (page {batch[-1].page})")
+            writer.flush()
+            progress.update(rows_written=writer.rows_written)
+            print(f"Successfully inserted {writer.rows_written} chunks for document ID {document_id}.")
+            print(f"Ingestion throughput: {writer.summary()}")
+            if diff:
+                _apply_chunk_diff(cur, diff)
+                print(f"Re-ingestion of '{doc_name}': {diff.summary()}")
+            if dedup:
+                write_sources(cur, document_id, dedup)
+                print(f"Ingestion {dedup.summary()}")
+            if store:
+                print(f"Ingestion {store.summary()}")
 
         # 7. Commit the entire transaction to the database
         conn.commit()
         print(f"--- Ingestion complete and committed for: {doc_name} ---")
+        return document_id
 
     except Exception as e:
         print(f"CRITICAL: An error occurred during ingestion for {doc_name}: {e}")
         if conn:
             conn.rollback()  # Roll back the transaction on error
+        raise
     finally:
         if conn:
             conn.close()
 
-def query_vector_db(query_text: str, top_k: int = 5) -> list[str]:
+def _apply_chunk_diff(cur, diff):
+    """Deletes the chunks a new document version dropped and re-labels kept chunks that moved."""
+    stale_ids = diff.stale_ids()
+    if stale_ids:
+        # interaction_citations of deleted chunks go with them (ON DELETE CASCADE)
+        cur.execute("DELETE FROM chunks WHERE id = ANY(%s);", (stale_ids,))
+    if diff.moved:
+        execute_values(
+            cur,
+            "UPDATE chunks SET metadata = v.metadata::jsonb FROM (VALUES %s) AS v (id, metadata) WHERE chunks.id = v.id;",
+            [(chunk_id, Json(metadata)) for chunk_id, metadata in diff.moved]
+        )
+
+def query_vector_db(query_text: str, top_k: int = 5, ef_search: int | None = None) -> list[str]:
     """
     Queries the vector database to find the most relevant document chunks.
 
     Args:
         query_text (str): The user's query.
         top_k (int): The number of relevant chunks to retrieve.
+        ef_search (int | None): HNSW candidate list size for this query. Higher values
+            trade latency for recall; defaults to HNSW_EF_SEARCH or the server setting.
 
     Returns:
         list[str]: A list of the most relevant document chunk contents.
@@ -126,7 +249,7 @@ def query_vector_db(query_text: str, top_k: int = 5) -> list[str]:
     conn = None
     try:
         # 1. Generate embedding for the query
-        query_embedding = embedding_model.encode(query_text)
+        query_embedding = query_embeddings.encode(query_text)
 
         # 2. Get a database connection
         conn = get_db_connection()
@@ -134,15 +257,31 @@ def query_vector_db(query_text: str, top_k: int = 5) -> list[str]:
             print("CRITICAL: Could not connect to the database for querying.")
             return []
 
+        # 3a. Serve from the in-process index when enabled; fall through to pgvector on any failure
+        if vector_index is not None:
+            try:
+                vector_index.sync(lambda: _chunks_watermark(conn), lambda: _iter_chunk_rows(conn))
+                return [hit.content for hit in vector_index.search(query_embedding, top_k)]
+            except Exception as e:
+                print(f"WARNING: In-process vector index unavailable, falling back to pgvector: {e}")
+                conn.rollback()
+
         with conn.cursor() as cur:
-            # 3. Query for the most similar vectors using the cosine distance operator (<=>)
+            # 3b. Query for the most similar vectors using the configured distance operator and
+            # storage (quantized storage over-fetches and rescores on the full vectors), which is
+            # what the HNSW index was built for. HNSW returns at most ef_search rows.
+            ef_search = ef_search or HNSW_EF_SEARCH
+            if ef_search or coarse_limit(top_k) > 40:
+                ef_search = max(ef_search or 0, coarse_limit(top_k))
+                cur.execute("SELECT set_config('hnsw.ef_search', %s, true);", (str(ef_search),))
             cur.execute(
-                """
-                SELECT content FROM chunks
-                ORDER BY embedding <=> %s
-                LIMIT %s;
+                f"""
+                WITH q AS (SELECT %(embedding)s::vector AS v)
+                SELECT r.content FROM ({ann_candidates_sql("(SELECT v FROM q)", limit_sql="%(k)s")}
+                ) r
+                ORDER BY r.distance;
                 """,
-                (query_embedding, top_k)
+                {"embedding": query_embedding, "k": top_k}
             )
             results = cur.fetchall()
             return [row[0] for row in results]
@@ -153,6 +292,27 @@ def query_vector_db(query_text: str, top_k: int = 5) -> list[str]:
         if conn:
             conn.close()
 
+def _chunks_watermark(conn):
+    """Returns (row count, max id) of the chunks table, used to detect a stale vector index snapshot."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*), coalesce(max(id), 0) FROM chunks;")
+        return cur.fetchone()
+
+def _iter_chunk_rows(conn):
+    """Streams (id, content, embedding, document name) for every chunk through a server-side cursor."""
+    with conn.cursor(name="vector_index_snapshot") as cur:
+        cur.itersize = 1000
+        cur.execute(
+            """
+            SELECT c.id, c.content, c.embedding, d.name
+            FROM chunks c
+            JOIN documents d ON c.document_id = d.id
+            ORDER BY c.id;
+            """
+        )
+        for row in cur:
+            yield row
+
 def initialize_database():
     """
     Connects to the database and executes the schema definition script.
@@ -179,7 +339,11 @@ def initialize_database():
         
         with conn.cursor() as cur:
             cur.execute(schema_sql)
+            # Bring tables created by an older schema up to date
+            apply_migrations(cur)
         conn.commit()
+        # The ANN index is built from backend/config.py so its opclass matches the query operator
+        apply_vector_storage(conn)
         print("✅ Database tables checked/created successfully.")
     except (Exception, psycopg2.Error) as error:
         print(f"❌ Error while initializing PostgreSQL tables: {error}")
@@ -187,6 +351,26 @@ def initialize_database():
         if conn:
             conn.close()
 
+def verify_vector_index():
+    """
+    Checks that the live HNSW index was built for the configured distance operator.
+
+    Raises:
+        RuntimeError: if the index opclass doesn't match VECTOR_DISTANCE, because every
+            similarity query would then silently fall back to a sequential scan.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        print("WARNING: Skipping vector index check, no database connection.")
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s;", (HNSW_INDEX_NAME,))
+            row = cur.fetchone()
+        check_hnsw_indexdef(row[0] if row else None)
+    finally:
+        conn.close()
+
 # This allows the script to be run directly for manual database setup
 if __name__ == '__main__':
     print("Running database initialization script directly...")
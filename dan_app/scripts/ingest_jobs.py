@@ -0,0 +1,237 @@
+"""
+Durable ingestion job queue.
+
+The API only records an ingestion request in the `ingestion_jobs` table
+(artifacts/migrations/004_ingestion_jobs.sql) and reports its status; the work
+happens in separate worker processes, so a long ingestion never takes CPU or
+threads away from /chat, and a queued job survives an API restart.
+
+Each worker claims the oldest queued job with SELECT ... FOR UPDATE SKIP LOCKED
+(several workers never get the same job and never wait on each other), runs
+ingest_pdf, and while it runs a heartbeat thread writes the job's progress
+(pages parsed, chunks embedded, rows written) every few seconds. A running job
+whose heartbeat stopped (its worker was killed) is requeued by the next worker
+that looks for work, up to INGEST_JOB_MAX_ATTEMPTS attempts.
+
+Start the workers next to the API with:
+    python -m dan_app.scripts.ingest_jobs [--workers N]
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from backend.config import (
+    INGEST_JOB_WORKERS, INGEST_JOB_POLL_SECONDS, INGEST_JOB_STALE_SECONDS, INGEST_JOB_MAX_ATTEMPTS,
+)
+
+JOB_COLUMNS = (
+    "id", "file_path", "version", "status", "document_id", "pages_parsed", "chunks_embedded", "rows_written",
+    "attempts", "error", "created_at", "started_at", "heartbeat_at", "finished_at",
+)
+
+# Heartbeats come several times within the stale window, so one slow write doesn't requeue a live job
+HEARTBEAT_SECONDS = max(1.0, INGEST_JOB_STALE_SECONDS / 10)
+
+
+def enqueue_job(conn, file_path: str, version: str | None = None) -> int:
+    """
+    Queues an ingestion of `file_path`, or returns the queued/running job that
+    already ingests the same file and version. The caller commits.
+
+    Returns:
+        int: The job ID.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT id FROM ingestion_jobs
+            WHERE file_path = %s AND version IS NOT DISTINCT FROM %s AND status IN ('queued', 'running')
+            ORDER BY id LIMIT 1;
+            """,
+            (file_path, version)
+        )
+        row = cur.fetchone()
+        if row:
+            return row[0]
+        cur.execute(
+            "INSERT INTO ingestion_jobs (file_path, version) VALUES (%s, %s) RETURNING id;",
+            (file_path, version)
+        )
+        return cur.fetchone()[0]
+
+
+def get_job(conn, job_id: int) -> dict | None:
+    """Returns the job as a dict of JOB_COLUMNS, or None if there is no such job."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM ingestion_jobs WHERE id = %s;", (job_id,))
+        row = cur.fetchone()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def requeue_stale_jobs(conn):
+    """Puts running jobs without a recent heartbeat back in the queue, or fails them after too many attempts."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE ingestion_jobs
+            SET status = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+                error = 'Worker stopped responding (attempt ' || attempts || ')',
+                finished_at = CASE WHEN attempts >= %(max_attempts)s THEN CURRENT_TIMESTAMP END,
+                worker = NULL
+            WHERE status = 'running'
+              AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %(stale)s)
+            RETURNING id, status;
+            """,
+            {"max_attempts": INGEST_JOB_MAX_ATTEMPTS, "stale": INGEST_JOB_STALE_SECONDS}
+        )
+        for job_id, status in cur.fetchall():
+            print(f"⚠️  Ingestion job {job_id} had no heartbeat for {INGEST_JOB_STALE_SECONDS}s, now {status}")
+
+
+def claim_job(conn, worker: str) -> tuple | None:
+    """
+    Marks the oldest queued job as running by `worker` and returns
+    (id, file_path, version), or None when the queue is empty. Locked rows are
+    skipped, so concurrent workers each claim a different job.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE ingestion_jobs
+            SET status = 'running', worker = %s, attempts = attempts + 1, error = NULL,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM ingestion_jobs
+                WHERE status = 'queued'
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, file_path, version;
+            """,
+            (worker,)
+        )
+        return cur.fetchone()
+
+
+def _report(conn, job_id, progress, finished=False, **fields):
+    """Writes the progress counters (and any other `fields`) of a job and refreshes its heartbeat."""
+    columns = {**progress.snapshot(), **fields}
+    assignments = ", ".join(f"{column} = %({column})s" for column in columns)
+    if finished:
+        assignments += ", finished_at = CURRENT_TIMESTAMP"
+    with conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE ingestion_jobs SET {assignments}, heartbeat_at = CURRENT_TIMESTAMP WHERE id = %(job_id)s;",
+            {**columns, "job_id": job_id}
+        )
+
+
+def run_job(conn, job_id: int, file_path: str, version: str | None):
+    """Runs one claimed job, heartbeating its progress on `conn` (autocommit), and records the outcome."""
+    from dan_app.scripts.database import ingest_pdf
+    from backend.ingest_pipeline import IngestProgress
+
+    progress = IngestProgress()
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(HEARTBEAT_SECONDS):
+            try:
+                _report(conn, job_id, progress)
+            except Exception as e:
+                print(f"WARNING: Could not report progress of ingestion job {job_id}: {e}")
+
+    thread = threading.Thread(target=heartbeat, name=f"ingest-job-{job_id}-heartbeat", daemon=True)
+    thread.start()
+    started = time.perf_counter()
+    try:
+        document_id = ingest_pdf(file_path, version, progress=progress)
+    except Exception as e:
+        done.set()
+        thread.join()
+        _report(conn, job_id, progress, status="failed", error=str(e)[:2000], finished=True)
+        print(f"❌ Ingestion job {job_id} failed: {e}")
+        return
+    except BaseException:
+        # Worker shutting down: give the job back instead of waiting for it to go stale
+        done.set()
+        thread.join()
+        _report(conn, job_id, progress, status="queued", worker=None)
+        print(f"Ingestion job {job_id} returned to the queue")
+        raise
+    done.set()
+    thread.join()
+    _report(conn, job_id, progress, status="done", document_id=document_id, finished=True)
+    print(f"✅ Ingestion job {job_id} done in {time.perf_counter() - started:.1f}s: {progress.snapshot()}")
+
+
+def run_worker(name: str):
+    """Claims and runs jobs until interrupted; polls every INGEST_JOB_POLL_SECONDS while the queue is empty."""
+    # SIGTERM (e.g. from the supervising process) unwinds like Ctrl+C, so the current job is requeued
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    from dan_app.scripts.database import get_db_connection, ingest_embedder
+
+    conn = get_db_connection()
+    if conn is None:
+        raise ConnectionError("Ingestion worker could not connect to the database.")
+    # register_vector left a transaction open, and psycopg2 refuses to switch to autocommit inside one
+    conn.rollback()
+    conn.autocommit = True
+    print(f"--- Ingestion worker {name} waiting for jobs ---")
+    try:
+        while True:
+            requeue_stale_jobs(conn)
+            job = claim_job(conn, name)
+            if job is None:
+                time.sleep(INGEST_JOB_POLL_SECONDS)
+                continue
+            job_id, file_path, version = job
+            print(f"--- Worker {name} claimed ingestion job {job_id}: {file_path} ---")
+            run_job(conn, job_id, file_path, version)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        ingest_embedder.shutdown()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ingestion job workers.")
+    parser.add_argument("--workers", type=int, default=INGEST_JOB_WORKERS, help="Worker processes (INGEST_JOB_WORKERS)")
+    args = parser.parse_args()
+
+    # Not daemonic: every worker may start its own pool of embedding processes (INGEST_WORKERS)
+    context = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    processes = [
+        context.Process(target=run_worker, args=(f"{host}:{os.getpid()}:{i}",), name=f"ingest-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    except (KeyboardInterrupt, SystemExit) as e:
+        print("--- Stopping ingestion workers ---")
+        if isinstance(e, SystemExit):
+            # Ctrl+C reaches the workers directly; SIGTERM only reached this process
+            for process in processes:
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,39 @@
 #!/usr/bin/env python3
 """
 Data ingestion script for CUDA documentation RAG chatbot.
-This script populates the database with sample CUDA documentation chunks.
+Without arguments, this script populates the database with sample CUDA documentation chunks.
+
+Given directories or glob patterns, it ingests every PDF, Markdown and HTML file they match,
+INGEST_FILE_JOBS files at a time:
+    python ingest_data.py docs/ "guides/**/*.pdf" --jobs 4
+
+Each file is committed together with a checkpoint (ingest_checkpoints table), so re-running
+the same command after a crash skips the files that were finished and resumes with the rest.
+A file whose content changed since its checkpoint replaces the document it produced before.
 """
 
+import argparse
+import glob
+import hashlib
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sqlalchemy.orm import sessionmaker
-from sentence_transformers import SentenceTransformer
 
 # Add backend directory to path
 sys.path.append('backend')
 from backend.db import engine, Base
 from backend.models import Document, Chunk
-
-# Initialize the embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from backend.config import (
+    load_parallel_embedder, load_chunk_writer, load_deduplicator,
+    INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, INGEST_EMBEDDING_CACHE, INGEST_FILE_JOBS, EMBEDDING_MODEL_KEY,
+)
+from backend.embedding_store import EmbeddingStore
+from backend.migrations import apply_migrations, apply_vector_storage
+from backend.bulk_load import use_bulk_load, deferred_ann_index
+from backend.dedup import write_sources
+from backend.ingest_pipeline import DOCUMENT_READERS, iter_document_pages, iter_paragraph_chunks, prefetch, embed_stream
 
 # Sample CUDA documentation content
 CUDA_CONTENT = [
@@ -150,24 +168,33 @@ def ingest_documents():
         
         print(f"Created document: {doc.name} (ID: {doc.id})")
         
-        # Process and insert chunks
-        for i, content_item in enumerate(CUDA_CONTENT):
-            print(f"Processing chunk {i+1}/{len(CUDA_CONTENT)}: {content_item['title']}")
-            
-            # Generate embedding for the content
-            embedding = model.encode(content_item['content'])
-            
-            # Create chunk record
-            chunk = Chunk(
-                document_id=doc.id,
-                content=content_item['content'],
-                embedding=embedding.tolist(),
-                meta=content_item['meta']
-            )
-            session.add(chunk)
+        # Generate embeddings in batches on the worker pool (INGEST_WORKERS) and
+        # write the chunks of each batch as soon as it is back, in order, with
+        # COPY on the session's connection. Content embedded before by the same
+        # model comes from the embedding cache.
+        store = EmbeddingStore(EMBEDDING_MODEL_KEY, engine.raw_connection) if INGEST_EMBEDDING_CACHE else None
+        contents = [item['content'] for item in CUDA_CONTENT]
+        cursor = session.connection().connection.cursor()
+        writer = load_chunk_writer(cursor)
+        with load_parallel_embedder() as embedder:
+            if store:
+                batches = store.map(cursor, contents, embedder, INGEST_BATCH_SIZE)
+            else:
+                batches = embedder.map(contents)
+            i = 0
+            for embeddings in batches:
+                for embedding in embeddings:
+                    content_item = CUDA_CONTENT[i]
+                    print(f"Processing chunk {i+1}/{len(CUDA_CONTENT)}: {content_item['title']}")
+                    writer.add(doc.id, content_item['content'], embedding, content_item['meta'])
+                    i += 1
+        writer.flush()
         
         session.commit()
         print(f"Successfully ingested {len(CUDA_CONTENT)} chunks!")
+        print(f"Ingestion throughput: {writer.summary()}")
+        if store:
+            print(f"Ingestion {store.summary()}")
         
         # Verify the data
         chunk_count = session.query(Chunk).count()
@@ -180,7 +207,177 @@ def ingest_documents():
     finally:
         session.close()
 
+def find_documents(patterns):
+    """Expands directories (recursively) and glob patterns into the supported document files, sorted."""
+    found = set()
+    for pattern in patterns:
+        paths = [pattern] if os.path.isdir(pattern) else glob.glob(pattern, recursive=True)
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    found.update(os.path.join(root, name) for name in files)
+            else:
+                found.add(path)
+    return sorted(
+        os.path.abspath(path) for path in found
+        if os.path.splitext(path)[1].lower() in DOCUMENT_READERS
+    )
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ingest_file(path, embedder):
+    """
+    Ingests one document and its checkpoint in a single transaction.
+
+    Returns:
+        dict: status ("done" or "skipped"), chunks written, and seconds spent
+        waiting for embeddings (including parsing) and writing rows.
+    """
+    name = os.path.basename(path)
+    content_sha256 = file_sha256(path)
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT content_sha256, document_id FROM ingest_checkpoints WHERE source = %s", (path,))
+        checkpoint = cursor.fetchone()
+        if checkpoint and checkpoint[0] == content_sha256:
+            print(f"⏭️  {name}: already ingested")
+            return {"status": "skipped", "chunks": 0, "chunks_seen": 0, "embed_seconds": 0.0, "write_seconds": 0.0}
+        if checkpoint and checkpoint[1] is not None:
+            # The file changed: its old chunks go with the old document (ON DELETE CASCADE)
+            cursor.execute("DELETE FROM documents WHERE id = %s", (checkpoint[1],))
+
+        cursor.execute(
+            "INSERT INTO documents (name, source_url) VALUES (%s, %s) RETURNING id",
+            (name, path)
+        )
+        document_id = cursor.fetchone()[0]
+
+        chunks = prefetch(iter_paragraph_chunks(iter_document_pages(path)), maxsize=INGEST_QUEUE_SIZE)
+        dedup = load_deduplicator()
+        if dedup:
+            chunks = dedup.filter(chunks)
+        store = EmbeddingStore(EMBEDDING_MODEL_KEY, engine.raw_connection) if INGEST_EMBEDDING_CACHE else None
+        if store:
+            embed = lambda texts: store.map(cursor, texts, embedder, INGEST_BATCH_SIZE)
+        else:
+            embed = embedder.map
+        writer = load_chunk_writer(cursor)
+        stream = embed_stream(chunks, embed)
+        embed_seconds = 0.0
+        while True:
+            started = time.perf_counter()
+            item = next(stream, None)
+            embed_seconds += time.perf_counter() - started
+            if item is None:
+                break
+            batch, embeddings = item
+            for chunk, embedding in zip(batch, embeddings):
+                writer.add(document_id, chunk.content, embedding, {"page": chunk.page, "offset": chunk.offset})
+        writer.flush()
+        if dedup:
+            write_sources(cursor, document_id, dedup)
+
+        cursor.execute(
+            """
+            INSERT INTO ingest_checkpoints (source, content_sha256, document_id, chunks)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (source) DO UPDATE SET content_sha256 = EXCLUDED.content_sha256,
+                document_id = EXCLUDED.document_id, chunks = EXCLUDED.chunks, finished_at = CURRENT_TIMESTAMP
+            """,
+            (path, content_sha256, document_id, writer.rows_written)
+        )
+        conn.commit()
+        print(f"✅ {name}: {writer.summary()}" + "".join(f", {part.summary()}" for part in (store, dedup) if part))
+        return {
+            "status": "done", "chunks": writer.rows_written,
+            "chunks_seen": dedup.seen if dedup else writer.rows_written,
+            "embed_seconds": embed_seconds, "write_seconds": writer.write_seconds,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def ingest_paths(patterns, jobs=INGEST_FILE_JOBS, bulk=None):
+    """
+    Ingests every document matched by `patterns`, `jobs` files at a time, and prints a throughput summary.
+    In bulk mode (`bulk`, or INGEST_BULK_LOAD) the HNSW index is dropped during the load and rebuilt after it.
+    """
+    paths = find_documents(patterns)
+    if not paths:
+        print(f"No PDF, Markdown or HTML files found in: {' '.join(patterns)}")
+        return
+    print(f"Found {len(paths)} documents, ingesting {jobs} at a time...")
+
+    # Same setup as the backend's startup, so a fresh database works too (all of it is idempotent)
+    Base.metadata.create_all(bind=engine)
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        apply_migrations(cur)
+        conn.commit()
+        apply_vector_storage(conn)
+    finally:
+        conn.close()
+
+    totals = {
+        "done": 0, "skipped": 0, "failed": 0, "chunks": 0, "chunks_seen": 0, "embed_seconds": 0.0, "write_seconds": 0.0,
+    }
+    bulk = use_bulk_load(sum(os.path.getsize(path) for path in paths), requested=bulk)
+    started = time.perf_counter()
+    index_conn = engine.raw_connection()
+    try:
+        # All files share one pool of embedding processes (INGEST_WORKERS)
+        with deferred_ann_index(index_conn, enabled=bulk), load_parallel_embedder() as embedder, \
+                ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(ingest_file, path, embedder): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ {os.path.basename(futures[future])}: {e}")
+                    totals["failed"] += 1
+                    continue
+                totals[result["status"]] += 1
+                for key in ("chunks", "chunks_seen", "embed_seconds", "write_seconds"):
+                    totals[key] += result[key]
+    finally:
+        index_conn.close()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    print(
+        f"📊 {totals['done']} documents ingested ({totals['skipped']} skipped, {totals['failed']} failed), "
+        f"{totals['chunks']} chunks in {elapsed:.1f}s: "
+        f"{totals['done'] / elapsed:.2f} docs/s, {totals['chunks'] / elapsed:.1f} chunks/s"
+    )
+    print(
+        f"   embedding {totals['embed_seconds']:.1f}s vs writing {totals['write_seconds']:.1f}s "
+        f"(summed over files)"
+    )
+    if totals["chunks_seen"] > totals["chunks"]:
+        duplicates = totals["chunks_seen"] - totals["chunks"]
+        print(f"   {duplicates} of {totals['chunks_seen']} chunks dropped as duplicates ({duplicates / totals['chunks_seen']:.1%})")
+    if totals["failed"]:
+        print("   Re-run the same command to retry the failed files; finished ones are skipped.")
+
 if __name__ == "__main__":
-    print("Starting CUDA documentation ingestion...")
-    ingest_documents()
-    print("Ingestion completed!")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest documentation into the RAG database.")
+    parser.add_argument("paths", nargs="*", help="Directories or glob patterns of PDF, Markdown and HTML files (default: the built-in CUDA samples)")
+    parser.add_argument("--jobs", type=int, default=INGEST_FILE_JOBS, help="Files ingested at once (INGEST_FILE_JOBS)")
+    parser.add_argument("--bulk", action=argparse.BooleanOptionalAction, default=None,
+                        help="Drop the HNSW index during the load and rebuild it afterwards (default: INGEST_BULK_LOAD)")
+    args = parser.parse_args()
+
+    if args.paths:
+        ingest_paths(args.paths, jobs=args.jobs, bulk=args.bulk)
+    else:
+        print("Starting CUDA documentation ingestion...")
+        ingest_documents()
+        print("Ingestion completed!")
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""Token-budgeted context packing (context_packer.py)."""
+from context_packer import ContextPacker
+from vector_index import ChunkHit
+
+GUIDE = "CUDA Programming Guide"
+KERNEL = (
+    "A kernel is defined using the __global__ declaration specifier. The number of CUDA threads that execute "
+    "the kernel for a given call is specified using the execution configuration syntax. Each thread that "
+    "executes the kernel is given a unique thread ID that is accessible within the kernel through built-in variables."
+)
+MEMORY = (
+    "Shared memory is expected to be much faster than global memory. It can be used as a scratchpad memory "
+    "to minimize global memory accesses from a CUDA block, for example in a tiled matrix multiplication."
+)
+STREAMS = "Streams are sequences of commands that execute in order. Different streams may execute concurrently."
+
+
+def _hit(chunk_id, content, similarity, document_name=GUIDE):
+    return ChunkHit(chunk_id, content, similarity, document_name)
+
+
+def test_low_similarity_chunks_are_dropped_but_the_best_is_kept():
+    packer = ContextPacker(min_similarity=0.5)
+    packed = packer.pack([_hit(1, KERNEL, 0.3), _hit(2, MEMORY, 0.2)])
+    assert [chunk.id for chunk in packed.chunks] == [1]
+    assert packer.stats()["chunks_dropped"] == 1
+
+
+def test_overlapping_windows_are_merged():
+    first, second = KERNEL[:200], KERNEL[120:]
+    packed = ContextPacker().pack([_hit(1, first, 0.9), _hit(2, second, 0.8)])
+    assert [chunk.id for chunk in packed.chunks] == [1, 2]
+    assert packed.text.count("[Context") == 1
+    assert KERNEL in packed.text
+
+
+def test_near_duplicates_are_dropped():
+    packer = ContextPacker()
+    packed = packer.pack([_hit(1, KERNEL, 0.9), _hit(2, KERNEL.replace("unique", "distinct"), 0.85)])
+    assert [chunk.id for chunk in packed.chunks] == [1]
+    # The same text from another document is not a duplicate
+    packed = packer.pack([_hit(1, KERNEL, 0.9), _hit(3, KERNEL, 0.85, "CUDA Best Practices Guide")])
+    assert [chunk.id for chunk in packed.chunks] == [1, 3]
+
+
+def test_budget_is_respected_and_the_last_chunk_trimmed():
+    chunks = [_hit(1, KERNEL, 0.9), _hit(2, MEMORY, 0.8), _hit(3, STREAMS, 0.7)]
+    # Room for the first chunk and part of the second, whichever tokenizer is installed
+    budget = ContextPacker().pack(chunks[:1]).tokens_used + 35
+    packer = ContextPacker(token_budget=budget, min_fragment_tokens=10)
+    packed = packer.pack(chunks)
+    assert packed.tokens_used <= budget
+    assert packed.tokens_used == packer.count_tokens(packed.text)
+    assert [chunk.id for chunk in packed.chunks] == [1, 2]
+    assert packed.text.rstrip().endswith("…")
+    assert packed.tokens_saved == packed.tokens_full - packed.tokens_used > 0
+    assert packer.stats()["chunks_trimmed"] == 1
+
+
+def test_nothing_to_pack():
+    packed = ContextPacker().pack([])
+    assert packed.text == "" and packed.chunks == [] and packed.tokens_used == 0
@@ -0,0 +1,81 @@
+"""Exact and near-duplicate chunk elimination (dedup.py)."""
+import pytest
+
+dedup = pytest.importorskip("dedup")
+from dedup import ChunkDeduplicator, write_sources
+from ingest_pipeline import TextChunk
+
+FOOTER = "Copyright 2024 NVIDIA Corporation. All rights reserved. Information furnished is believed to be accurate."
+KERNEL = (
+    "A kernel is defined using the __global__ declaration specifier and the number of CUDA threads that "
+    "execute that kernel for a given kernel call is specified using the execution configuration syntax."
+)
+# KERNEL with a sentence appended: all but two of its shingles match
+KERNEL_REVISED = KERNEL + " See below."
+MEMORY = (
+    "Shared memory is expected to be much faster than global memory. It can be used as a scratchpad "
+    "memory to minimize global memory accesses from a CUDA block."
+)
+
+
+def _kept(deduplicator, chunks):
+    return [(chunk.page, chunk.offset) for chunk in deduplicator.filter(chunks)]
+
+
+def test_exact_duplicates_are_dropped_and_recorded():
+    deduplicator = ChunkDeduplicator(threshold=1.0)
+    chunks = [
+        TextChunk(FOOTER, 1, 900),
+        TextChunk(KERNEL, 2, 0),
+        # Reflowed: same normalized text
+        TextChunk(FOOTER.replace(". ", ".\n"), 2, 900),
+        TextChunk(FOOTER, 3, 900),
+    ]
+    assert _kept(deduplicator, chunks) == [(1, 900), (2, 0)]
+    assert deduplicator.sources == {(1, 900): [(2, 900), (3, 900)]}
+    assert deduplicator.exact_duplicates == 2 and deduplicator.near_duplicates == 0
+
+
+def test_near_duplicates_are_dropped_above_the_threshold():
+    deduplicator = ChunkDeduplicator(threshold=0.8)
+    chunks = [TextChunk(KERNEL, 1, 0), TextChunk(MEMORY, 1, 400), TextChunk(KERNEL_REVISED, 5, 120)]
+    assert _kept(deduplicator, chunks) == [(1, 0), (1, 400)]
+    assert deduplicator.sources == {(1, 0): [(5, 120)]}
+    assert deduplicator.near_duplicates == 1
+    # An exact copy of the dropped near duplicate points at the same chunk
+    assert _kept(deduplicator, [TextChunk(KERNEL_REVISED, 9, 0)]) == []
+    assert deduplicator.sources == {(1, 0): [(5, 120), (9, 0)]}
+    assert deduplicator.dedup_ratio() == 0.5
+
+
+def test_exact_threshold_keeps_near_duplicates():
+    deduplicator = ChunkDeduplicator(threshold=1.0)
+    chunks = [TextChunk(KERNEL, 1, 0), TextChunk(KERNEL_REVISED, 5, 120)]
+    assert _kept(deduplicator, chunks) == [(1, 0), (5, 120)]
+    assert deduplicator.sources == {}
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+
+def test_write_sources_clears_stale_sources_first(monkeypatch):
+    written = []
+    monkeypatch.setattr(dedup, "execute_values", lambda cursor, sql, rows: written.extend(rows))
+    cursor = RecordingCursor()
+
+    # A re-ingestion whose new version has no duplicates left
+    write_sources(cursor, 7, ChunkDeduplicator())
+    assert len(cursor.statements) == 1 and "metadata - 'sources'" in cursor.statements[0]
+    assert written == []
+
+    deduplicator = ChunkDeduplicator(threshold=1.0)
+    list(deduplicator.filter([TextChunk(FOOTER, 1, 900), TextChunk(FOOTER, 2, 900)]))
+    write_sources(cursor, 7, deduplicator)
+    assert [(page, offset, sources.adapted) for page, offset, sources in written] == [
+        (1, 900, [{"page": 1, "offset": 900}, {"page": 2, "offset": 900}])
+    ]
@@ -0,0 +1,71 @@
+"""Micro-batching of query embeddings (embedding_batcher.py)."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from embedding_batcher import EmbeddingBatcher
+
+
+class SlowEncoder:
+    """Encodes a text as [len(text), position in its batch]; records batch sizes"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, texts):
+        time.sleep(self.delay)
+        self.batches.append(len(texts))
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+
+
+def test_each_caller_gets_its_own_rows():
+    batcher = EmbeddingBatcher(SlowEncoder())
+    texts = [f"query {'x' * i}" for i in range(40)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(batcher.encode, texts))
+    assert [int(row[0]) for row in results] == [len(text) for text in texts]
+
+
+def test_concurrent_requests_share_forward_passes():
+    encoder = SlowEncoder()
+    batcher = EmbeddingBatcher(encoder, max_batch=8)
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(batcher.encode, [f"query {i}" for i in range(64)]))
+    stats = batcher.stats()
+    assert stats["requests"] == 64 and stats["texts"] == 64
+    assert stats["batches"] < 64 and stats["max_batch_size"] <= 8
+    assert sum(stats["batch_size_histogram"].values()) == stats["batches"]
+
+
+def test_a_request_larger_than_max_batch_is_encoded_in_one_call():
+    encoder = SlowEncoder(delay=0)
+    batcher = EmbeddingBatcher(encoder, max_batch=4)
+    embeddings = batcher.encode_many([f"text {i}" for i in range(10)])
+    assert embeddings.shape == (10, 2) and encoder.batches == [10]
+    assert batcher.encode_many([]).shape == (0, 0)
+
+
+def test_encoder_errors_reach_every_caller():
+    def encode(texts):
+        raise RuntimeError("CUDA out of memory")
+
+    batcher = EmbeddingBatcher(encode)
+    with pytest.raises(RuntimeError, match="out of memory"):
+        batcher.encode("What is a warp?")
+    # The dispatcher survives and serves the next request
+    with pytest.raises(RuntimeError):
+        batcher.encode("What is a warp?")
+
+
+def test_async_callers_await_the_future():
+    batcher = EmbeddingBatcher(SlowEncoder(delay=0))
+
+    async def main():
+        return await asyncio.gather(*(asyncio.wrap_future(batcher.submit([f"q{'x' * i}"])) for i in range(5)))
+
+    results = asyncio.run(main())
+    assert [int(rows[0][0]) for rows in results] == [1 + i for i in range(5)]
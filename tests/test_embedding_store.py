@@ -0,0 +1,73 @@
+"""Embedding cache entries are committed apart from the ingestion's transaction."""
+import numpy as np
+import pytest
+
+embedding_store = pytest.importorskip("embedding_store")
+from embedding_store import EmbeddingStore, content_hash
+
+
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self):
+        self.inserted = []
+        self.commits = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.encoded = []
+
+    def map_batches(self, batches):
+        for batch in batches:
+            self.encoded.extend(batch)
+            yield [np.full(3, len(text), dtype=np.float32) for text in batch]
+
+
+def test_misses_are_stored_on_a_separate_connection(monkeypatch):
+    cached = "A kernel is a function executed on the GPU."
+    writer = FakeConnection()
+    monkeypatch.setattr(
+        embedding_store, "execute_values", lambda cursor, sql, rows: writer.inserted.extend(row[1] for row in rows)
+    )
+    ingestion = FakeCursor(rows=[(content_hash(cached), np.ones(3, dtype=np.float32))])
+    store = EmbeddingStore("test-model@torch", lambda: writer)
+    texts = ["Threads form blocks.", cached, "Blocks form a grid."]
+    embedder = FakeEmbedder()
+
+    embeddings = np.vstack(list(store.map(ingestion, texts, embedder, batch_size=3)))
+
+    assert embedder.encoded == ["Threads form blocks.", "Blocks form a grid."]
+    assert embeddings.shape == (3, 3) and np.all(embeddings[1] == 1)
+    # Hash order, committed right away, connection closed once the map is done
+    assert writer.inserted == sorted([content_hash(texts[0]), content_hash(texts[2])])
+    assert writer.commits == 1 and writer.closed
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 2
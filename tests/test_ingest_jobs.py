@@ -0,0 +1,48 @@
+"""Ingestion workers against dan_app's database; skipped when it can't be reached."""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+database = pytest.importorskip("dan_app.scripts.database")
+from dan_app.scripts import ingest_jobs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def conn():
+    conn = database.get_db_connection()
+    if conn is None:
+        pytest.skip("dan_app database not reachable")
+    database.initialize_database()
+    yield conn
+    conn.close()
+
+
+def test_worker_starts_and_runs_a_queued_job(conn, tmp_path):
+    # A file that doesn't exist makes ingest_pdf fail right away, so the job ends as failed
+    job_id = ingest_jobs.enqueue_job(conn, str(tmp_path / "missing.pdf"))
+    conn.commit()
+    worker = subprocess.Popen([sys.executable, "-m", "dan_app.scripts.ingest_jobs", "--workers", "1"], cwd=ROOT)
+    try:
+        deadline = time.monotonic() + 180
+        job = ingest_jobs.get_job(conn, job_id)
+        while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+            assert worker.poll() is None, "the ingestion worker exited"
+            time.sleep(0.5)
+            conn.rollback()  # fresh snapshot
+            job = ingest_jobs.get_job(conn, job_id)
+        assert job["status"] == "failed"
+        assert job["attempts"] == 1
+        assert "missing.pdf" in job["error"]
+    finally:
+        worker.terminate()
+        worker.wait(timeout=60)
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM ingestion_jobs WHERE id = %s;", (job_id,))
+        conn.commit()
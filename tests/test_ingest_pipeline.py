@@ -0,0 +1,149 @@
+"""Streaming chunking, prefetch and re-ingestion diffs (ingest_pipeline.py)."""
+import random
+import threading
+import time
+
+import pytest
+
+from ingest_pipeline import ChunkDiff, TextChunk, iter_paragraph_chunks, prefetch
+
+LONG = "Threads of a block cooperate through shared memory and synchronize with __syncthreads(). " * 2
+SHORT = "Figure 3. Grid of thread blocks"
+
+
+def _whole_document(pages, min_chars=100):
+    """What ingestion did before streaming: one split of the concatenated page texts"""
+    return [p.strip() for p in "".join(text for _, text in pages).split("\n\n") if len(p.strip()) > min_chars]
+
+
+def _page_of(pages, offset):
+    end = 0
+    for number, text in pages:
+        end += len(text)
+        if offset < end:
+            return number
+    return pages[-1][0]
+
+
+def _check(pages, min_chars=100):
+    chunks = list(iter_paragraph_chunks(pages, min_chars=min_chars))
+    full_text = "".join(text for _, text in pages)
+    assert [chunk.content for chunk in chunks] == _whole_document(pages, min_chars)
+    for chunk in chunks:
+        assert full_text[chunk.offset:chunk.offset + len(chunk.content)] == chunk.content
+        assert chunk.page == _page_of(pages, chunk.offset)
+    return chunks
+
+
+def test_paragraph_spanning_a_page_break_starts_on_its_first_page():
+    first, second = LONG[:70], LONG[70:]
+    pages = [(1, f"{LONG}\n\n{first}"), (2, f"{second}\n\n{LONG}\n\n")]
+    chunks = _check(pages)
+    assert chunks == [
+        TextChunk(LONG.strip(), 1, 0),
+        TextChunk(LONG.strip(), 1, len(LONG) + 2),
+        TextChunk(LONG.strip(), 2, len(pages[0][1]) + len(second) + 2),
+    ]
+
+
+def test_last_page_without_trailing_separator():
+    pages = [(1, f"{LONG}\n\n"), (2, f"{SHORT}\n\n{LONG}")]
+    chunks = _check(pages)
+    assert [chunk.page for chunk in chunks] == [1, 2]
+
+
+def test_short_paragraphs_are_dropped():
+    pages = [(1, f"{SHORT}\n\n{LONG}\n\n{SHORT}"), (2, f"\n\n{SHORT}\n\n")]
+    assert len(_check(pages)) == 1
+    assert list(iter_paragraph_chunks([(1, SHORT)])) == []
+
+
+def test_separator_split_across_pages():
+    pages = [(1, f"{LONG}\n"), (2, f"\n{LONG}")]
+    chunks = _check(pages)
+    assert [chunk.page for chunk in chunks] == [1, 2]
+
+
+def test_paragraph_after_trailing_whitespace_spanning_three_pages():
+    pages = [(1, f"{LONG}\n\n\n"), (2, LONG[:50]), (3, f"{LONG[50:]}\n\n")]
+    chunks = _check(pages)
+    assert [chunk.page for chunk in chunks] == [1, 2]
+
+
+def test_matches_the_whole_document_split():
+    rng = random.Random(17)
+    words = ["kernel", "warp", "block", "grid", "\n", "\n\n", "\n\n\n", " "]
+    for _ in range(500):
+        text = "".join(rng.choice(words) + rng.choice(["", " "]) for _ in range(rng.randint(10, 300)))
+        cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12))))
+        bounds = [0] + cuts + [len(text)]
+        _check([(i + 1, text[start:end]) for i, (start, end) in enumerate(zip(bounds, bounds[1:]))], min_chars=5)
+
+
+def test_prefetch_yields_everything_in_order():
+    assert list(prefetch(iter(range(1000)), maxsize=4)) == list(range(1000))
+
+
+def test_prefetch_reraises_producer_errors():
+    def produce():
+        yield 1
+        raise ValueError("bad page")
+
+    items = prefetch(produce(), maxsize=4)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="bad page"):
+        next(items)
+
+
+def test_prefetch_stops_the_producer_on_early_close():
+    produced = []
+
+    def produce():
+        for i in range(10000):
+            produced.append(i)
+            yield i
+
+    items = prefetch(produce(), maxsize=2)
+    assert next(items) == 0
+    items.close()
+    deadline = time.monotonic() + 5
+    while any(thread.name == "ingest-prefetch" for thread in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(thread.name == "ingest-prefetch" for thread in threading.enumerate())
+    assert len(produced) < 10
+
+
+def test_chunk_diff_keeps_moves_adds_and_removes():
+    diff = ChunkDiff([
+        (1, "Unchanged paragraph.", {"page": 1, "offset": 0}),
+        (2, "Paragraph that moved.", {"page": 2, "offset": 50, "section": "3.2"}),
+        (3, "Paragraph that was removed.", {"page": 3, "offset": 90}),
+    ])
+    new = [
+        TextChunk("Unchanged paragraph.", 1, 0),
+        TextChunk("Paragraph that was added.", 1, 30),
+        # Same page, new offset: still re-labelled
+        TextChunk("Paragraph   that moved.", 2, 70),
+    ]
+    assert list(diff.new_chunks(new)) == [new[1]]
+    assert (diff.kept, diff.added) == (2, 1)
+    assert diff.moved == [(2, {"page": 2, "offset": 70, "section": "3.2"})]
+    assert diff.stale_ids() == [3]
+
+
+def test_chunk_diff_matches_each_stored_duplicate_once():
+    diff = ChunkDiff([
+        (1, "Repeated notice.", {"page": 1, "offset": 0}),
+        (2, "Repeated notice.", {"page": 9, "offset": 500}),
+        (3, "Repeated notice.", {"page": 12, "offset": 800}),
+    ])
+    new = [TextChunk("Repeated notice.", 1, 0), TextChunk("Repeated notice.", 9, 500)]
+    assert list(diff.new_chunks(new)) == []
+    assert diff.moved == []
+    assert diff.stale_ids() == [3]
+
+    diff = ChunkDiff([(1, "Repeated notice.", None)])
+    new = [TextChunk("Repeated notice.", 4, 10), TextChunk("Repeated notice.", 5, 20)]
+    assert list(diff.new_chunks(new)) == [new[1]]
+    assert diff.moved == [(1, {"page": 4, "offset": 10})]
+    assert diff.summary() == "1 chunks kept (1 moved), 1 added, 0 removed"
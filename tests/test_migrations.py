@@ -0,0 +1,107 @@
+"""Startup schema changes must only touch the catalog when something is missing."""
+import os
+
+import migrations
+
+
+class FakeCursor:
+    """Records statements; answers the catalog queries migrations.py runs."""
+
+    def __init__(self, applied=(), columns=(), indexes=None, bulk_load=False):
+        self.applied = set(applied)
+        self.bulk_load = bulk_load
+        self.columns = set(columns)
+        self.indexes = dict(indexes or {})
+        self.statements = []
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        self._rows = []
+        if sql.startswith("INSERT INTO schema_migrations"):
+            self.applied.add(params[0])
+        elif sql == "SELECT name FROM schema_migrations":
+            self._rows = [(name,) for name in sorted(self.applied)]
+        elif params and "information_schema.columns" in sql and params[0] in self.columns:
+            self._rows = [(1,)]
+        elif sql.startswith("SELECT pg_try_advisory_lock"):
+            self._rows = [(not self.bulk_load,)]
+        elif params and "pg_index" in sql and params[0] in self.indexes:
+            self._rows = [(self.indexes[params[0]],)]
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.autocommit = False
+
+    def cursor(self):
+        return self._cursor
+
+    def rollback(self):
+        pass
+
+    def set_session(self, autocommit):
+        self.autocommit = autocommit
+
+
+def _ddl(cursor):
+    return [sql for sql in cursor.statements if sql.split(None, 1)[0] in ("CREATE", "DROP", "ALTER")]
+
+
+def _names():
+    return [os.path.basename(path) for path in migrations.migration_files()]
+
+
+def test_pending_migrations_run_once_in_order():
+    cursor = FakeCursor()
+    migrations.apply_migrations(cursor)
+    assert cursor.applied == set(_names())
+    files = [sql for sql in cursor.statements if sql.startswith("-- Migration")]
+    assert [sql.split(":")[0] for sql in files] == [f"-- Migration {name[:3]}" for name in _names()]
+    assert any("lock_timeout" in sql for sql in cursor.statements)
+
+
+def test_applied_migrations_are_skipped():
+    cursor = FakeCursor(applied=_names())
+    migrations.apply_migrations(cursor)
+    assert not any("ALTER TABLE" in sql or "pg_advisory" in sql for sql in cursor.statements)
+
+
+def test_matching_vector_storage_runs_no_ddl():
+    column = migrations.VECTOR_STORAGES[migrations.VECTOR_STORAGE]["column"]
+    cursor = FakeCursor(columns=["embedding", column], indexes={migrations.HNSW_INDEX_NAME: True})
+    migrations.apply_vector_storage(FakeConnection(cursor))
+    assert _ddl(cursor) == []
+
+
+def test_vector_storage_switch_builds_and_drops_concurrently():
+    previous = next(storage for storage in migrations.VECTOR_STORAGES.values()
+                    if "expression" in storage and storage["index"] != migrations.HNSW_INDEX_NAME)
+    cursor = FakeCursor(columns=["embedding", previous["column"]], indexes={previous["index"]: True})
+    conn = FakeConnection(cursor)
+    migrations.apply_vector_storage(conn)
+    ddl = _ddl(cursor)
+    assert any(sql.startswith(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {migrations.HNSW_INDEX_NAME}") for sql in ddl)
+    assert f"DROP INDEX CONCURRENTLY IF EXISTS {previous['index']}" in ddl
+    assert f"ALTER TABLE chunks DROP COLUMN {previous['column']}" in ddl
+    assert not conn.autocommit
+
+
+def test_vector_storage_leaves_indexes_to_a_running_bulk_load():
+    column = migrations.VECTOR_STORAGES[migrations.VECTOR_STORAGE]["column"]
+    cursor = FakeCursor(columns=["embedding", column], bulk_load=True)
+    migrations.apply_vector_storage(FakeConnection(cursor))
+    assert _ddl(cursor) == []
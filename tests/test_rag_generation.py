@@ -0,0 +1,48 @@
+"""LLM failures must never reach the semantic answer cache."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+rag = pytest.importorskip("rag")
+from context_packer import PackedContext
+from vector_index import ChunkHit
+
+CHUNKS = [ChunkHit(1, "A kernel is a function executed on the GPU.", 0.9, "CUDA Programming Guide")]
+CONTEXT = PackedContext("[1] A kernel is a function executed on the GPU.", CHUNKS, 12, 12, 0)
+
+
+def _openai_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_failed_llm_call_is_not_cacheable(monkeypatch):
+    def create(**kwargs):
+        raise ConnectionError("rate limited")
+
+    monkeypatch.setattr(rag, "get_llm", lambda: (_openai_client(create), "gpt-4o", "openai"))
+    answer = rag.generate_response("What is a kernel?", CONTEXT)
+    assert not answer.from_llm
+    assert answer.text.startswith("⚠️ LLM error occurred")
+    assert not rag.is_cacheable_response(answer, CHUNKS)
+
+
+def test_failed_async_llm_call_is_not_cacheable(monkeypatch):
+    async def create(**kwargs):
+        raise ConnectionError("rate limited")
+
+    monkeypatch.setattr(rag, "get_async_llm", lambda: (_openai_client(create), "gpt-4o", "openai"))
+    answer = asyncio.run(rag.generate_response_async("What is a kernel?", CONTEXT))
+    assert not answer.from_llm
+    assert not rag.is_cacheable_response(answer, CHUNKS)
+
+
+def test_llm_answer_is_cacheable(monkeypatch):
+    def create(**kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="A GPU function."))])
+
+    monkeypatch.setattr(rag, "get_llm", lambda: (_openai_client(create), "gpt-4o", "openai"))
+    answer = rag.generate_response("What is a kernel?", CONTEXT)
+    assert answer.from_llm
+    assert answer.text.startswith("A GPU function.")
+    assert rag.is_cacheable_response(answer, CHUNKS)
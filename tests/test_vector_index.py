@@ -0,0 +1,87 @@
+"""Memory-mapped in-process vector index (vector_index.py)."""
+import numpy as np
+import pytest
+
+from vector_index import MmapVectorIndex
+
+rng = np.random.default_rng(1)
+EMBEDDINGS = rng.normal(size=(50, 8)).astype(np.float32)
+ROWS = [(100 + i, f"chunk {i}", embedding, "CUDA Programming Guide") for i, embedding in enumerate(EMBEDDINGS)]
+
+
+class Table:
+    """Stands in for the chunks table; counts full scans"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.scans = 0
+
+    def watermark(self):
+        return len(self.rows), max((row[0] for row in self.rows), default=0)
+
+    def fetch_rows(self):
+        self.scans += 1
+        return iter(self.rows)
+
+
+def _expected(query, metric, k):
+    if metric == "cosine":
+        scores = EMBEDDINGS @ query / (np.linalg.norm(EMBEDDINGS, axis=1) * np.linalg.norm(query))
+    elif metric == "l2":
+        scores = -np.linalg.norm(EMBEDDINGS - query, axis=1)
+    else:
+        scores = EMBEDDINGS @ query
+    top = np.argsort(-scores)[:k]
+    return [100 + int(i) for i in top], scores[top]
+
+
+@pytest.mark.parametrize("metric", ["cosine", "l2", "inner_product"])
+def test_search_matches_brute_force(tmp_path, metric):
+    table = Table(ROWS)
+    index = MmapVectorIndex(str(tmp_path), metric=metric)
+    index.sync(table.watermark, table.fetch_rows)
+    query = rng.normal(size=8).astype(np.float32)
+    hits = index.search(query, k=5)
+    ids, scores = _expected(query, metric, 5)
+    assert [hit.id for hit in hits] == ids
+    assert np.allclose([hit.similarity for hit in hits], scores, atol=1e-5)
+    assert hits[0].content == f"chunk {ids[0] - 100}" and hits[0].document_name == "CUDA Programming Guide"
+
+
+def test_rebuilds_only_when_the_watermark_changes(tmp_path):
+    table = Table(ROWS[:10])
+    index = MmapVectorIndex(str(tmp_path), refresh_seconds=0)
+    index.sync(table.watermark, table.fetch_rows)
+    index.sync(table.watermark, table.fetch_rows)
+    assert table.scans == 1 and len(index) == 10
+
+    table.rows = ROWS[:20]
+    index.sync(table.watermark, table.fetch_rows)
+    assert table.scans == 2 and len(index) == 20
+
+
+def test_watermark_is_only_read_every_refresh_seconds(tmp_path):
+    table = Table(ROWS[:10])
+    index = MmapVectorIndex(str(tmp_path), refresh_seconds=3600)
+    index.sync(table.watermark, table.fetch_rows)
+    table.rows = ROWS
+    index.sync(table.watermark, table.fetch_rows)
+    assert len(index) == 10
+
+
+def test_workers_share_one_snapshot(tmp_path):
+    table = Table(ROWS)
+    first = MmapVectorIndex(str(tmp_path))
+    second = MmapVectorIndex(str(tmp_path))
+    first.sync(table.watermark, table.fetch_rows)
+    second.sync(table.watermark, table.fetch_rows)
+    assert table.scans == 1
+    assert [hit.id for hit in second.search(EMBEDDINGS[3], k=1)] == [103]
+
+
+def test_empty_table(tmp_path):
+    table = Table([])
+    index = MmapVectorIndex(str(tmp_path))
+    index.sync(table.watermark, table.fetch_rows)
+    assert len(index) == 0
+    assert index.search(EMBEDDINGS[0]) == []
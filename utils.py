@@ -122,8 +122,11 @@ def setup_llm_client(model_name="gpt-4o"):
 
 # --- Core Interaction Functions ---
 
-def get_completion(prompt, client, model_name, api_provider, temperature=0.7):
-    """Gets a text completion from the specified LLM."""
+def get_completion(prompt, client, model_name, api_provider, temperature=0.7, raise_errors=False):
+    """
+    Gets a text completion from the specified LLM. API errors are returned as
+    the completion text, or raised with raise_errors=True.
+    """
     if not client: return "API client not initialized."
     try:
         if api_provider == "openai":
@@ -144,8 +147,112 @@ def get_completion(prompt, client, model_name, api_provider, temperature=0.7):
             response = client.generate_content(prompt)
             return response.text
     except Exception as e:
+        if raise_errors: raise
+        return f"An API error occurred: {e}"
+
+def setup_async_llm_client(model_name="gpt-4o"):
+    """
+    Initializes and returns an asyncio client for the specified model provider,
+    for use with get_completion_async. Same return value as setup_llm_client.
+    """
+    load_environment()
+    if model_name not in RECOMMENDED_MODELS:
+        print(f"ERROR: Model '{model_name}' is not in the list of recommended models.")
+        return None, None, None
+    config = RECOMMENDED_MODELS[model_name]
+    api_provider = config["provider"]
+    client = None
+    try:
+        if api_provider == "openai":
+            from openai import AsyncOpenAI
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key: raise ValueError("OPENAI_API_KEY not found in .env file.")
+            client = AsyncOpenAI(api_key=api_key)
+        elif api_provider == "anthropic":
+            from anthropic import AsyncAnthropic
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+            if not api_key: raise ValueError("ANTHROPIC_API_KEY not found in .env file.")
+            client = AsyncAnthropic(api_key=api_key)
+        elif api_provider == "huggingface":
+            from huggingface_hub import AsyncInferenceClient
+            api_key = os.getenv("HUGGINGFACE_API_KEY")
+            if not api_key: raise ValueError("HUGGINGFACE_API_KEY not found in .env file.")
+            client = AsyncInferenceClient(model=model_name, token=api_key)
+        elif api_provider == "gemini":
+            # GenerativeModel serves both sync and async calls (generate_content_async)
+            import google.generativeai as genai
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key: raise ValueError("GOOGLE_API_KEY not found in .env file.")
+            genai.configure(api_key=api_key)
+            client = genai.GenerativeModel(model_name)
+    except ImportError:
+        print(f"ERROR: The required library for '{api_provider}' is not installed.")
+        return None, None, None
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return None, None, None
+    print(f"✅ Async LLM Client configured: Using '{api_provider}' with model '{model_name}'")
+    return client, model_name, api_provider
+
+async def get_completion_async(prompt, client, model_name, api_provider, temperature=0.7, raise_errors=False):
+    """Gets a text completion from the specified LLM without blocking the event loop (errors as in get_completion)."""
+    if not client: return "API client not initialized."
+    try:
+        if api_provider == "openai":
+            response = await client.chat.completions.create(model=model_name, messages=[{"role": "user", "content": prompt}], temperature=temperature)
+            return response.choices[0].message.content
+        elif api_provider == "anthropic":
+            response = await client.messages.create(
+                model=model_name,
+                max_tokens=4096,
+                temperature=temperature,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            return response.content[0].text
+        elif api_provider == "huggingface":
+            response = await client.chat_completion(messages=[{"role": "user", "content": prompt}], temperature=max(0.1, temperature), max_tokens=4096)
+            return response.choices[0].message.content
+        elif api_provider == "gemini":
+            response = await client.generate_content_async(prompt)
+            return response.text
+    except Exception as e:
+        if raise_errors: raise
         return f"An API error occurred: {e}"
 
+async def stream_completion_async(prompt, client, model_name, api_provider, temperature=0.7):
+    """
+    Async generator of the text of a completion, piece by piece as the LLM
+    produces it (use with a client from setup_async_llm_client). Unlike
+    get_completion_async, API errors are raised, since part of the answer
+    may already have been passed on.
+    """
+    if not client: raise ValueError("API client not initialized.")
+    if api_provider == "openai":
+        stream = await client.chat.completions.create(model=model_name, messages=[{"role": "user", "content": prompt}], temperature=temperature, stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    elif api_provider == "anthropic":
+        async with client.messages.stream(
+            model=model_name,
+            max_tokens=4096,
+            temperature=temperature,
+            messages=[{"role": "user", "content": prompt}]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+    elif api_provider == "huggingface":
+        stream = await client.chat_completion(messages=[{"role": "user", "content": prompt}], temperature=max(0.1, temperature), max_tokens=4096, stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    elif api_provider == "gemini":
+        response = await client.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            # Chunks without parts (e.g. only safety ratings) have no text
+            if chunk.parts:
+                yield chunk.text
+
 def get_vision_completion(prompt, image_url, client, model_name, api_provider):
     """Gets a vision-enhanced completion from the specified LLM."""
     if not client: return "API client not initialized."